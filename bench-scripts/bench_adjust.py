@@ -0,0 +1,43 @@
+import time
+from scbr.scene import Scene, Lan, Host, Router, NodePort, NodeRole, HostInLan, PortToPort
+
+LAN_COUNT = 4
+
+
+def build_scene(host_count):
+    scene = Scene()
+    for i in range(LAN_COUNT):
+        scene.add_entity(Lan('lan-{}'.format(i)))
+
+    core = Router('core')
+    for i in range(host_count):
+        core.ports.append(NodePort(PortToPort('peer-{}'.format(i % 100)), name='p{}'.format(i)))
+    scene.add_entity(core)
+
+    for i in range(100):
+        peer = Router('peer-{}'.format(i))
+        to_port = PortToPort('core')
+        to_port.peer_port_name = 'p{}'.format(host_count - 1 - i)
+        peer.ports.append(NodePort(to_port))
+        scene.add_entity(peer)
+
+    for i in range(host_count):
+        host = Host('pc-{}'.format(i), NodeRole.TERMINAL)
+        host.ports.append(NodePort(HostInLan('lan-{}'.format(i % LAN_COUNT), None)))
+        scene.add_entity(host)
+    return scene
+
+
+def timeit(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+for count in (10000, 25000, 50000, 100000):
+    scene = build_scene(count)
+    first = timeit(scene.adjust)
+    second = timeit(scene.adjust)
+    assert sum(len(lan.hosts) for lan in scene.lans.values()) == count
+    print("{:>7} hosts: adjust {:7.3f}s  ({:5.2f}us/host)  repeated adjust {:7.3f}s".format(
+        count, first, first / count * 1e6, second))
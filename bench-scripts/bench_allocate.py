@@ -0,0 +1,41 @@
+import ipaddress
+import time
+from scbr.scene import Scene, Lan, Host, Router, NodePort, HostInLan, NodeRole
+from scbr.allocate import AddressAllocator
+from scbr.validate import validate_scene
+
+
+def add_hosts(scene, lan, first, count):
+    for i in range(first, first + count):
+        host = Host('pc-{}'.format(i), NodeRole.TERMINAL)
+        # every 10th host has an explicit address, from the top of the lan
+        ip = str(lan.net.broadcast_address - 1 - i) if i % 10 == 0 else None
+        host.ports.append(NodePort(HostInLan(lan.id, ip)))
+        scene.add_entity(host)
+
+
+for host_count in (1000, 10000, 30000):
+    scene = Scene()
+    lan = Lan('internal')
+    lan.net = ipaddress.ip_network('10.1.0.0/16')
+    scene.add_entity(lan)
+    router = Router('gw')
+    router.ports.append(NodePort(HostInLan(lan.id, None)))
+    scene.add_entity(router)
+    add_hosts(scene, lan, 0, host_count // 2)
+    scene.adjust()
+
+    allocator = AddressAllocator()
+    start = time.perf_counter()
+    first = allocator.allocate(scene)
+    first_elapsed = time.perf_counter() - start
+
+    add_hosts(scene, lan, host_count // 2, host_count - host_count // 2)
+    scene.adjust()
+    start = time.perf_counter()
+    second = allocator.allocate(scene)
+    second_elapsed = time.perf_counter() - start
+
+    print("/16 {:>6} hosts: {:>6} assigned in {:.3f}s, {:>6} more incrementally in {:.3f}s, gateway {}, "
+          "{} problems".format(host_count, first, first_elapsed, second, second_elapsed,
+                               router.ports[0].in_lan.ip, len(validate_scene(scene))))
@@ -0,0 +1,71 @@
+import gc
+import ipaddress
+import tempfile
+import time
+import tracemalloc
+from scbr.scene import Scene, Lan, Host, Router, NodePort, NodeRole, HostInLan
+from scbr.topo import CadtsTopologyExporter, Option, pretty_xml
+
+
+def build_topology(host_count, lan_size=250):
+    scene = Scene()
+    router = Router('router')
+    router.name = '路由器 <core> & "edge"'
+    for lan_index in range((host_count + lan_size - 1) // lan_size):
+        lan = Lan('lan-{}'.format(lan_index))
+        lan.net = ipaddress.ip_network('10.{}.{}.0/24'.format(lan_index // 256, lan_index % 256))
+        scene.add_entity(lan)
+        router.ports.append(NodePort(HostInLan(lan.id, str(lan.net.network_address + 254))))
+        router.route_table.add_entry(lan.net, lan.net.network_address + 254)
+    scene.add_entity(router)
+
+    for i in range(host_count):
+        lan = scene.lans['lan-{}'.format(i // lan_size)]
+        host = Host('pc-{}'.format(i), NodeRole.TERMINAL)
+        host.ports.append(NodePort(HostInLan(lan.id, str(lan.net.network_address + i % lan_size + 1))))
+        host.options['dns_list'] = [{'name': Option('www.demo.net'), 'ip': Option('10.0.0.1')}]
+        scene.add_entity(host)
+
+    scene.adjust()
+    return scene.extract_topology()
+
+
+def legacy_export(topology, fp):
+    exporter = CadtsTopologyExporter()
+    fp.write(pretty_xml(exporter.build_tree(topology)).encode('UTF-8'))
+
+
+def streaming_export(topology, fp):
+    CadtsTopologyExporter().export(topology, fp)
+
+
+def measure(export, topology):
+    with tempfile.TemporaryFile() as f:
+        gc.collect()
+        start = time.perf_counter()
+        export(topology, f)
+        elapsed = time.perf_counter() - start
+
+        f.seek(0)
+        f.truncate()
+        gc.collect()
+        tracemalloc.start()
+        export(topology, f)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        f.seek(0)
+        return elapsed, peak, f.read()
+
+
+for count in (1000, 5000, 20000):
+    topology = build_topology(count)
+    legacy_time, legacy_peak, legacy = measure(legacy_export, topology)
+    streaming_time, streaming_peak, streaming = measure(streaming_export, topology)
+    assert legacy == streaming, "streaming export differs from pretty_xml output"
+
+    size = len(streaming) / 1024 / 1024
+    print("{:>6} hosts {:6.1f}MB xml: minidom {:7.3f}s ({:5.1f}MB/s) peak {:7.1f}MB | "
+          "streaming {:7.3f}s ({:5.1f}MB/s) peak {:7.1f}MB".format(
+              count, size, legacy_time, size / legacy_time, legacy_peak / 1024 / 1024,
+              streaming_time, size / streaming_time, streaming_peak / 1024 / 1024))
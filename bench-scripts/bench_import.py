@@ -0,0 +1,48 @@
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from scbr.generate import generate_scene
+from scbr.lang.parser import parse_entities, PARSER_LALR
+from scbr.scene import Scene
+from scbr.topo import CadtsTopologyExporter, CadtsTopologyImporter
+
+
+def export_scene(path, lans, hosts_per_lan):
+    scene = Scene()
+    scene.add_entities(parse_entities(generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=10), PARSER_LALR))
+    scene.adjust()
+    with open(path, 'wb') as f:
+        CadtsTopologyExporter().export(scene.extract_topology(), f)
+
+
+with tempfile.TemporaryDirectory() as directory:
+    for lans, hosts_per_lan in ((10, 100), (50, 200), (200, 250)):
+        path = os.path.join(directory, 'topo.xml')
+        export_scene(path, lans, hosts_per_lan)
+        size = os.path.getsize(path) / 1024 / 1024
+
+        gc.collect()
+        start = time.perf_counter()
+        topology = CadtsTopologyImporter().load(path)
+        elapsed = time.perf_counter() - start
+
+        again = os.path.join(directory, 'again.xml')
+        with open(again, 'wb') as f:
+            CadtsTopologyExporter().export(topology, f)
+        with open(path, 'rb') as a, open(again, 'rb') as b:
+            assert a.read() == b.read(), "round trip differs"
+
+        del topology
+        gc.collect()
+        tracemalloc.start()
+        topology = CadtsTopologyImporter().load(path)
+        _, peak = tracemalloc.get_traced_memory()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print("{:>6} nodes {:6.1f}MB xml: import {:6.2f}s ({:4.1f}MB/s), peak {:6.1f}MB, topology {:6.1f}MB, "
+              "round trip identical".format(len(topology.nodes), size, elapsed, size / elapsed,
+                                            peak / 1024 / 1024, current / 1024 / 1024))
+        del topology
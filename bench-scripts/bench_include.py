@@ -0,0 +1,45 @@
+import os
+import tempfile
+import time
+from scbr import tools
+from scbr.lang.parser import PARSER_LALR_INLINE
+
+SCENARIOS = 40
+TEMPLATES = 2000
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    source = os.path.join(tmp, 'src')
+    write(os.path.join(source, 'lib', 'catalog.st'), ''.join(
+        'template "/tpl-{}" {{ os linux emulation kvm image "/images/{}.png" }}\n'.format(i, i)
+        for i in range(TEMPLATES)))
+    write(os.path.join(source, 'lib', 'windows.st'), 'include "catalog.st"\n'
+          'template "/win" { os windows emulation kvm image "/images/win.png" }\n')
+    write(os.path.join(source, 'lib', 'network.inc'), 'include "catalog.st"\nlan internal { ipv4 10.0.0.0/16 }\n'
+          'router gw { port in internal[10.0.0.1] }\n')
+    for i in range(SCENARIOS):
+        write(os.path.join(source, 'teams', 'team{}.scene'.format(i)),
+              'include "../lib/windows.st"\ninclude "../lib/network.inc"\n'
+              'terminal pc[1..50] in internal[10.0.{}.10] use "/tpl-{}"\n'.format(i, i))
+    scenarios = tools.find_scenarios(source, os.path.join(tmp, 'out'))
+
+    start = time.perf_counter()
+    for scenario in scenarios:
+        # fresh resolver: every scenario parses its includes again
+        tools._resolvers.clear()
+        assert tools.compile_scenario(scenario, PARSER_LALR_INLINE) is None
+    per_scenario = time.perf_counter() - start
+
+    tools._resolvers.clear()
+    start = time.perf_counter()
+    errors = tools.compile_all(scenarios, PARSER_LALR_INLINE, workers=1)
+    assert not errors, errors
+    shared = time.perf_counter() - start
+    print("{} scenarios including a {} template catalog: parsed per scenario {:.2f}s, once per build {:.2f}s".format(
+        SCENARIOS, TEMPLATES, per_scenario, shared))
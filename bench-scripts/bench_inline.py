@@ -0,0 +1,53 @@
+import gc
+import time
+import tracemalloc
+from scbr.lang.parser import parse_entities, get_parser, PARSER_LALR, PARSER_LALR_INLINE
+from scbr.scene import Scene
+from scbr.topo import CadtsTopologyExporter
+
+
+def synthetic_scene(host_count):
+    lines = ['lan internal {', '    ipv4 10.0.0.0/16', '}', '']
+    for i in range(host_count):
+        lines.append('terminal pc-{0} as "PC {0}" in internal[10.0.{1}.{2}] use "/vsphere/demo/terminal" {{'.format(
+            i, i // 250, i % 250 + 1))
+        lines.append('    option dns_list [{name: "www.demo.net", ip: 10.0.0.1}]')
+        lines.append('    flag PC{0}(10) "C:\\\\flag.txt"'.format(i))
+        lines.append('}')
+    return '\n'.join(lines)
+
+
+def measure(content, parser):
+    gc.collect()
+    start = time.perf_counter()
+    entities = parse_entities(content, parser)
+    elapsed = time.perf_counter() - start
+    del entities
+
+    gc.collect()
+    tracemalloc.start()
+    entities = parse_entities(content, parser)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, entities
+
+
+def export(entities):
+    scene = Scene()
+    scene.add_entities(entities)
+    scene.adjust()
+    return CadtsTopologyExporter().export(scene.extract_topology())
+
+
+for parser in (PARSER_LALR, PARSER_LALR_INLINE):
+    get_parser(parser)
+
+for count in (1000, 5000, 20000):
+    content = synthetic_scene(count)
+    results = {}
+    for parser in (PARSER_LALR, PARSER_LALR_INLINE):
+        results[parser] = measure(content, parser)
+
+    assert export(results[PARSER_LALR][2]) == export(results[PARSER_LALR_INLINE][2])
+    for parser, (elapsed, peak, _) in results.items():
+        print("{:>6} hosts {:<12} {:8.3f}s  peak {:8.1f}MB".format(count, parser, elapsed, peak / 1024 / 1024))
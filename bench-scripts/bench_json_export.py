@@ -0,0 +1,47 @@
+import json
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from scbr.generate import generate_scene
+from scbr.lang.parser import parse_entities, PARSER_LALR
+from scbr.scene import Scene
+from scbr.topo import CadtsTopologyExporter, JsonTopologyExporter
+
+
+def build_topology(lans, hosts_per_lan):
+    scene = Scene()
+    scene.add_entities(parse_entities(generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=10), PARSER_LALR))
+    scene.adjust()
+    return scene.extract_topology()
+
+
+def parse_xml(f):
+    return len(ET.parse(f).getroot())
+
+
+def parse_jsonl(f):
+    return sum(1 for line in f if 'id' in json.loads(line))
+
+
+def measure(exporter, parse, topology):
+    with tempfile.TemporaryFile() as f:
+        start = time.perf_counter()
+        exporter.export(topology, f)
+        export_time = time.perf_counter() - start
+        size = f.tell()
+
+        f.seek(0)
+        start = time.perf_counter()
+        node_count = parse(f)
+        parse_time = time.perf_counter() - start
+        assert node_count == len(topology.nodes)
+    return size / 1024 / 1024, export_time, parse_time
+
+
+for lans, hosts_per_lan in ((10, 100), (50, 200), (100, 200)):
+    topology = build_topology(lans, hosts_per_lan)
+    for name, exporter, parse in (('xml', CadtsTopologyExporter(), parse_xml),
+                                  ('jsonl', JsonTopologyExporter(), parse_jsonl)):
+        size, export_time, parse_time = measure(exporter, parse, topology)
+        print("{:>6} nodes {:<5} {:6.1f}MB: export {:6.3f}s ({:5.1f}MB/s), consumer parse {:6.3f}s".format(
+            len(topology.nodes), name, size, export_time, size / export_time, parse_time))
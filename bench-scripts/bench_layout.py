@@ -0,0 +1,38 @@
+import time
+import numpy as np
+from scbr.generate import generate_scene
+from scbr.layout import layout_topology, UNIT
+from scbr.lang.parser import parse_entities, PARSER_LALR_INLINE
+from scbr.scene import Scene
+from scbr.topo import NodeCategory
+
+
+def build_topology(lans, hosts_per_lan, routers, shape):
+    scene = Scene()
+    scene.add_entities(parse_entities(generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=routers,
+                                                     shape=shape), PARSER_LALR_INLINE))
+    scene.adjust()
+    return scene.extract_topology()
+
+
+for lans, hosts_per_lan, routers, shape in ((10, 20, 4, 'chain'), (50, 20, 10, 'mesh'), (50, 100, 10, 'star'),
+                                            (10, 500, 4, 'mesh')):
+    topology = build_topology(lans, hosts_per_lan, routers, shape)
+    start = time.perf_counter()
+    positions = layout_topology(topology)
+    elapsed = time.perf_counter() - start
+
+    ids = list(topology.nodes)
+    pos = np.array([positions[node_id] for node_id in ids], dtype=float) / UNIT
+    # nodes closer than half the host spacing to another one
+    crowded = 0
+    for i in range(0, len(pos), 1000):
+        d = np.sqrt(((pos[i:i + 1000, None, :] - pos[None, :, :]) ** 2).sum(-1))
+        np.fill_diagonal(d[:, i:i + 1000], np.inf)
+        crowded += int((d.min(1) < 0.5).sum())
+    lengths = [np.hypot(*(pos[ids.index(node.id)] - pos[ids.index(port.link.adjacent_port(port).node.id)]))
+               for node in topology.nodes.values() if node.category == NodeCategory.Switch.name
+               for port in node.ports[:3]]
+    print("{:>5} nodes ({} lans x {} hosts, {}): {:.2f}s, extent {:.0f}x{:.0f}, crowded {}, "
+          "host edge length mean {:.2f}".format(len(ids), lans, hosts_per_lan, shape, elapsed, *pos.max(0), crowded,
+                                                 float(np.mean(lengths))))
@@ -0,0 +1,47 @@
+import gc
+import ipaddress
+import tracemalloc
+from scbr.topo import Node, NodeCategory
+
+COUNT = 20000
+
+
+def allocated(f):
+    gc.collect()
+    tracemalloc.start()
+    result = f()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, result
+
+
+def create_nodes():
+    nodes = []
+    for i in range(COUNT):
+        node = Node('pc-{}'.format(i), 'pc-{}'.format(i), NodeCategory.Host, '/vsphere/demo/terminal')
+        node.os = 'windows' if i % 2 else 'linux'
+        node.remove_control_nic()
+        node.use_default_physic()
+        nodes.append(node)
+    return nodes
+
+
+def create_ports(nodes, switch):
+    netmask = ipaddress.ip_address('255.255.0.0')
+    ips = [ipaddress.ip_address('10.0.0.1') + i for i in range(len(nodes))]
+    gc.collect()
+
+    def link():
+        for node, ip in zip(nodes, ips):
+            port, _ = node.link_to_node(switch)
+            port.config_ip(ip, netmask)
+    return allocated(link)[0]
+
+
+node_bytes, nodes = allocated(create_nodes)
+switch = Node('lan', 'lan', NodeCategory.Switch, '/switch')
+port_bytes = create_ports(nodes, switch)
+
+print("{} nodes: {:7.1f} bytes/node".format(COUNT, node_bytes / COUNT))
+print("{} host ports + {} switch ports + links, ip configured: {:7.1f} bytes/port".format(
+    COUNT, COUNT, port_bytes / (2 * COUNT)))
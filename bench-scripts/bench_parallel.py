@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import time
+from scbr.lang.parser import parse_scene, get_parser, PARSER_EARLEY, PARSER_LALR
+from scbr.topo import CadtsTopologyExporter
+
+FILE_COUNT = 16
+HOSTS_PER_LAN = 100
+WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+
+
+def write_lan_file(path, index):
+    lines = ['lan lan-{0} {{'.format(index), '    ipv4 10.{0}.0.0/16'.format(index), '}', '']
+    for i in range(HOSTS_PER_LAN):
+        lines.append('terminal pc-{0}-{1} in lan-{0}[10.{0}.{2}.{3}] {{'.format(index, i, i // 250, i % 250 + 1))
+        lines.append('    template "/vsphere/demo/terminal"')
+        lines.append('}')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+
+
+def export(scene):
+    return CadtsTopologyExporter().export(scene.extract_topology())
+
+
+with tempfile.TemporaryDirectory() as d:
+    files = []
+    for index in range(FILE_COUNT):
+        path = os.path.join(d, 'lan-{}.scene'.format(index))
+        write_lan_file(path, index)
+        files.append(path)
+
+    print("{} files x {} hosts, {} workers".format(FILE_COUNT, HOSTS_PER_LAN, WORKERS))
+    for parser in (PARSER_EARLEY, PARSER_LALR):
+        get_parser(parser)
+
+        start = time.perf_counter()
+        serial = parse_scene(*files, parser=parser)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = parse_scene(*files, parser=parser, workers=WORKERS)
+        parallel_time = time.perf_counter() - start
+
+        assert export(serial) == export(parallel)
+        print("{:<8} serial {:8.3f}s  parallel {:8.3f}s  speedup {:5.2f}x".format(
+            parser, serial_time, parallel_time, serial_time / parallel_time))
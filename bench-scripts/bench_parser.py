@@ -0,0 +1,47 @@
+import os
+import tempfile
+import time
+from scbr.lang.parser import parse_scene, PARSER_EARLEY, PARSER_LALR
+from scbr.topo import CadtsTopologyExporter
+
+
+def data_file(name):
+    return os.path.join(os.path.dirname(__file__), '..', 'data', 'scene-lang', name)
+
+
+def export(scene):
+    return CadtsTopologyExporter().export(scene.extract_topology())
+
+
+def synthetic_scene(host_count):
+    lines = ['lan internal {', '    ipv4 10.0.0.0/16', '}', '']
+    for i in range(host_count):
+        lines.append('terminal pc-{0} in internal[10.0.{1}.{2}] {{'.format(i, i // 250, i % 250 + 1))
+        lines.append('    template "/vsphere/demo/terminal"')
+        lines.append('    option dns_list [{name: "www.demo.net", ip: 10.0.0.1}]')
+        lines.append('}')
+    return '\n'.join(lines)
+
+
+def timeit(*scene_files, parser):
+    start = time.perf_counter()
+    scene = parse_scene(*scene_files, parser=parser)
+    return time.perf_counter() - start, scene
+
+
+demo_files = (data_file('demo00.env'), data_file('demo00.st'), data_file('demo00.scene'))
+results = [export(parse_scene(*demo_files, parser=p)) for p in (PARSER_EARLEY, PARSER_LALR)]
+assert results[0] == results[1], "earley and lalr produce different scene"
+print("demo00: earley and lalr produce the same scene")
+
+with tempfile.TemporaryDirectory() as d:
+    for count in (100, 500, 2000):
+        path = os.path.join(d, 'hosts-{}.scene'.format(count))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(synthetic_scene(count))
+
+        earley_time, earley_scene = timeit(path, parser=PARSER_EARLEY)
+        lalr_time, lalr_scene = timeit(path, parser=PARSER_LALR)
+        assert export(earley_scene) == export(lalr_scene)
+        print("{:>6} hosts: earley {:8.3f}s  lalr {:8.3f}s  speedup {:6.1f}x".format(
+            count, earley_time, lalr_time, earley_time / lalr_time))
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from scbr.generate import generate_scene
+from scbr.lang.parser import parse_entities, PARSER_LALR
+from scbr.partition import partition_topology, export_shards, link_cost, CUT_LAN, CUT_ROUTER_LAN, CUT_PEER
+from scbr.scene import Scene
+from scbr.topo import CadtsTopologyExporter
+
+CUT_KINDS = {CUT_LAN: 'lan', CUT_ROUTER_LAN: 'router-lan', CUT_PEER: 'router-router'}
+
+
+def build_topology(lans, hosts_per_lan, routers, shape):
+    scene = Scene()
+    scene.add_entities(parse_entities(generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=routers,
+                                                     shape=shape), PARSER_LALR))
+    scene.adjust()
+    return scene.extract_topology()
+
+
+workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+for lans, hosts_per_lan, routers, shape, shards in ((20, 50, 4, 'chain', 4), (40, 100, 20, 'mesh', 8),
+                                                    (100, 100, 10, 'star', 16), (4, 500, 2, 'chain', 8)):
+    topology = build_topology(lans, hosts_per_lan, routers, shape)
+    start = time.perf_counter()
+    partition = partition_topology(topology, shards)
+    partition_time = time.perf_counter() - start
+
+    mean = sum(partition.weights) / len(partition.weights)
+    kinds = dict()
+    for link in partition.cut_links:
+        kind = CUT_KINDS[link_cost(link)]
+        kinds[kind] = kinds.get(kind, 0) + 1
+    print("{} nodes, {} lans x {} hosts, {} routers ({}), {} shards: partition {:.3f}s, "
+          "max/mean weight {:.3f}, cut {}".format(
+              len(topology.nodes), lans, hosts_per_lan, routers, shape, shards, partition_time,
+              max(partition.weights) / mean, ', '.join('{} {}'.format(v, k) for k, v in sorted(kinds.items()))))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        with open(os.path.join(tmp, 'whole.xml'), 'wb') as f:
+            CadtsTopologyExporter().export(topology, f)
+        whole_time = time.perf_counter() - start
+
+        for n in sorted({1, workers}):
+            start = time.perf_counter()
+            paths = export_shards(topology, partition, os.path.join(tmp, 'scene.xml'), workers=n)
+            print("    export whole {:.3f}s, {} shards with {} workers {:.3f}s".format(
+                whole_time, len(paths), n, time.perf_counter() - start))
+
+        nodes = set()
+        stitches = 0
+        for path in paths:
+            root = ET.parse(path).getroot()
+            nodes.update(node.get('id') for node in root.iter('node'))
+            stitches += len(root.findall('stitch'))
+        assert nodes == set(topology.nodes)
+        assert stitches == 2 * len(partition.cut_links)
@@ -0,0 +1,36 @@
+import asyncio
+import time
+from scbr.generate import generate_scene
+from scbr.lang.parser import parse_entities, PARSER_LALR
+from scbr.provision import plan_waves, run_plan, FakeProvisioner
+from scbr.scene import Scene
+
+LATENCY = 0.02
+
+
+def build_topology(lans, hosts_per_lan, routers):
+    scene = Scene()
+    scene.add_entities(parse_entities(generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=routers,
+                                                     shape='mesh'), PARSER_LALR))
+    scene.adjust()
+    return scene.extract_topology()
+
+
+for lans, hosts_per_lan, routers in ((10, 20, 4), (20, 50, 10), (40, 100, 20)):
+    topology = build_topology(lans, hosts_per_lan, routers)
+    waves = plan_waves(topology)
+    steps = sum(len(wave.steps) for wave in waves)
+    for concurrency in (1, 64, 256):
+        if concurrency == 1 and steps > 500:
+            print("{:>5} steps, {} waves, concurrency    1: ~{:.1f}s (estimated)".format(
+                steps, len(waves), steps * LATENCY))
+            continue
+
+        provisioner = FakeProvisioner(latency=LATENCY, fail_times={waves[-1].steps[0].id: 1})
+        start = time.perf_counter()
+        asyncio.run(run_plan(waves, provisioner, concurrency=concurrency, retry_delay=LATENCY))
+        elapsed = time.perf_counter() - start
+        assert len(provisioner.created) == steps
+        print("{:>5} steps, {} waves ({}), concurrency {:>4}: {:6.2f}s, max running {}".format(
+            steps, len(waves), '/'.join(str(len(wave.steps)) for wave in waves), concurrency, elapsed,
+            provisioner.max_running))
@@ -0,0 +1,41 @@
+import time
+from scbr.lang.parser import parse_entities, PARSER_LALR_INLINE
+from scbr.scene import Scene
+
+HEADER = '''template "/tpl" { os linux emulation kvm image "/images/pc.png" }
+lan internal { ipv4 10.0.0.0/16 }
+'''
+BODY = '{ option dns_list ["10.0.0.2", "10.0.0.3"] flag user(10) "flag{x}" }\n'
+
+
+def explicit(count):
+    return HEADER + ''.join('terminal pc{} in internal[{}] use "/tpl" {}'.format(
+        i, '10.0.{}.{}'.format((i + 9) // 256, (i + 9) % 256), BODY) for i in range(1, count + 1))
+
+
+def replicated(count):
+    return HEADER + 'terminal pc[1..{}] in internal[10.0.0.10] use "/tpl" {}'.format(count, BODY)
+
+
+def measure(content):
+    start = time.perf_counter()
+    entities = parse_entities(content, PARSER_LALR_INLINE)
+    parsed = time.perf_counter()
+    scene = Scene()
+    scene.add_entities(entities)
+    scene.adjust()
+    topology = scene.extract_topology()
+    return parsed - start, time.perf_counter() - parsed, topology
+
+
+parse_entities(HEADER, PARSER_LALR_INLINE)
+for count in (1, 500, 5000, 50000):
+    results = []
+    for make in (explicit, replicated):
+        parse_time, build_time, topology = measure(make(count))
+        results.append((parse_time, build_time, topology))
+    assert sorted(results[0][2].nodes) == sorted(results[1][2].nodes)
+    assert results[0][2].nodes['pc{}'.format(count)].ports[0].options['ip'].value == \
+        results[1][2].nodes['pc{}'.format(count)].ports[0].options['ip'].value
+    print("{:>6} hosts: parse explicit {:8.4f}s, replicated {:8.4f}s; scene+topology {:.3f}s / {:.3f}s".format(
+        count, results[0][0], results[1][0], results[0][1], results[1][1]))
@@ -0,0 +1,50 @@
+import ipaddress
+import time
+from scbr.scene import Scene, Lan, Router, NodePort, HostInLan, PortToPort, IpWithMask
+from scbr.routing import compute_routes
+
+LANS_PER_ROUTER = 10
+
+
+def build_scene(router_count, shape):
+    scene = Scene()
+    routers = [Router('r-{}'.format(i)) for i in range(router_count)]
+    for i, router in enumerate(routers):
+        for j in range(LANS_PER_ROUTER):
+            index = i * LANS_PER_ROUTER + j
+            lan = Lan('lan-{}'.format(index))
+            lan.net = ipaddress.ip_network('10.{}.{}.0/24'.format(index // 256, index % 256))
+            scene.add_entity(lan)
+            router.ports.append(NodePort(HostInLan(lan.id, str(lan.net.network_address + 1))))
+        scene.add_entity(router)
+
+    if shape == 'chain':
+        pairs = [(i, i + 1) for i in range(router_count - 1)]
+    elif shape == 'star':
+        pairs = [(0, i) for i in range(1, router_count)]
+    else:
+        # sparse mesh: ring plus chords
+        pairs = [(i, (i + 1) % router_count) for i in range(router_count)]
+        pairs.extend((i, (i + router_count // 3) % router_count) for i in range(0, router_count, 7))
+
+    for k, (a, b) in enumerate(pairs):
+        base = ipaddress.ip_address('172.16.0.0') + k * 4
+        to_port = PortToPort(routers[b].id)
+        to_port.self_ip = IpWithMask('{}/30'.format(base + 1))
+        to_port.peer_ip = IpWithMask('{}/30'.format(base + 2))
+        routers[a].ports.append(NodePort(to_port))
+
+    scene.adjust()
+    return scene
+
+
+for shape in ('chain', 'star', 'mesh'):
+    for router_count in (50, 200, 500):
+        scene = build_scene(router_count, shape)
+        start = time.perf_counter()
+        routes = compute_routes(scene)
+        elapsed = time.perf_counter() - start
+        plain = compute_routes(scene, aggregate=False)
+        print("{:<5} {:>4} routers {:>5} lans: {:7.3f}s, {:>7} entries aggregated from {:>7}".format(
+            shape, router_count, router_count * LANS_PER_ROUTER, elapsed,
+            sum(len(e) for e in routes.values()), sum(len(e) for e in plain.values())))
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from scbr.generate import generate_scene
+from scbr.service import CompileService
+
+TEMPLATES = 'template "/bench/tpl-{}" {{ os linux emulation kvm image "/images/{}.png" }}\n'
+
+
+async def post(port, payload, connection=None):
+    reader, writer = connection if connection else await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8')
+    writer.write('POST /compile HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 'Content-Length: {}\r\n\r\n'.format(len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    content = await reader.readexactly(length)
+    return status, content, (reader, writer)
+
+
+async def get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('GET {} HTTP/1.1\r\nConnection: close\r\n\r\n'.format(path).encode('latin-1'))
+    response = await reader.read()
+    writer.close()
+    return response.split(b'\r\n\r\n', 1)[1]
+
+
+async def main():
+    scene = generate_scene(lans=4, hosts_per_lan=10, routers=2, templates=0)
+    catalog = ''.join(TEMPLATES.format(i, i) for i in range(400))
+    payload = {'sources': [{'name': 'lib/catalog.st', 'content': catalog},
+                           {'name': 'team.scene', 'content': 'include "lib/catalog.st"\n' + scene}]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'src'))
+        with open(os.path.join(tmp, 'src', 'catalog.st'), 'w') as f:
+            f.write(catalog)
+        with open(os.path.join(tmp, 'src', 'team.scene'), 'w') as f:
+            f.write(scene)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'scbr.tools', 'compile', os.path.join(tmp, 'src'), '-o',
+                        os.path.join(tmp, 'out'), '-j', '1'], check=True, stdout=subprocess.DEVNULL)
+        print("cold process compile: {:.3f}s".format(time.perf_counter() - start))
+
+    service = CompileService(workers=os.cpu_count(), max_pending=32, timeout=5)
+    start = time.perf_counter()
+    server = await service.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    print("service start with warm workers: {:.3f}s".format(time.perf_counter() - start))
+
+    status, content, connection = await post(port, payload)
+    assert status == 200 and content.startswith(b'<?xml'), content[:500]
+    latencies = []
+    for _ in range(50):
+        start = time.perf_counter()
+        status, content, connection = await post(port, payload, connection)
+        latencies.append(time.perf_counter() - start)
+        assert status == 200
+    connection[1].close()
+    latencies.sort()
+    print("sequential keep-alive requests: p50 {:.1f}ms, p90 {:.1f}ms, max {:.1f}ms".format(
+        latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.9)] * 1000, latencies[-1] * 1000))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(post(port, payload) for _ in range(100)))
+    elapsed = time.perf_counter() - start
+    statuses = dict()
+    for status, _, (_, writer) in results:
+        statuses[status] = statuses.get(status, 0) + 1
+        writer.close()
+    print("burst of 100 requests with max_pending 32: {:.2f}s, statuses {}".format(elapsed, statuses))
+
+    status, content, (_, writer) = await post(port, {'sources': [{'name': 'bad.scene', 'content': 'lan {'}]})
+    writer.close()
+    assert status == 422, status
+    print("metrics:", json.dumps(json.loads(await get(port, '/metrics')), indent=1))
+    server.close()
+    service.close()
+
+    # timed out compiles keep their workers, more slow compiles than workers must be rejected, not queued
+    workers = os.cpu_count()
+    slow = {'sources': [{'name': 'big.scene', 'content': generate_scene(lans=100, hosts_per_lan=100, routers=10)}]}
+    service = CompileService(workers=workers, max_pending=workers, timeout=0.1)
+    server = await service.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    timed_out = await asyncio.gather(*(post(port, slow) for _ in range(workers)))
+    rejected = await asyncio.gather(*(post(port, slow) for _ in range(2 * workers)))
+    statuses = dict()
+    for status, _, (_, writer) in timed_out + rejected:
+        statuses[status] = statuses.get(status, 0) + 1
+        writer.close()
+    assert [status for status, _, _ in timed_out] == [504] * workers, statuses
+    assert [status for status, _, _ in rejected] == [503] * (2 * workers), statuses
+    start = time.perf_counter()
+    while json.loads(await get(port, '/metrics'))['pending']:
+        await asyncio.sleep(0.05)
+    status, _, (_, writer) = await post(port, payload)
+    writer.close()
+    assert status == 200, status
+    print("{} slow compiles on {} workers with max_pending {}: statuses {}, workers free again after {:.2f}s".format(
+        3 * workers, workers, workers, statuses, time.perf_counter() - start))
+    # let connection handlers see their clients close
+    await asyncio.sleep(0.1)
+    server.close()
+    service.close()
+
+
+asyncio.run(main())
@@ -0,0 +1,130 @@
+"""time and memory profile every compile stage on generated scenes
+
+    python bench-scripts/bench_stages.py -o stages.json
+    python bench-scripts/bench_stages.py -o new.json --compare stages.json
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import lark
+
+import scbr
+from scbr.generate import generate_scene, SHAPES, SHAPE_CHAIN
+from scbr.lang.parser import get_parser, SceneEntityTransformer, PARSER_EARLEY, PARSER_LALR
+from scbr.scene import Scene
+from scbr.topo import CadtsTopologyExporter
+
+STAGES = ('parse', 'transform', 'adjust', 'extract_topology', 'export')
+
+
+def run_stages(content, parser):
+    """yield (stage name, result) while running the pipeline, each step is one stage"""
+    tree = get_parser(parser).parse(content)
+    yield 'parse', tree
+
+    scene = Scene()
+    scene.add_entities(SceneEntityTransformer().transform(tree))
+    yield 'transform', scene
+
+    scene.adjust()
+    yield 'adjust', scene
+
+    topology = scene.extract_topology()
+    yield 'extract_topology', topology
+
+    with tempfile.TemporaryFile() as f:
+        CadtsTopologyExporter().export(topology, f)
+        yield 'export', f.tell()
+
+
+def measure(content, parser):
+    stages = {name: dict() for name in STAGES}
+
+    gc.collect()
+    start = time.perf_counter()
+    for name, _ in run_stages(content, parser):
+        now = time.perf_counter()
+        stages[name]['seconds'] = now - start
+        start = now
+
+    # second pass for memory, tracemalloc slows the stages down
+    gc.collect()
+    tracemalloc.start()
+    for name, _ in run_stages(content, parser):
+        _, peak = tracemalloc.get_traced_memory()
+        stages[name]['peak_bytes'] = peak
+        # memory kept by earlier stages is not counted for the next one
+        tracemalloc.stop()
+        tracemalloc.start()
+    tracemalloc.stop()
+    return stages
+
+
+def compare(runs, base_file):
+    with open(base_file, 'r', encoding='utf-8') as f:
+        base_runs = {json.dumps(run['scene'], sort_keys=True): run for run in json.load(f)['runs']}
+
+    for run in runs:
+        base = base_runs.get(json.dumps(run['scene'], sort_keys=True), None)
+        if base is None:
+            continue
+        print("{lans} lans x {hosts_per_lan} hosts, {routers} routers:".format(**run['scene']), end='')
+        for name in STAGES:
+            print(" {} x{:.2f}".format(name, run['stages'][name]['seconds'] / base['stages'][name]['seconds']), end='')
+        print()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('-o', '--output', help='write results as json')
+    arg_parser.add_argument('--compare', help='json results of an earlier run, print time ratios')
+    arg_parser.add_argument('--parser', default=PARSER_LALR, choices=(PARSER_EARLEY, PARSER_LALR))
+    arg_parser.add_argument('--shape', default=SHAPE_CHAIN, choices=SHAPES)
+    arg_parser.add_argument('--sizes', default='10x20,50x100,100x200',
+                            help='comma separated LANSxHOSTS scene sizes')
+    arg_parser.add_argument('--routers', type=int, default=10)
+    args = arg_parser.parse_args()
+
+    # build or load the parser outside of the parse stage
+    get_parser(args.parser)
+
+    runs = []
+    for size in args.sizes.split(','):
+        lans, hosts_per_lan = (int(n) for n in size.split('x'))
+        content = generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=args.routers, shape=args.shape)
+        scene_params = {'lans': lans, 'hosts_per_lan': hosts_per_lan, 'routers': args.routers, 'shape': args.shape,
+                        'parser': args.parser}
+        stages = measure(content, args.parser)
+        runs.append({'scene': scene_params, 'bytes': len(content.encode('utf-8')), 'stages': stages})
+
+        print("{:>4} lans x {:>4} hosts {:7.2f}MB:".format(lans, hosts_per_lan, runs[-1]['bytes'] / 1024 / 1024))
+        for name in STAGES:
+            print("    {:<16} {:8.3f}s  peak {:8.1f}MB".format(
+                name, stages[name]['seconds'], stages[name]['peak_bytes'] / 1024 / 1024))
+
+    if args.output:
+        result = {
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'lark': lark.__version__,
+                'scbr': scbr.__version__,
+            },
+            'runs': runs,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        compare(runs, args.compare)
+
+
+if __name__ == '__main__':
+    main()
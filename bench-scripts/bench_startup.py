@@ -0,0 +1,41 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+REPEAT = 10
+
+
+def run(code, cache_dir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH', None)]))
+    env['SCBR_CACHE_DIR'] = cache_dir
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def bench(title, code, cache_dir, cold=False):
+    times = []
+    for _ in range(REPEAT):
+        if cold:
+            with tempfile.TemporaryDirectory() as d:
+                times.append(run(code, d))
+        else:
+            times.append(run(code, cache_dir))
+    print("{:<40} median {:7.1f}ms  min {:7.1f}ms".format(
+        title, statistics.median(times) * 1000, min(times) * 1000))
+
+
+with tempfile.TemporaryDirectory() as warm_dir:
+    bench('python -c "pass"', 'pass', warm_dir)
+    bench('import scbr.scene, scbr.topo', 'import scbr.scene, scbr.topo', warm_dir)
+    bench('import scbr.lang.parser', 'import scbr.lang.parser', warm_dir)
+    for parser in ('earley', 'lalr'):
+        code = 'from scbr.lang.parser import get_parser; get_parser("{}")'.format(parser)
+        bench('get_parser("{}") cold cache'.format(parser), code, warm_dir, cold=True)
+        run(code, warm_dir)
+        bench('get_parser("{}") warm cache'.format(parser), code, warm_dir)
@@ -0,0 +1,59 @@
+import ipaddress
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from scbr.generate import generate_scene
+from scbr.lang.parser import parse_entities, PARSER_LALR_INLINE
+from scbr.scene import Scene
+from scbr.teams import TeamTemplate, export_teams, team_rewrites
+from scbr.topo import CadtsTopologyExporter
+
+FLAGS = 'terminal victim in lan-0[10.0.0.250] { flag user(10) "seed" fixed_flag root(50) "flag{fixed}" }\n'
+
+
+def build_scene(lans, hosts_per_lan):
+    content = generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=4) + FLAGS
+    scene = Scene()
+    scene.add_entities(parse_entities(content, PARSER_LALR_INLINE))
+    scene.adjust()
+    return content, scene
+
+
+workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+networks = [ipaddress.ip_network('10.0.0.0/16'), ipaddress.ip_network('172.16.0.0/16')]
+for lans, hosts_per_lan, team_count in ((10, 20, 100), (20, 50, 50)):
+    content, scene = build_scene(lans, hosts_per_lan)
+    teams = list(range(1, team_count + 1))
+    rewrites = team_rewrites(networks, teams, 65536)
+
+    start = time.perf_counter()
+    for team in teams[:5]:
+        team_scene = Scene()
+        team_scene.add_entities(parse_entities(content.replace('10.0.', '10.{}.'.format(team)), PARSER_LALR_INLINE))
+        team_scene.adjust()
+        team_scene.extract_topology()
+    reparse = (time.perf_counter() - start) / 5
+
+    template = TeamTemplate(scene)
+    start = time.perf_counter()
+    for team, rewrite in zip(teams[:20], rewrites):
+        topology = template.instantiate(team, rewrite, 'secret')
+    instantiate = (time.perf_counter() - start) / 20
+    print("{} nodes: re-parse per team {:.3f}s, instantiate per team {:.4f}s".format(
+        len(topology.nodes), reparse, instantiate))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pattern = os.path.join(tmp, 'team-{team}.xml')
+        for n in sorted({1, workers}):
+            start = time.perf_counter()
+            paths = export_teams(scene, teams, rewrites, 'secret', pattern, CadtsTopologyExporter(), n)
+            print("    {} teams exported with {} workers: {:.2f}s".format(len(paths), n, time.perf_counter() - start))
+
+        root = ET.parse(pattern.format(team=7)).getroot()
+        victim = [node for node in root.iter('node') if node.get('id') == 'victim'][0]
+        ips = [config.get('value') for config in victim.iter('config') if config.get('name') == 'ip']
+        flags = [config.get('value') for config in victim.iter('config') if config.get('name') == 'content']
+        assert ips == ['10.7.0.250'], ips
+        assert flags[1] == 'flag{fixed}' and flags[0].startswith('flag{') and flags[0] != 'seed', flags
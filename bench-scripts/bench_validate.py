@@ -0,0 +1,39 @@
+import ipaddress
+import time
+from scbr.scene import Scene, Lan, Host, Router, NodePort, NodeRole, HostInLan, PortToPort, IpWithMask
+from scbr.validate import validate_scene
+
+HOSTS_PER_LAN = 200
+
+
+def build_scene(lan_count):
+    scene = Scene()
+    for i in range(lan_count):
+        lan = Lan('lan-{}'.format(i))
+        lan.net = ipaddress.ip_network('10.{}.{}.0/24'.format(i // 256, i % 256))
+        scene.add_entity(lan)
+
+        router = Router('r-{}'.format(i))
+        router.ports.append(NodePort(HostInLan(lan.id, str(lan.net.network_address + 254))))
+        if i:
+            to_port = PortToPort('r-{}'.format(i - 1))
+            to_port.self_ip = IpWithMask('172.16.{}.{}/30'.format(i * 4 // 256, i * 4 % 256 + 1))
+            to_port.peer_ip = IpWithMask('172.16.{}.{}/30'.format(i * 4 // 256, i * 4 % 256 + 2))
+            router.ports.append(NodePort(to_port))
+        scene.add_entity(router)
+
+        for j in range(HOSTS_PER_LAN):
+            host = Host('pc-{}-{}'.format(i, j), NodeRole.TERMINAL)
+            host.ports.append(NodePort(HostInLan(lan.id, str(lan.net.network_address + j + 1))))
+            scene.add_entity(host)
+    scene.adjust()
+    return scene
+
+
+for lan_count in (50, 250, 500):
+    scene = build_scene(lan_count)
+    start = time.perf_counter()
+    problems = validate_scene(scene)
+    elapsed = time.perf_counter() - start
+    print("{:>4} lans {:>7} nodes: validate {:6.3f}s, {} problems".format(
+        lan_count, len(scene.node_list), elapsed, len(problems)))
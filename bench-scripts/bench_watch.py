@@ -0,0 +1,87 @@
+import os
+import tempfile
+import time
+from scbr.generate import generate_scene
+from scbr.tools import Watcher, Scenario, compile_scenario, find_scenarios
+
+
+def timed_poll(watcher):
+    start = time.perf_counter()
+    results = watcher.poll()
+    return time.perf_counter() - start, sum(1 for result in results if result.written)
+
+
+def same_as_compile(watcher, **options):
+    """whether every output of watcher equals a clean compile of its scenario"""
+    for scenario in find_scenarios(watcher.source_dir, watcher.output_dir):
+        clean = Scenario(scenario.name, scenario.files, scenario.output + '.clean')
+        error = compile_scenario(clean, watcher.parser, **options)
+        if error:
+            raise Exception(error)
+        with open(scenario.output, 'rb') as f, open(clean.output, 'rb') as g:
+            if f.read() != g.read():
+                return False
+    return True
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def append(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+
+for lans, hosts_per_lan in ((20, 50), (50, 100), (100, 200)):
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'src')
+        os.makedirs(source)
+        # templates come first in generated scenes, move them to their own file
+        content = generate_scene(lans=lans, hosts_per_lan=hosts_per_lan, routers=10, templates=4)
+        split = content.index('lan lan-0 ')
+        templates = os.path.join(source, 'range.st')
+        with open(templates, 'w', encoding='utf-8') as f:
+            f.write(content[:split])
+        with open(os.path.join(source, 'range.scene'), 'w', encoding='utf-8') as f:
+            f.write(content[split:])
+
+        watcher = Watcher(source, os.path.join(directory, 'out'))
+        print("{:>6} hosts: initial {:.2f}s".format(lans * hosts_per_lan, timed_poll(watcher)[0]), end='')
+
+        append(templates, '// comment only\n')
+        print(", comment edit {:.3f}s ({} written)".format(*timed_poll(watcher)), end='')
+
+        append(templates, 'template "/bench/tpl-1" {\n    os linux\n}\n')
+        print(", template edit {:.3f}s ({} written)".format(*timed_poll(watcher)), end='')
+
+        append(templates, 'template "/unused" {\n    os windows\n}\n')
+        print(", unused template {:.3f}s ({} written)".format(*timed_poll(watcher)))
+
+        # patched into the kept scene: a host address, a lan name; a new host is built again
+        scene_file = os.path.join(source, 'range.scene')
+        with open(scene_file, encoding='utf-8') as f:
+            content = f.read()
+        content = content.replace('in lan-0[10.0.0.2]', 'in lan-0[10.0.0.250]', 1)
+        write(scene_file, content)
+        print("{:>13} host edit {:.3f}s ({} written)".format('', *timed_poll(watcher)), end='')
+        write(scene_file, content.replace('lan lan-0 as "LAN 0"', 'lan lan-0 as "LAN zero"', 1))
+        print(", lan edit {:.3f}s ({} written)".format(*timed_poll(watcher)), end='')
+        patched_same = same_as_compile(watcher)
+        append(scene_file, 'host added in lan-0\n')
+        print(", new host {:.3f}s ({} written)".format(*timed_poll(watcher)), end='')
+        print(", same as clean compile: {} patched, {} built again".format(patched_same, same_as_compile(watcher)))
+
+# kept entities must not remember addresses allocated by an earlier rebuild
+with tempfile.TemporaryDirectory() as directory:
+    source = os.path.join(directory, 'src')
+    os.makedirs(source)
+    write(os.path.join(source, 'net.inc'), 'lan l {\n    ipv4 10.0.0.0/24\n}\n')
+    write(os.path.join(source, 'a.scene'), 'include "net.inc"\nhost h in l {\n}\n')
+    watcher = Watcher(source, os.path.join(directory, 'out'), auto_address=True)
+    watcher.poll()
+    write(os.path.join(source, 'net.inc'), 'lan l {\n    ipv4 10.1.0.0/24\n}\n')
+    results = watcher.poll()
+    print("auto address after net edit: {} written, same as clean compile: {}".format(
+        sum(1 for result in results if result.written), same_as_compile(watcher, auto_address=True)))
@@ -0,0 +1,144 @@
+import bisect
+import ipaddress
+
+from scbr.scene import NodeRole
+from scbr.validate import ip_value
+
+
+class AddressPool:
+    """free addresses of a network as sorted, disjoint [start, end] integer ranges
+
+    network and broadcast addresses are never free, except for /31 and /32 style networks.
+    reserve() and allocate() only touch the range they hit, so the cost doesn't depend on the
+    network size.
+    """
+
+    __slots__ = ('net', '_starts', '_ends')
+
+    def __init__(self, net):
+        self.net = net
+        start = int(net.network_address)
+        end = start + net.num_addresses - 1
+        if end - start > 1:
+            start += 1
+            end -= 1
+        self._starts = [start]
+        self._ends = [end]
+
+    @property
+    def free_count(self):
+        return sum(end - start + 1 for start, end in zip(self._starts, self._ends))
+
+    def reserve(self, value):
+        """mark integer address value as used, return False if it is not free"""
+        i = bisect.bisect_right(self._starts, value) - 1
+        if i < 0 or value > self._ends[i]:
+            return False
+
+        start, end = self._starts[i], self._ends[i]
+        if start == end:
+            del self._starts[i]
+            del self._ends[i]
+        elif value == start:
+            self._starts[i] = value + 1
+        elif value == end:
+            self._ends[i] = value - 1
+        else:
+            self._ends[i] = value - 1
+            self._starts.insert(i + 1, value + 1)
+            self._ends.insert(i + 1, end)
+        return True
+
+    def allocate(self):
+        """take the lowest free address, return it as integer"""
+        if not self._starts:
+            raise Exception('no free address in {}'.format(self.net))
+
+        value = self._starts[0]
+        if value == self._ends[0]:
+            del self._starts[0]
+            del self._ends[0]
+        else:
+            self._starts[0] = value + 1
+        return value
+
+
+class _LanState:
+    __slots__ = ('lan', 'net', 'pool', 'member_count')
+
+    def __init__(self, lan):
+        self.lan = lan
+        self.net = lan.net
+        self.pool = AddressPool(lan.net)
+        # members of lan.hosts already handled, the list is append only
+        self.member_count = 0
+
+
+class AddressAllocator:
+    """assign free lan addresses to ports of an adjusted scene that have none
+
+    explicit addresses are reserved first, then router ports (the lan gateways) get the lowest
+    free addresses, then host ports. the allocator remembers what it has seen, calling allocate()
+    again after adding nodes only looks at the new lan members and keeps existing assignments.
+    a lan replaced by a new Lan object or a changed net is started over.
+    """
+
+    def __init__(self):
+        self._lans = dict()
+
+    def allocate(self, scene):
+        """return number of addresses assigned"""
+        count = 0
+        for lan in scene.lans.values():
+            if lan.net is None:
+                continue
+
+            state = self._lans.get(lan.id, None)
+            if state is None or state.lan is not lan or state.net != lan.net:
+                state = self._lans[lan.id] = _LanState(lan)
+            if state.member_count == len(lan.hosts):
+                continue
+
+            count += self._allocate_lan(state)
+        return count
+
+    def _allocate_lan(self, state):
+        lan = state.lan
+        pool = state.pool
+        members = lan.hosts[state.member_count:]
+        state.member_count = len(lan.hosts)
+
+        gateway_ports = []
+        host_ports = []
+        for node in members:
+            for port in node.ports:
+                if not port.in_lan or port.in_lan.lan_id != lan.id:
+                    continue
+                if port.in_lan.ip:
+                    version, value = ip_value(port.in_lan.ip)
+                    if version == lan.net.version:
+                        # duplicates and addresses outside the lan are reported by validate_scene()
+                        pool.reserve(value)
+                elif node.role == NodeRole.ROUTER:
+                    gateway_ports.append(port)
+                else:
+                    host_ports.append(port)
+
+        address_class = ipaddress.IPv4Address if lan.net.version == 4 else ipaddress.IPv6Address
+        for port in gateway_ports + host_ports:
+            try:
+                value = pool.allocate()
+            except Exception:
+                raise Exception('lan {} ({}) has no free address left'.format(lan.id, lan.net))
+            port.in_lan.ip = str(address_class(value))
+        return len(gateway_ports) + len(host_ports)
+
+
+def allocate_addresses(scene, allocator=None):
+    """assign addresses to lan ports without ip, see AddressAllocator
+
+    pass the same allocator again to allocate incrementally. return the allocator.
+    """
+    allocator = allocator if allocator is not None else AddressAllocator()
+    allocator.allocate(scene)
+    return allocator
@@ -0,0 +1,182 @@
+import io
+
+from scbr import instrument
+from scbr.topo import Topology, TopologyExporter, Option, _chunk_writer, _escape, _write_node, count_exported
+from scbr.utils import auto_str
+
+NODE_ATTRS = ('name', 'template_id', 'category', 'emulation', 'image', 'os')
+
+
+@auto_str()
+class OptionChange:
+    """option of a node or port (owner id) at path, old/new are (value, type, unit) as exported"""
+
+    __slots__ = ('owner_id', 'path', 'old', 'new')
+
+    def __init__(self, owner_id, path, old, new):
+        self.owner_id = owner_id
+        self.path = path
+        self.old = old
+        self.new = new
+
+
+@auto_str()
+class TopologyDiff:
+    """difference from old to new topology
+
+    nodes are identified by id, ports by node id and index, links by their deterministic id.
+    nodes and ports are lists of ids, links are Link objects of the topology they come from.
+    """
+
+    def __init__(self):
+        self.added_nodes = []
+        self.removed_nodes = []
+        self.changed_nodes = []
+        self.added_ports = []
+        self.removed_ports = []
+        self.changed_ports = []
+        self.added_links = []
+        self.removed_links = []
+        self.changed_links = []
+        self.changed_options = []
+
+    @property
+    def empty(self):
+        return not (self.added_nodes or self.removed_nodes or self.changed_nodes or
+                    self.added_links or self.removed_links or self.changed_links)
+
+
+def flatten_options(options, prefix='', result=None):
+    """flatten nested options to {path: (value, type, unit)}, values as they are exported"""
+    result = result if result is not None else dict()
+    if isinstance(options, dict):
+        for k, v in options.items():
+            if isinstance(v, (list, tuple)):
+                for i, item in enumerate(v):
+                    flatten_options(item, '{}{}[{}].'.format(prefix, k, i), result)
+            else:
+                flatten_options(v, '{}{}.'.format(prefix, k), result)
+    elif isinstance(options, Option):
+        result[prefix[:-1]] = (str(options.value), options.subtype, options.unit)
+    else:
+        raise Exception("unknown type {}".format(type(options)))
+    return result
+
+
+def _diff_options(owner_id, old, new, changes):
+    old = flatten_options(old)
+    new = flatten_options(new)
+    changed = False
+    for path in old.keys() | new.keys():
+        old_value = old.get(path, None)
+        new_value = new.get(path, None)
+        if old_value != new_value:
+            changes.append(OptionChange(owner_id, path, old_value, new_value))
+            changed = True
+    return changed
+
+
+def _port_peer(port):
+    if port.link is None:
+        return None
+    return port.link.adjacent_port(port).id
+
+
+def _links(topology):
+    links = dict()
+    for node in topology.nodes.values():
+        for port in node.ports:
+            if port.link is not None:
+                links[port.link.id] = port.link
+    return links
+
+
+def diff_topology(old: Topology, new: Topology):
+    diff = TopologyDiff()
+
+    for node_id, node in new.nodes.items():
+        old_node = old.nodes.get(node_id, None)
+        if old_node is None:
+            diff.added_nodes.append(node_id)
+            diff.added_ports.extend(port.id for port in node.ports)
+            continue
+
+        changed = any(getattr(old_node, attr) != getattr(node, attr) for attr in NODE_ATTRS)
+        changed |= _diff_options(node_id, old_node.options, node.options, diff.changed_options)
+
+        old_ports = {port.index: port for port in old_node.ports}
+        for port in node.ports:
+            old_port = old_ports.pop(port.index, None)
+            if old_port is None:
+                diff.added_ports.append(port.id)
+                changed = True
+            elif (_diff_options(port.id, old_port.options, port.options, diff.changed_options) or
+                  _port_peer(old_port) != _port_peer(port)):
+                diff.changed_ports.append(port.id)
+                changed = True
+        for old_port in old_ports.values():
+            diff.removed_ports.append(old_port.id)
+            changed = True
+
+        if changed:
+            diff.changed_nodes.append(node_id)
+
+    for node_id, node in old.nodes.items():
+        if node_id not in new.nodes:
+            diff.removed_nodes.append(node_id)
+            diff.removed_ports.extend(port.id for port in node.ports)
+
+    old_links = _links(old)
+    for link_id, link in _links(new).items():
+        old_link = old_links.pop(link_id, None)
+        if old_link is None:
+            diff.added_links.append(link)
+        elif flatten_options(old_link.options) != flatten_options(link.options):
+            diff.changed_links.append(link)
+    diff.removed_links.extend(old_links.values())
+
+    return diff
+
+
+class CadtsDeltaExporter(TopologyExporter):
+    """export only the difference of a topology to the deployed base topology
+
+    added and changed nodes are written in full, like CadtsTopologyExporter, with op="add" or
+    op="update". removed nodes and added/removed links are listed by id.
+    """
+
+    def __init__(self, base: Topology):
+        self.base = base
+
+    def export(self, topology: Topology, fp=None):
+        if fp is None:
+            f = io.StringIO()
+            self.export(topology, f)
+            return f.getvalue()
+
+        with instrument.stage('export'):
+            diff = diff_topology(self.base, topology)
+            write = _chunk_writer(fp)
+            write(['<?xml version="1.0" encoding="UTF-8"?>\n'])
+            if diff.empty:
+                write(['<topo _v="2.0" delta="true"/>\n'])
+                return
+
+            write(['<topo _v="2.0" delta="true">\n'])
+            for op, node_ids in (('add', diff.added_nodes), ('update', diff.changed_nodes)):
+                for node_id in node_ids:
+                    chunks = []
+                    _write_node(chunks, topology.nodes[node_id], ' op="{}"'.format(op))
+                    write(chunks)
+
+            for node_id in diff.removed_nodes:
+                write(['\t<node op="remove" id="{}"/>\n'.format(_escape(node_id))])
+
+            link_ops = (('remove', diff.removed_links), ('add', diff.added_links), ('update', diff.changed_links))
+            for op, links in link_ops:
+                for link in links:
+                    write(['\t<link op="{}" id="{}" fromNode="{}" fromPort="{}" toNode="{}" toPort="{}"/>\n'.format(
+                        op, link.id, _escape(link.port1.node.id), link.port1.index,
+                        _escape(link.port2.node.id), link.port2.index)])
+            write(['</topo>\n'])
+            count_exported(topology, [topology.nodes[node_id] for node_id in diff.added_nodes + diff.changed_nodes])
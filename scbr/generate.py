@@ -0,0 +1,88 @@
+import io
+import ipaddress
+
+SHAPE_CHAIN = 'chain'
+SHAPE_STAR = 'star'
+SHAPE_MESH = 'mesh'
+SHAPES = (SHAPE_CHAIN, SHAPE_STAR, SHAPE_MESH)
+
+LAN_SPACE = ipaddress.ip_network('10.0.0.0/8')
+LINK_SPACE = ipaddress.ip_network('172.16.0.0/12')
+TEMPLATE_OSES = ('linux', 'windows')
+TEMPLATE_EMULATIONS = ('vsphere', 'docker', 'lxd', 'kvm')
+
+
+def router_pairs(router_count, shape):
+    """pairs of router indexes to link for shape"""
+    if router_count < 2:
+        return []
+    if shape == SHAPE_CHAIN:
+        return [(i, i + 1) for i in range(router_count - 1)]
+    elif shape == SHAPE_STAR:
+        return [(0, i) for i in range(1, router_count)]
+    elif shape == SHAPE_MESH:
+        # ring plus chords
+        pairs = [(i, (i + 1) % router_count) for i in range(router_count if router_count > 2 else 1)]
+        if router_count > 3:
+            pairs.extend((i, (i + router_count // 3) % router_count) for i in range(0, router_count, 7))
+        return pairs
+    else:
+        raise Exception("unknown shape {}, expect one of {}".format(shape, ', '.join(SHAPES)))
+
+
+def _lan_prefixlen(hosts_per_lan):
+    # room for the hosts, the gateway, network and broadcast address
+    prefixlen = 30
+    while prefixlen > 8 and (1 << (32 - prefixlen)) < hosts_per_lan + 3:
+        prefixlen -= 1
+    return min(prefixlen, 24)
+
+
+def generate_scene(fp=None, lans=10, hosts_per_lan=20, routers=2, shape=SHAPE_CHAIN, templates=4, dns_entries=3):
+    """write a valid scene with addresses for every port to text file fp, or return it as string if fp is None
+
+    lans are spread over the routers round robin, each router is the gateway (first address) of its
+    lans. hosts use the templates in turn and carry an option dns_list of dns_entries entries.
+    """
+    if fp is None:
+        f = io.StringIO()
+        generate_scene(f, lans, hosts_per_lan, routers, shape, templates, dns_entries)
+        return f.getvalue()
+
+    pairs = router_pairs(routers, shape)
+    lan_nets = list(LAN_SPACE.subnets(new_prefix=_lan_prefixlen(hosts_per_lan)))
+    link_nets = LINK_SPACE.subnets(new_prefix=30)
+    if lans > len(lan_nets):
+        raise Exception("{} lans of {} hosts don't fit in {}".format(lans, hosts_per_lan, LAN_SPACE))
+
+    for i in range(templates):
+        fp.write('template "/bench/tpl-{}" {{\n    os {}\n    emulation {}\n    image "/images/tpl-{}.png"\n}}\n\n'
+                 .format(i, TEMPLATE_OSES[i % len(TEMPLATE_OSES)],
+                         TEMPLATE_EMULATIONS[i % len(TEMPLATE_EMULATIONS)], i))
+
+    for i in range(lans):
+        fp.write('lan lan-{} as "LAN {}" {{\n    ipv4 {}\n}}\n\n'.format(i, i, lan_nets[i]))
+
+    for r in range(routers):
+        fp.write('router r-{} {{\n'.format(r))
+        for i in range(r, lans, routers):
+            fp.write('    port in lan-{}[{}]\n'.format(i, lan_nets[i].network_address + 1))
+        for a, b in pairs:
+            if a == r:
+                net = next(link_nets)
+                fp.write('    port[{}/30] to r-{}[{}/30]\n'.format(
+                    net.network_address + 1, b, net.network_address + 2))
+        fp.write('}\n\n')
+
+    dns_list = ',\n'.join('        {{name: "www.site-{}.net", ip: {}}}'.format(
+        k, lan_nets[k % max(lans, 1)].network_address + 2) for k in range(dns_entries))
+    for i in range(lans):
+        net = lan_nets[i]
+        for j in range(hosts_per_lan):
+            role = 'server' if j == 0 else 'terminal'
+            use = ' use "/bench/tpl-{}"'.format((i + j) % templates) if templates else ''
+            fp.write('{} pc-{}-{} in lan-{}[{}]{}'.format(role, i, j, i, net.network_address + j + 2, use))
+            if dns_entries:
+                fp.write(' {{\n    option dns_list [\n{}\n    ]\n}}\n\n'.format(dns_list))
+            else:
+                fp.write('\n')
@@ -0,0 +1,134 @@
+import sys
+import threading
+import time
+
+from scbr.utils import auto_str
+
+# callbacks called with a StageRecord when a stage ends
+_listeners = []
+_local = threading.local()
+
+
+@auto_str()
+class StageRecord:
+    """one finished stage: wall time, net memory blocks allocated and counters"""
+
+    __slots__ = ('name', 'depth', 'seconds', 'allocated_blocks', 'counters')
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.seconds = 0.0
+        self.allocated_blocks = 0
+        self.counters = dict()
+
+
+class _Stage:
+    __slots__ = ('record', '_start', '_blocks')
+
+    def __init__(self, name):
+        self.record = StageRecord(name, len(_stack()))
+
+    def __enter__(self):
+        _stack().append(self.record)
+        self._blocks = sys.getallocatedblocks()
+        self._start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        record = self.record
+        record.seconds = time.perf_counter() - self._start
+        record.allocated_blocks = sys.getallocatedblocks() - self._blocks
+        _stack().pop()
+        for listener in list(_listeners):
+            listener(record)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def add_listener(callback):
+    """call callback(StageRecord) whenever an instrumented stage ends, in this process"""
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+
+def enabled():
+    """True if anyone listens, expensive counters should only be computed then"""
+    return bool(_listeners)
+
+
+def stage(name):
+    """context manager timing a pipeline stage, almost free while there is no listener
+
+        with instrument.stage('adjust'):
+            ...
+    """
+    if not _listeners:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def count(name, n=1):
+    """add n to counter name of the innermost running stage"""
+    if not _listeners:
+        return
+    stack = _stack()
+    if stack:
+        counters = stack[-1].counters
+        counters[name] = counters.get(name, 0) + n
+
+
+class ProfileSummary:
+    """listener collecting stage records, aggregated per stage name for a summary table
+
+    records may also be added from other processes with add().
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.add(record)
+
+    def add(self, record):
+        self.records.append(record)
+
+    def totals(self):
+        """{stage name: (calls, seconds, allocated blocks, counters)} in order of first appearance"""
+        totals = dict()
+        for record in self.records:
+            calls, seconds, blocks, counters = totals.get(record.name, (0, 0.0, 0, dict()))
+            for k, v in record.counters.items():
+                counters[k] = counters.get(k, 0) + v
+            totals[record.name] = (calls + 1, seconds + record.seconds, blocks + record.allocated_blocks, counters)
+        return totals
+
+    def format_table(self):
+        lines = ['{:<20} {:>7} {:>10} {:>12}  {}'.format('stage', 'calls', 'seconds', 'blocks', 'counters')]
+        for name, (calls, seconds, blocks, counters) in self.totals().items():
+            counters_text = ', '.join('{}={}'.format(k, v) for k, v in sorted(counters.items()))
+            line = '{:<20} {:>7} {:>10.3f} {:>12}  {}'.format(name, calls, seconds, blocks, counters_text)
+            lines.append(line.rstrip())
+        return '\n'.join(lines)
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+import pickle
+
+import scbr
+
+LOG = logging.getLogger(__name__)
+
+# bump when pickled entity classes or what the transformer puts into them change
+CACHE_FORMAT = 4
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+_SUFFIX = '.pickle'
+
+
+class SceneCache:
+    """on-disk cache of transformed scene files
+
+    entries are keyed by file content, grammar and package version, so any change of them
+    results in a miss. least recently used entries are evicted when total size exceeds max_size.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._size = None
+
+    def key(self, content, grammar_hash):
+        h = hashlib.sha256()
+        for part in (str(CACHE_FORMAT), scbr.__version__, grammar_hash):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        h.update(content.encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            LOG.warning("drop broken scene cache entry %s: %s", path, e)
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            LOG.info("scene cache entry %s not written: %s", path, e)
+            self._remove(tmp_path)
+            return
+
+        if self._size is None:
+            self._size = self._total_size()
+        else:
+            self._size += size
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        entries = self._entries()
+        entries.sort(key=lambda entry: entry[1])
+        total = sum(entry[2] for entry in entries)
+        for path, _, size in entries:
+            if total <= self.max_size:
+                break
+            if self._remove(path):
+                total -= size
+        self._size = total
+
+    def clear(self):
+        for path, _, _ in self._entries():
+            self._remove(path)
+        self._size = 0
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return entries
+
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _total_size(self):
+        return sum(entry[2] for entry in self._entries())
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
@@ -1,18 +1,146 @@
 import abc
+import copyreg
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import os
+import logging
+import pickle
+import re
+import sys
 from pprint import pprint
 import ipaddress
+import lark as lark_module
 from lark import Lark, Transformer, Tree
+from lark.exceptions import GrammarError
 from lark.lexer import Token
+from lark.parsers import lalr_analysis
 
-from scbr.scene import Scene, Lan, Host, HostInLan, Router, NodePort, NodeRole, NodeTemplate, Environment, RouteEntry, \
-    RouteTable, IpWithMask, PortToPort, Flag, FlagType
+from scbr import instrument
+from scbr.lang.cache import SceneCache
+
+from scbr.scene import Scene, Lan, Host, HostRange, HostInLan, Router, NodePort, NodeRole, NodeTemplate, Environment, \
+    RouteEntry, RouteTable, IpWithMask, PortToPort, Flag, FlagType
 from scbr.topo import Option
 
-with open(os.path.join(os.path.dirname(__file__), "scene.lark")) as f:
-    _lark_content = f.read()
+LOG = logging.getLogger(__name__)
+
+PARSER_EARLEY = 'earley'
+PARSER_LALR = 'lalr'
+# LALR with SceneEntityTransformer applied during parsing, no parse tree is built
+PARSER_LALR_INLINE = 'lalr_inline'
+
+GRAMMAR_FILE = os.path.join(os.path.dirname(__file__), "scene.lark")
+# start of a line beginning with the keyword of a top level entity
+ENTITY_START = re.compile(r'^(?=(?:env|lan|host|attacker|server|terminal|router|template|include)(?![\w-]))', re.M)
+CACHE_DIR_ENV = 'SCBR_CACHE_DIR'
+
+_grammar = None
+_parsers = {}
+
+
+def _lalr_action(name):
+    return getattr(lalr_analysis, name)
+
+
+# lark compares LALR actions by identity, keep Shift/Reduce singletons across pickling
+copyreg.pickle(lalr_analysis.Action, lambda action: (_lalr_action, (action.name,)))
+
+
+def grammar_content():
+    global _grammar
+    if _grammar is None:
+        with open(GRAMMAR_FILE, encoding='utf-8') as f:
+            content = f.read()
+        _grammar = content, hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return _grammar[0]
+
+
+def grammar_hash():
+    grammar_content()
+    return _grammar[1]
+
+
+def default_cache_dir():
+    cache_dir = os.environ.get(CACHE_DIR_ENV, None)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'scbr')
+    return cache_dir
+
+
+def _parser_cache_file(parser):
+    cache_dir = default_cache_dir()
+    if not cache_dir:
+        return None
+
+    return os.path.join(cache_dir, 'scene-{}-{}-lark{}-{}.pickle'.format(
+        parser, grammar_hash()[:16], lark_module.__version__, sys.implementation.cache_tag))
 
-_parser = Lark(_lark_content, start='scene')
+
+def _load_cached_parser(parser):
+    cache_file = _parser_cache_file(parser)
+    if not cache_file or not os.path.exists(cache_file):
+        return None
+
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        LOG.warning("broken parser cache %s, rebuild: %s", cache_file, e)
+        return None
+
+
+def _save_cached_parser(parser, lark):
+    cache_file = _parser_cache_file(parser)
+    if not cache_file:
+        return
+
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(lark, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        LOG.info("parser cache %s not written: %s", cache_file, e)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _build_parser(parser):
+    if parser == PARSER_EARLEY:
+        return Lark(grammar_content(), start='scene')
+    elif parser == PARSER_LALR:
+        return Lark(grammar_content(), start='scene', parser=PARSER_LALR)
+    elif parser == PARSER_LALR_INLINE:
+        return Lark(grammar_content(), start='scene', parser=PARSER_LALR, transformer=SceneEntityTransformer())
+    else:
+        raise Exception("unknown parser {}".format(parser))
+
+
+def get_parser(parser=PARSER_EARLEY):
+    """get lark parser of scene language, LALR falls back to Earley if grammar is not LALR(1)
+
+    parser is built on first use and its compiled grammar is pickled into cache dir
+    (env SCBR_CACHE_DIR, empty to disable), keyed by grammar hash and lark version.
+    """
+    if parser in _parsers:
+        return _parsers[parser]
+
+    lark = _load_cached_parser(parser)
+    if lark is None:
+        try:
+            lark = _build_parser(parser)
+        except GrammarError as e:
+            if parser not in (PARSER_LALR, PARSER_LALR_INLINE):
+                raise
+            LOG.warning("scene grammar is not LALR(1), fallback to earley: %s", e)
+            lark = get_parser(PARSER_EARLEY)
+        else:
+            _save_cached_parser(parser, lark)
+
+    _parsers[parser] = lark
+    return lark
 
 
 def parse_role(role_string):
@@ -24,6 +152,22 @@ class Alias:
         self.value = value
 
 
+class Include:
+    """include statement, resolved by include_order() and IncludeResolver"""
+
+    def __init__(self, path):
+        self.id = path
+        self.path = path
+
+
+class IdRange:
+    def __init__(self, prefix, start, end, width):
+        self.prefix = prefix
+        self.start = start
+        self.end = end
+        self.width = width
+
+
 class TemplateOption:
     def __init__(self, template_id):
         self.template_id = template_id
@@ -71,6 +215,23 @@ class EntityName:
         self.name = name
 
 
+class GlobalDns(EntityOption):
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+    def config(self, entity):
+        entity.is_global_dns_server = self.enabled
+
+
+class TemplateAttr(EntityOption):
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def config(self, entity):
+        setattr(entity, self.key, self.value)
+
+
 class FlagOption(EntityOption):
     def config(self, entity):
         entity.flags.append(self.flag)
@@ -85,15 +246,7 @@ class SceneTransformer(Transformer):
         self._scene = scene if scene else Scene()
 
     def scene(self, matches):
-        for entity in matches:
-            if isinstance(entity, Environment):
-                self._scene.env = entity
-            else:
-                self._scene.add_entity(entity)
-
-                if isinstance(entity, Lan):
-                    for host in entity.hosts:
-                        self._scene.add_entity(host)
+        self._scene.add_entities(matches)
         self._scene.adjust()
         return self._scene
 
@@ -106,34 +259,42 @@ class SceneTransformer(Transformer):
                 lan.name = option.value
             elif isinstance(option, Host):
                 lan.add_host(option)
+            elif isinstance(option, HostRange):
+                for host in option.expand():
+                    lan.add_host(host)
             else:
                 raise Exception("Unknown element: {} {}".format(type(option), option))
         return lan
 
     def host(self, matches):
         role = matches[0].value
-        host = Host(matches[1].value, parse_role(role))
+        id_range = matches[1] if isinstance(matches[1], IdRange) else None
+        host = Host(id_range.prefix if id_range else matches[1].value, parse_role(role))
         for option in matches[2:]:
             if isinstance(option, Alias):
                 host.name = option.value
             elif isinstance(option, HostInLan):
                 host.in_lan = option
-                host.ports.append(NodePort(option))
+                host.add_port(NodePort(option))
             elif isinstance(option, TemplateOption):
                 host.template_id = option.template_id
             elif isinstance(option, NodePort):
-                host.ports.append(option)
-            elif isinstance(option, Tree):
-                if option.data == 'global_dns_line':
-                    host.is_global_dns_server = option.children[0].value == "true"
-                elif option.data == 'use_template':
-                    host.template_id = _extract_str(option.children[1])
+                host.add_port(option)
             elif isinstance(option, EntityOption):
                 option.config(host)
             else:
                 raise Exception("Unknown element: {} {}".format(type(option), option))
+        if id_range:
+            # one prototype for all hosts of the range, see HostRange.expand()
+            return HostRange(host, id_range.start, id_range.end, id_range.width)
         return host
 
+    def id_range(self, matches):
+        start = matches[1].value
+        # leading zeros pad all numbers to the same width
+        width = len(start) if start.startswith('0') and len(start) > 1 else 0
+        return IdRange(matches[0].value, int(start), int(matches[2].value), width)
+
     def router(self, matches):
         router = Router(matches[1].value)
         for option in matches[2:]:
@@ -142,12 +303,9 @@ class SceneTransformer(Transformer):
             elif isinstance(option, TemplateOption):
                 router.template_id = option.template_id
             elif isinstance(option, NodePort):
-                router.ports.append(option)
+                router.add_port(option)
             elif isinstance(option, RouteTable):
                 router.route_table.merge(option)
-            elif isinstance(option, Tree):
-                if option.data == 'use_template':
-                    router.template_id = _extract_str(option.children[1])
             elif isinstance(option, EntityOption):
                 option.config(router)
             else:
@@ -172,6 +330,12 @@ class SceneTransformer(Transformer):
     def template_line(self, matches):
         return TemplateOption(_extract_str(matches[1]))
 
+    def use_template(self, matches):
+        return TemplateOption(_extract_str(matches[1]))
+
+    def global_dns_line(self, matches):
+        return GlobalDns(matches[0].value == "true")
+
     def port(self, matches):
         if isinstance(matches[1], Token):
             port = NodePort(matches[2] if len(matches) > 2 else None, name=matches[1].value)
@@ -202,26 +366,33 @@ class SceneTransformer(Transformer):
         return to_port
 
     def node_port_id(self, matches):
-        return EntityName(matches[0])
+        return EntityName(matches[0].value)
 
     def node_port_ip(self, matches):
         return IpWithMask(matches[0])
 
+    def include(self, matches):
+        return Include(_extract_str(matches[1]))
+
     def template(self, matches):
         template = NodeTemplate(_extract_str(matches[1]))
         for option in matches[2:]:
-            if isinstance(option, Tree):
-                if option.data == 'template_os_attr':
-                    template.os = option.children[0].value
-                elif option.data == 'template_emulation_attr':
-                    template.emulation = option.children[0].value
-                elif option.data == 'template_image_attr':
-                    template.image = _extract_str(option.children[0])
-                else:
-                    raise Exception("unknown template option: {}".format(option.data))
+            if isinstance(option, TemplateAttr):
+                option.config(template)
+            else:
+                raise Exception("unknown template option: {}".format(option))
         template.validate()
         return template
 
+    def template_os_attr(self, matches):
+        return TemplateAttr('os', matches[0].value)
+
+    def template_emulation_attr(self, matches):
+        return TemplateAttr('emulation', matches[0].value)
+
+    def template_image_attr(self, matches):
+        return TemplateAttr('image', _extract_str(matches[0]))
+
     def route_table(self, matches):
         route_table = RouteTable(matches)
         return route_table
@@ -237,7 +408,7 @@ class SceneTransformer(Transformer):
         return env
 
     def external_net(self, matches):
-        return ExternalNet(map(lambda m: ipaddress.IPv4Network(m.value), matches))
+        return ExternalNet([ipaddress.IPv4Network(m.value) for m in matches])
 
     def control_net_gateway(self, matches):
         return ControlNetGateway(ipaddress.IPv4Address(matches[0].value))
@@ -271,8 +442,8 @@ class SceneTransformer(Transformer):
     def dict_entry(self, matches):
         key = matches[0]
         value = matches[1]
-        if key.type == 'ESCAPED_STRING':
-            key = _extract_str(key)
+        # plain str, a token would carry its position in the file into the entity
+        key = _extract_str(key) if key.type == 'ESCAPED_STRING' else key.value
         return DictOptionEntry(key, value)
 
     def flag(self, matches):
@@ -281,19 +452,191 @@ class SceneTransformer(Transformer):
         else:
             type_ = FlagType.RANDOM
 
-        return FlagOption(Flag(type_, matches[1].value, int(matches[2].value), matches[3].value))
+        return FlagOption(Flag(type_, matches[1].value, int(matches[2].value), _extract_str(matches[3])))
+
+
+class SceneEntityTransformer(SceneTransformer):
+    """transform a scene file into its top level entities, without merging them into a scene"""
+
+    def scene(self, matches):
+        return list(matches)
 
 
 def _extract_str(token):
     return token.value[1:-1]
 
 
-def parse_scene(*scene_files):
-    scene = Scene()
-    for scene_file in scene_files:
+def parse_entities(content, parser=PARSER_EARLEY):
+    result = get_parser(parser).parse(content)
+    if isinstance(result, Tree):
+        # tree based parser, or inline mode fallen back to earley
+        result = SceneEntityTransformer().transform(result)
+    return result
+
+
+def split_entities(content):
+    """split scene source before every line starting with a top level entity keyword, see parse_pieces()
+
+    comments and whitespace stay in the piece before, joined the pieces are content.
+    """
+    starts = [match.start() for match in ENTITY_START.finditer(content)]
+    bounds = [0] + starts[1:] + [len(content)]
+    return [content[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def parse_pieces(content, parser=PARSER_EARLEY, known=None):
+    """parse_entities() of content piece by piece, return [(piece, entities)], see split_entities()
+
+    pieces in known (piece -> entities of an earlier call) are not parsed again. a keyword starting a
+    line inside a block or comment splits it, the piece fails to parse then and content is parsed as
+    a whole, giving one piece. so does an env after other entities, which is an error.
+    """
+    pieces = []
+    for piece in split_entities(content):
+        entities = known.get(piece, None) if known else None
+        if entities is None:
+            try:
+                entities = parse_entities(piece, parser)
+            except Exception:
+                return [(content, parse_entities(content, parser))]
+        if pieces and any(isinstance(entity, Environment) for entity in entities):
+            return [(content, parse_entities(content, parser))]
+        pieces.append((piece, entities))
+    return pieces
+
+
+def parse_file(scene_file, parser=PARSER_EARLEY, cache=None):
+    """parse one scene file into its top level entities, cache skips parsing of unchanged files"""
+    with instrument.stage('parse_file'):
         with open(scene_file, 'r', encoding="utf-8") as f:
-            ast = _parser.parse(f.read())
+            content = f.read()
+        instrument.count('bytes', len(content))
 
-        SceneTransformer(scene).transform(ast)
-    scene.adjust()
-    return scene
+        if cache is None:
+            return parse_entities(content, parser)
+
+        key = cache.key(content, grammar_hash())
+        entities = cache.get(key)
+        if entities is None:
+            entities = parse_entities(content, parser)
+            cache.put(key, entities)
+        else:
+            instrument.count('cache_hits')
+        return entities
+
+
+def include_path(including_file, path):
+    return os.path.normpath(os.path.join(os.path.dirname(including_file), path))
+
+
+def include_order(path, includes_of, seen=None, exists=os.path.exists):
+    """path and the files it includes, recursively, in merge order: included files first
+
+    includes_of(path) returns the include_path() of every include of path. files in seen are
+    skipped and added to it, so each file is merged once into a scene even if included from
+    several files. raise Exception on include cycles and included files exists() denies.
+    """
+    seen = set() if seen is None else seen
+    order = []
+    stack = []
+
+    def visit(file, including_file):
+        if file in stack:
+            raise Exception('include cycle: {}'.format(' -> '.join(stack[stack.index(file):] + [file])))
+        if file in seen:
+            return
+        if including_file is not None and not exists(file):
+            raise Exception('{} included by {} not found'.format(file, including_file))
+
+        stack.append(file)
+        for included in includes_of(file):
+            visit(included, file)
+        stack.pop()
+        seen.add(file)
+        order.append(file)
+
+    visit(os.path.normpath(path), None)
+    return order
+
+
+class IncludeResolver:
+    """parse files and the files they include, each file once as long as it doesn't change
+
+    entities of files holding only templates and env are shared by every scene, adjust() doesn't
+    change them. other files are kept pickled and loaded again for every scene, which is a lot
+    cheaper than parsing them.
+    """
+
+    def __init__(self, parser=PARSER_EARLEY, cache=None):
+        self.parser = parser
+        self.cache = cache
+        # path -> (mtime, shared entities or None, pickled entities or None, included paths)
+        self._files = dict()
+
+    def _entry(self, path, keep=True, parsed=None):
+        mtime = os.path.getmtime(path)
+        entry = self._files.get(path, None)
+        if entry is not None and entry[0] == mtime:
+            return entry
+
+        entities = parsed if parsed is not None else parse_file(path, self.parser, self.cache)
+        includes = [include_path(path, entity.path) for entity in entities if isinstance(entity, Include)]
+        entities = [entity for entity in entities if not isinstance(entity, Include)]
+        if all(isinstance(entity, (NodeTemplate, Environment)) for entity in entities):
+            entry = self._files[path] = (mtime, entities, None, includes)
+        elif keep:
+            entry = self._files[path] = (mtime, None, pickle.dumps(entities, pickle.HIGHEST_PROTOCOL), includes)
+        else:
+            # used once
+            entry = (mtime, entities, None, includes)
+        return entry
+
+    def entities(self, path, seen=None, keep=True, parsed=None):
+        """entities of path and of the files it includes, see include_order()
+
+        with keep False path itself is parsed again next time, unless it only holds templates and
+        env. parsed are the entities of path if it is already parsed.
+        """
+        path = os.path.normpath(path)
+        entries = dict()
+
+        def entry(file):
+            if file not in entries:
+                entries[file] = self._entry(file, keep or file != path, parsed if file == path else None)
+            return entries[file]
+
+        entities = []
+        for file in include_order(path, lambda file: entry(file)[3], seen):
+            _, shared, pickled, _ = entry(file)
+            entities.extend(shared if shared is not None else pickle.loads(pickled))
+        return entities
+
+
+def parse_scene(*scene_files, parser=PARSER_EARLEY, cache=None, workers=None):
+    """parse and merge scene files in order, with the files they include
+
+    cache is a SceneCache or a cache directory. with workers > 1 files are parsed and
+    transformed in a process pool, entities are still merged in file order. included files are
+    parsed once, in this process.
+    """
+    if isinstance(cache, str):
+        cache = SceneCache(cache)
+
+    with instrument.stage('parse_scene'):
+        instrument.count('files', len(scene_files))
+        if workers and workers > 1 and len(scene_files) > 1:
+            # parse_file stages of the workers are not reported
+            with ProcessPoolExecutor(max_workers=min(workers, len(scene_files))) as executor:
+                parsed_list = list(executor.map(parse_file, scene_files, repeat(parser), repeat(cache)))
+        else:
+            parsed_list = [None] * len(scene_files)
+
+        resolver = IncludeResolver(parser, cache)
+        scene = Scene()
+        seen = set()
+        for scene_file, parsed in zip(scene_files, parsed_list):
+            entities = resolver.entities(scene_file, seen, False, parsed)
+            instrument.count('entities', len(entities))
+            scene.add_entities(entities)
+        scene.adjust()
+        return scene
@@ -0,0 +1,224 @@
+import math
+
+import numpy as np
+
+from scbr import instrument
+from scbr.provision import is_router
+from scbr.topo import NodeCategory, Option
+
+X_OPTION = 'x'
+Y_OPTION = 'y'
+# pixels between neighbor hosts of a lan
+UNIT = 60
+# repulsion is exact up to this many nodes, grid approximated above
+EXACT_LIMIT = 600
+BACKBONE_ITERATIONS = 200
+REFINE_ITERATIONS = 40
+
+
+def _repulsion_exact(pos, mass, k):
+    delta = pos[:, None, :] - pos[None, :, :]
+    dist2 = np.einsum('ijk,ijk->ij', delta, delta)
+    np.fill_diagonal(dist2, np.inf)
+    np.maximum(dist2, 1e-4 * k * k, out=dist2)
+    return np.einsum('ij,ijk->ik', k * k * mass[None, :] / dist2, delta)
+
+
+def _near_pairs(pos, size):
+    """yield (i, j, pos[i] - pos[j], squared distance) arrays of ordered node pairs closer than size
+
+    nodes are put in a grid of size cells, only the 3x3 cells around each node are searched.
+    """
+    n = len(pos)
+    cells = np.floor((pos - pos.min(0)) / size).astype(np.int64) + 1
+    width = int(cells[:, 0].max()) + 2
+    cell_ids = cells[:, 0] + cells[:, 1] * width
+    order = np.argsort(cell_ids, kind='stable')
+    counts = np.bincount(cell_ids, minlength=width * (int(cells[:, 1].max()) + 2))
+    starts = np.cumsum(counts) - counts
+
+    nodes = np.arange(n)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            targets = cell_ids + dx + dy * width
+            target_counts = counts[targets]
+            total = int(target_counts.sum())
+            if not total:
+                continue
+            i = np.repeat(nodes, target_counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(target_counts) - target_counts, target_counts)
+            j = order[np.repeat(starts[targets], target_counts) + offsets]
+
+            keep = i != j
+            i, j = i[keep], j[keep]
+            delta = pos[i] - pos[j]
+            dist2 = np.einsum('ij,ij->i', delta, delta)
+            near = dist2 < size * size
+            yield i[near], j[near], delta[near], dist2[near]
+
+
+def _repulsion_grid(pos, mass, k):
+    """repulsion of nodes within 2k only (Fruchterman-Reingold grid variant)"""
+    n = len(pos)
+    force = np.zeros_like(pos)
+    for i, j, delta, dist2 in _near_pairs(pos, 2 * k):
+        scale = k * k * mass[j] / np.maximum(dist2, 1e-4 * k * k)
+        force[:, 0] += np.bincount(i, weights=scale * delta[:, 0], minlength=n)
+        force[:, 1] += np.bincount(i, weights=scale * delta[:, 1], minlength=n)
+    return force
+
+
+def separate(pos, radius, gap=1.0, iterations=50):
+    """push apart discs of radius around pos until they are gap apart, pos is moved in place"""
+    n = len(pos)
+    if n < 2:
+        return pos
+    size = 2 * float(radius.max()) + gap
+    for step in range(iterations):
+        push = np.zeros_like(pos)
+        overlaps = 0
+        for i, j, delta, dist2 in _near_pairs(pos, size):
+            dist = np.sqrt(dist2)
+            overlap = radius[i] + radius[j] + gap - dist
+            hit = overlap > 1e-6
+            if not hit.any():
+                continue
+            overlaps += int(hit.sum())
+            i, delta, dist, overlap = i[hit], delta[hit], dist[hit], overlap[hit]
+            # coincident discs get pushed apart along an arbitrary direction
+            direction = np.where(dist[:, None] > 1e-9, delta / np.maximum(dist, 1e-9)[:, None],
+                                 np.column_stack((np.cos(i), np.sin(i))))
+            for axis in (0, 1):
+                push[:, axis] += np.bincount(i, weights=direction[:, axis] * overlap / 2, minlength=n)
+        if not overlaps:
+            break
+        pos += push
+        instrument.count('separations')
+    return pos
+
+
+def force_layout(pos, edges, k=1.0, mass=None, iterations=50, temperature=None, lengths=None):
+    """Fruchterman-Reingold layout, pos is moved in place
+
+    edges is an (m, 2) index array, lengths their rest lengths: edges pull with (d^2 - length^2) / k,
+    plain Fruchterman-Reingold for length 0. mass scales the repulsion of each node. repulsion is
+    exact up to EXACT_LIMIT nodes, above only nodes within 2k repulse each other, so pos should
+    already be roughly laid out then.
+    """
+    n = len(pos)
+    if n < 2:
+        return pos
+    mass = np.ones(n) if mass is None else mass
+    temperature = k * math.sqrt(n) if temperature is None else temperature
+    a, b = (edges[:, 0], edges[:, 1]) if len(edges) else (np.zeros(0, dtype=np.int64),) * 2
+    repulsion = _repulsion_exact if n <= EXACT_LIMIT else _repulsion_grid
+
+    for step in range(iterations):
+        force = repulsion(pos, mass, k)
+        if len(a):
+            delta = pos[a] - pos[b]
+            dist2 = np.maximum(np.einsum('ij,ij->i', delta, delta), 1e-9)
+            pull = dist2 if lengths is None else dist2 - lengths * lengths
+            pull = delta * (pull / (k * np.sqrt(dist2)))[:, None]
+            for axis in (0, 1):
+                force[:, axis] -= np.bincount(a, weights=pull[:, axis], minlength=n)
+                force[:, axis] += np.bincount(b, weights=pull[:, axis], minlength=n)
+
+        length = np.maximum(np.sqrt(np.einsum('ij,ij->i', force, force)), 1e-9)
+        limit = temperature * (1 - step / iterations)
+        pos += force * (np.minimum(length, limit) / length)[:, None]
+        instrument.count('iterations')
+    return pos
+
+
+def _ring_offsets(count):
+    """offsets of count hosts on rings of radius 1, 2, ... around their switch, 1 apart"""
+    offsets = np.zeros((count, 2))
+    placed = 0
+    radius = 1
+    while placed < count:
+        capacity = min(int(2 * math.pi * radius), count - placed)
+        angles = np.arange(capacity) * (2 * math.pi / capacity) + radius * 0.5
+        offsets[placed:placed + capacity, 0] = radius * np.cos(angles)
+        offsets[placed:placed + capacity, 1] = radius * np.sin(angles)
+        placed += capacity
+        radius += 1
+    return offsets
+
+
+def layout_topology(topology, seed=0, refine_iterations=REFINE_ITERATIONS):
+    """compute positions of all nodes, return {node id: (x, y)} in pixels, top left node at 0, 0
+
+    switches and routers are laid out first, each lan weighted by its size and pushed apart from
+    the others, then hosts are seeded on rings around their switch and the whole graph is refined.
+    """
+    with instrument.stage('layout'):
+        nodes = list(topology.nodes.values())
+        index = {node.id: i for i, node in enumerate(nodes)}
+        edges = set()
+        for node in nodes:
+            for port in node.ports:
+                if port.link is not None:
+                    peer = index[port.link.adjacent_port(port).node.id]
+                    edges.add((min(index[node.id], peer), max(index[node.id], peer)))
+        edges = np.array(sorted(edges), dtype=np.int64).reshape(-1, 2)
+        instrument.count('nodes', len(nodes))
+        if not nodes:
+            return dict()
+
+        # lan hosts hang on one switch, everything else is backbone
+        switch = [node.category == NodeCategory.Switch.name for node in nodes]
+        owner = dict()
+        for node in nodes:
+            if switch[index[node.id]] or is_router(node):
+                continue
+            peers = {port.link.adjacent_port(port).node.id for port in node.ports if port.link is not None}
+            if len(peers) == 1:
+                peer = peers.pop()
+                if switch[index[peer]]:
+                    owner[index[node.id]] = index[peer]
+        members = dict()
+        for host, lan in owner.items():
+            members.setdefault(lan, []).append(host)
+
+        backbone = [i for i in range(len(nodes)) if i not in owner]
+        backbone_index = {node: i for i, node in enumerate(backbone)}
+        # radius of the host rings around each node, see _ring_offsets()
+        radius = np.zeros(len(nodes))
+        offsets = dict()
+        for lan, hosts in members.items():
+            offsets[lan] = _ring_offsets(len(hosts))
+            radius[lan] = float(np.sqrt(np.einsum('ij,ij->i', offsets[lan], offsets[lan])).max())
+
+        # backbone nodes repulse each other by the area of their lans, links keep lans apart
+        backbone_radius = radius[backbone] + 1
+        k = float(backbone_radius.mean())
+        backbone_edges = np.array([(backbone_index[a], backbone_index[b]) for a, b in edges
+                                   if a in backbone_index and b in backbone_index], dtype=np.int64).reshape(-1, 2)
+        backbone_lengths = backbone_radius[backbone_edges].sum(1) + 1
+        random = np.random.RandomState(seed)
+        backbone_pos = random.uniform(0, 2 * k * math.sqrt(len(backbone)), (len(backbone), 2))
+        force_layout(backbone_pos, backbone_edges, k, (backbone_radius / k) ** 2, BACKBONE_ITERATIONS,
+                     lengths=backbone_lengths)
+        separate(backbone_pos, backbone_radius)
+
+        pos = np.zeros((len(nodes), 2))
+        pos[backbone] = backbone_pos
+        for lan, hosts in members.items():
+            pos[hosts] = pos[lan] + offsets[lan]
+        if refine_iterations:
+            # links keep their seeded length, refining only evens out the neighborhood of each node
+            seeded = pos[edges[:, 0]] - pos[edges[:, 1]]
+            lengths = np.sqrt(np.einsum('ij,ij->i', seeded, seeded))
+            force_layout(pos, edges, 1.0, None, refine_iterations, 1.0, lengths)
+
+        pos = (pos - pos.min(0)) * UNIT
+        return {node.id: (int(round(x)), int(round(y))) for node, (x, y) in zip(nodes, pos.tolist())}
+
+
+def apply_layout(topology, positions):
+    """write positions as x/y options of the nodes"""
+    for node_id, (x, y) in positions.items():
+        options = topology.nodes[node_id].options
+        options[X_OPTION] = Option(x, 'number')
+        options[Y_OPTION] = Option(y, 'number')
@@ -0,0 +1,315 @@
+import heapq
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from scbr import instrument
+from scbr.provision import is_router
+from scbr.topo import Topology, TopologyExporter, NodeCategory, _chunk_writer, _escape, _write_node, \
+    count_exported, node_records, records_topology
+from scbr.utils import auto_str
+
+# cost of cutting a link: inside a lan, between a router and a lan, between two routers
+CUT_LAN = 100
+CUT_ROUTER_LAN = 10
+CUT_PEER = 1
+
+DEFAULT_TOLERANCE = 0.05
+REFINE_PASSES = 4
+
+
+def node_weight(node):
+    """load of a node on a cluster, from cpuCount and ram (MB) set by Node.use_default_physic()"""
+    cpu = node.options.get('cpuCount', None)
+    ram = node.options.get('ram', None)
+    return (float(cpu.value) if cpu else 0.0) + (float(ram.value) / 1024 if ram else 0.0)
+
+
+def link_cost(link):
+    nodes = (link.port1.node, link.port2.node)
+    switches = sum(1 for node in nodes if node.category == NodeCategory.Switch.name)
+    if switches == 0:
+        return CUT_PEER
+    if switches == 1 and any(node.category != NodeCategory.Switch.name and is_router(node) for node in nodes):
+        return CUT_ROUTER_LAN
+    return CUT_LAN
+
+
+@auto_str(filter_attrs={'cut_links'})
+class Partition:
+    """node ids of every shard, weights of the shards and the links between shards"""
+
+    def __init__(self, shards, weights, cut_links, cut_cost):
+        self.shards = shards
+        self.weights = weights
+        self.cut_links = cut_links
+        self.cut_cost = cut_cost
+
+    @property
+    def assignment(self):
+        return {node_id: i for i, node_ids in enumerate(self.shards) for node_id in node_ids}
+
+
+@auto_str()
+class Stitch:
+    """one side of a cut link, node/port in this shard and its peer in another"""
+
+    __slots__ = ('link_id', 'node_id', 'port_index', 'peer_shard', 'peer_node_id', 'peer_port_index')
+
+    def __init__(self, link_id, node_id, port_index, peer_shard, peer_node_id, peer_port_index):
+        self.link_id = link_id
+        self.node_id = node_id
+        self.port_index = port_index
+        self.peer_shard = peer_shard
+        self.peer_node_id = peer_node_id
+        self.peer_port_index = peer_port_index
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        self.parent[self.find(a)] = self.find(b)
+
+
+def partition_topology(topology: Topology, shard_count, tolerance=DEFAULT_TOLERANCE):
+    """split topology into shard_count shards of about the same node_weight(), cutting cheap links
+
+    lans (a switch with its hosts) are kept whole unless one alone is heavier than a shard, so cuts
+    fall on router to router links first, then on router to lan links. shards are grown one by one
+    from the edge of the graph, then single groups are moved between shards while that lowers the
+    cut cost and keeps every shard within tolerance of the mean weight.
+    """
+    with instrument.stage('partition'):
+        nodes = list(topology.nodes.values())
+        index = {node.id: i for i, node in enumerate(nodes)}
+        weights = [node_weight(node) for node in nodes]
+        links = dict()
+        for node in nodes:
+            for port in node.ports:
+                if port.link is not None:
+                    links[port.link.id] = port.link
+        edges = [(index[link.port1.node.id], index[link.port2.node.id], link_cost(link)) for link in links.values()]
+
+        shard_count = max(1, min(shard_count, len(nodes)))
+        target = sum(weights) / shard_count
+        max_weight = target * (1 + tolerance)
+
+        groups = _groups(len(nodes), weights, edges, max_weight)
+        group_of = [0] * len(nodes)
+        for g, members in enumerate(groups):
+            for i in members:
+                group_of[i] = g
+        group_weights = [sum(weights[i] for i in members) for members in groups]
+
+        adjacency = [dict() for _ in groups]
+        for a, b, cost in edges:
+            ga, gb = group_of[a], group_of[b]
+            if ga != gb:
+                adjacency[ga][gb] = adjacency[ga].get(gb, 0) + cost
+                adjacency[gb][ga] = adjacency[gb].get(ga, 0) + cost
+
+        shard_of = _grow(group_weights, adjacency, shard_count)
+        _refine(shard_of, group_weights, adjacency, shard_count, target, tolerance)
+
+        shards = [[] for _ in range(shard_count)]
+        shard_weights = [0.0] * shard_count
+        for g, members in enumerate(groups):
+            for i in members:
+                shards[shard_of[g]].append(nodes[i].id)
+            shard_weights[shard_of[g]] += group_weights[g]
+
+        cut_links = []
+        cut_cost = 0
+        for link, (a, b, cost) in zip(links.values(), edges):
+            if shard_of[group_of[a]] != shard_of[group_of[b]]:
+                cut_links.append(link)
+                cut_cost += cost
+        instrument.count('cut_links', len(cut_links))
+        return Partition(shards, shard_weights, cut_links, cut_cost)
+
+
+def _groups(size, weights, edges, max_weight):
+    """node indexes kept together: switches with what hangs on them inside a lan"""
+    union_find = _UnionFind(size)
+    for a, b, cost in edges:
+        if cost == CUT_LAN:
+            union_find.union(a, b)
+
+    members = dict()
+    for i in range(size):
+        members.setdefault(union_find.find(i), []).append(i)
+
+    groups = []
+    for group in members.values():
+        if len(group) > 1 and sum(weights[i] for i in group) > max_weight:
+            # a lan heavier than a shard has to be cut
+            groups.extend([i] for i in group)
+        else:
+            groups.append(group)
+    return groups
+
+
+def _grow(weights, adjacency, shard_count):
+    """assign groups to shards by growing each shard from a group with few neighbors"""
+    shard_of = [None] * len(weights)
+    unassigned = set(range(len(weights)))
+    remaining = sum(weights)
+
+    # seeds in order of preference, sorted once, next_seed[0] skips past assigned groups
+    seeds = sorted(range(len(weights)), key=lambda g: (len(adjacency[g]), -weights[g], g))
+    next_seed = [0]
+
+    def seed():
+        while seeds[next_seed[0]] not in unassigned:
+            next_seed[0] += 1
+        return seeds[next_seed[0]]
+
+    for shard in range(shard_count):
+        if not unassigned:
+            break
+        last = shard == shard_count - 1
+        # share of what is left, so rounding errors of whole groups don't pile up on the last shard
+        target = remaining / (shard_count - shard)
+        shard_weight = 0.0
+        # max heap of connection to the shard, entries are refreshed lazily
+        connection = dict()
+        heap = []
+        while unassigned and (last or shard_weight < target):
+            while heap and (heap[0][2] not in unassigned or -heap[0][0] != connection.get(heap[0][2], 0)):
+                heapq.heappop(heap)
+            g = heapq.heappop(heap)[2] if heap else seed()
+
+            if not last and shard_weight > 0 and shard_weight + weights[g] - target > target - shard_weight:
+                # overshooting more than stopping short
+                break
+
+            unassigned.discard(g)
+            shard_of[g] = shard
+            shard_weight += weights[g]
+            remaining -= weights[g]
+            for neighbor, cost in adjacency[g].items():
+                if neighbor in unassigned:
+                    connection[neighbor] = connection.get(neighbor, 0) + cost
+                    heapq.heappush(heap, (-connection[neighbor], weights[neighbor], neighbor))
+
+    for g in unassigned:
+        shard_of[g] = shard_count - 1
+    return shard_of
+
+
+def _refine(shard_of, weights, adjacency, shard_count, target, tolerance):
+    """move single groups to a neighbor shard while it lowers the cut and keeps balance"""
+    shard_weights = [0.0] * shard_count
+    for g, shard in enumerate(shard_of):
+        shard_weights[shard] += weights[g]
+    low, high = target * (1 - tolerance), target * (1 + tolerance)
+
+    for _ in range(REFINE_PASSES):
+        moved = False
+        for g in range(len(shard_of)):
+            current = shard_of[g]
+            connection = dict()
+            for neighbor, cost in adjacency[g].items():
+                connection[shard_of[neighbor]] = connection.get(shard_of[neighbor], 0) + cost
+            if len(connection) < 2 and current in connection:
+                continue
+
+            best, best_gain = None, 0
+            for shard, cost in connection.items():
+                gain = cost - connection.get(current, 0)
+                if shard != current and gain > best_gain and shard_weights[shard] + weights[g] <= high and \
+                        shard_weights[current] - weights[g] >= low:
+                    best, best_gain = shard, gain
+            if best is not None:
+                shard_of[g] = best
+                shard_weights[current] -= weights[g]
+                shard_weights[best] += weights[g]
+                moved = True
+        if not moved:
+            break
+
+
+def shard_stitches(partition):
+    """[[Stitch]] of every shard, both sides of every cut link"""
+    assignment = partition.assignment
+    stitches = [[] for _ in partition.shards]
+    for link in partition.cut_links:
+        for port, peer in ((link.port1, link.port2), (link.port2, link.port1)):
+            stitches[assignment[port.node.id]].append(Stitch(
+                link.id, port.node.id, port.index, assignment[peer.node.id], peer.node.id, peer.index))
+    return stitches
+
+
+class CadtsShardExporter(TopologyExporter):
+    """export one shard: its nodes like CadtsTopologyExporter, then its stitch entries
+
+    interfaces of cut links keep toNode/toPort of their peer in the other shard, the stitch entry
+    tells which shard that is.
+    """
+
+    def __init__(self, shard, shard_count, stitches):
+        self.shard = shard
+        self.shard_count = shard_count
+        self.stitches = stitches
+
+    def export(self, topology: Topology, fp=None):
+        if fp is None:
+            f = io.StringIO()
+            self.export(topology, f)
+            return f.getvalue()
+
+        with instrument.stage('export'):
+            write = _chunk_writer(fp)
+            write(['<?xml version="1.0" encoding="UTF-8"?>\n'])
+            write(['<topo _v="2.0" shard="{}" shards="{}">\n'.format(self.shard, self.shard_count)])
+            for node in topology.nodes.values():
+                chunks = []
+                _write_node(chunks, node)
+                write(chunks)
+            for stitch in self.stitches:
+                write(['\t<stitch link="{}" node="{}" port="{}" peerShard="{}" peerNode="{}" peerPort="{}"/>\n'
+                       .format(stitch.link_id, _escape(stitch.node_id), stitch.port_index, stitch.peer_shard,
+                               _escape(stitch.peer_node_id), stitch.peer_port_index)])
+            write(['</topo>\n'])
+            count_exported(topology)
+
+
+def _export_shard(records, shard, shard_count, stitches, path):
+    topology = records_topology(records)
+    with open(path, 'wb') as f:
+        CadtsShardExporter(shard, shard_count, stitches).export(topology, f)
+    return path
+
+
+def shard_path(output, shard):
+    """path of shard of output file name, x.xml -> x.shard-0.xml"""
+    stem, suffix = os.path.splitext(output)
+    return '{}.shard-{}{}'.format(stem, shard, suffix)
+
+
+def export_shards(topology, partition, output, workers=None):
+    """export every shard of partition next to output, in a process pool if workers > 1
+
+    return the paths written, see shard_path().
+    """
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    stitches = shard_stitches(partition)
+    shard_count = len(partition.shards)
+    jobs = [(node_records(topology, node_ids), i, shard_count, stitches[i], shard_path(output, i))
+            for i, node_ids in enumerate(partition.shards)]
+
+    if workers and workers > 1 and shard_count > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, shard_count)) as executor:
+            return list(executor.map(_export_shard, *zip(*jobs)))
+    else:
+        return [_export_shard(*job) for job in jobs]
@@ -0,0 +1,229 @@
+import abc
+import asyncio
+import logging
+import random
+
+from scbr.scene import NodeRole
+from scbr.topo import Topology, NodeCategory
+from scbr.utils import auto_str
+
+LOG = logging.getLogger(__name__)
+
+WAVE_NETWORKS = 'networks'
+WAVE_ROUTERS = 'routers'
+WAVE_HOSTS = 'hosts'
+
+STEP_NODE = 'node'
+STEP_LINK = 'link'
+
+EVENT_START = 'start'
+EVENT_DONE = 'done'
+EVENT_RETRY = 'retry'
+EVENT_FAILED = 'failed'
+
+
+@auto_str()
+class Step:
+    """create one node, or one point to point link (a network of its own) of the topology"""
+
+    __slots__ = ('kind', 'target')
+
+    def __init__(self, kind, target):
+        self.kind = kind
+        self.target = target
+
+    @property
+    def id(self):
+        return self.target.id
+
+
+@auto_str()
+class Wave:
+    """steps that don't depend on each other, run in parallel"""
+
+    __slots__ = ('name', 'steps')
+
+    def __init__(self, name, steps=None):
+        self.name = name
+        self.steps = steps if steps else []
+
+
+def is_router(node):
+    """whether node is a router of the scene
+
+    nodes of imported topologies have no role, there routers are guessed: nodes without control
+    nic that carry route_list, join several networks or link to another node. attackers have routes
+    too, but keep their control nic.
+    """
+    if node.role:
+        return node.role == NodeRole.ROUTER.name
+    if node.category == NodeCategory.Switch.name or '_noControlNic' not in node.options:
+        return False
+    if node.options.get('route_list', None) or len(node.ports) > 1:
+        return True
+    return any(port.link is not None and port.link.adjacent_port(port).node.category != NodeCategory.Switch.name
+               for port in node.ports)
+
+
+def plan_waves(topology: Topology):
+    """order topology into waves: switches and point to point links, then routers, then hosts
+
+    interfaces attach to existing networks when their node is created, so a node only waits for
+    networks. routers come before hosts so hosts find their gateways up. nodes without
+    _noControlNic also get a control network nic, which is outside of the topology.
+    """
+    networks = Wave(WAVE_NETWORKS)
+    routers = Wave(WAVE_ROUTERS)
+    hosts = Wave(WAVE_HOSTS)
+
+    seen_links = set()
+    for node in topology.nodes.values():
+        if node.category == NodeCategory.Switch.name:
+            networks.steps.append(Step(STEP_NODE, node))
+            continue
+
+        for port in node.ports:
+            link = port.link
+            if link is None or link.id in seen_links:
+                continue
+            if link.adjacent_port(port).node.category != NodeCategory.Switch.name:
+                seen_links.add(link.id)
+                networks.steps.append(Step(STEP_LINK, link))
+
+        (routers if is_router(node) else hosts).steps.append(Step(STEP_NODE, node))
+
+    return [wave for wave in (networks, routers, hosts) if wave.steps]
+
+
+class Provisioner(metaclass=abc.ABCMeta):
+    """creates topology entities on the target platform, called concurrently"""
+
+    @abc.abstractmethod
+    async def provision_node(self, node):
+        pass
+
+    @abc.abstractmethod
+    async def provision_link(self, link):
+        pass
+
+
+@auto_str()
+class Progress:
+    """event of a step, passed to the progress callback
+
+    done/total count finished steps of the whole plan.
+    """
+
+    __slots__ = ('event', 'wave', 'step', 'attempt', 'error', 'done', 'total')
+
+    def __init__(self, event, wave, step, attempt, error, done, total):
+        self.event = event
+        self.wave = wave
+        self.step = step
+        self.attempt = attempt
+        self.error = error
+        self.done = done
+        self.total = total
+
+
+class ProvisionError(Exception):
+    def __init__(self, wave, failures):
+        super().__init__('{} of wave {} failed: {}'.format(
+            len(failures), wave.name, ', '.join('{} {}: {}'.format(step.kind, step.id, error)
+                                               for step, error in failures)))
+        self.wave = wave
+        self.failures = failures
+
+
+async def run_plan(waves, provisioner: Provisioner, concurrency=16, retries=2, retry_delay=0.5, callback=None):
+    """run waves one after another, the steps of a wave concurrently
+
+    at most concurrency steps run at the same time. a failed step is retried retries times, waiting
+    retry_delay, then twice as long, ... in between. if steps of a wave still fail, the wave is
+    finished and ProvisionError is raised, later waves are not started.
+    callback(Progress) is called on start, retry, success and failure of every step.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    total = sum(len(wave.steps) for wave in waves)
+    done = 0
+
+    def notify(event, wave, step, attempt, error=None):
+        if callback:
+            callback(Progress(event, wave, step, attempt, error, done, total))
+
+    async def run_step(wave, step):
+        nonlocal done
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with semaphore:
+                    notify(EVENT_START, wave, step, attempt)
+                    if step.kind == STEP_NODE:
+                        await provisioner.provision_node(step.target)
+                    else:
+                        await provisioner.provision_link(step.target)
+            except Exception as e:
+                if attempt > retries:
+                    done += 1
+                    notify(EVENT_FAILED, wave, step, attempt, e)
+                    return step, e
+                LOG.info("%s %s failed (attempt %d): %s", step.kind, step.id, attempt, e)
+                notify(EVENT_RETRY, wave, step, attempt, e)
+                # back off without holding a slot
+                await asyncio.sleep(retry_delay * (2 ** (attempt - 1)))
+            else:
+                done += 1
+                notify(EVENT_DONE, wave, step, attempt)
+                return step, None
+
+    for wave in waves:
+        results = await asyncio.gather(*(run_step(wave, step) for step in wave.steps))
+        failures = [(step, error) for step, error in results if error is not None]
+        if failures:
+            raise ProvisionError(wave, failures)
+
+
+async def provision_topology(topology, provisioner, **kwargs):
+    """plan_waves() and run_plan() with kwargs, return the waves"""
+    waves = plan_waves(topology)
+    await run_plan(waves, provisioner, **kwargs)
+    return waves
+
+
+class FakeProvisioner(Provisioner):
+    """provisioner for tests: sleeps latency (+ up to jitter) seconds per entity
+
+    failure_rate is the chance of a call to fail, fail_times maps node/link ids to the number of
+    their first calls that fail. created node and link ids are recorded in order.
+    """
+
+    def __init__(self, latency=0.01, jitter=0.0, failure_rate=0.0, fail_times=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.fail_times = dict(fail_times) if fail_times else dict()
+        self.created = []
+        self.running = 0
+        self.max_running = 0
+        self._random = random.Random(seed)
+
+    async def _create(self, entity_id):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+            if self.fail_times.get(entity_id, 0) > 0:
+                self.fail_times[entity_id] -= 1
+                raise Exception('fake failure of {}'.format(entity_id))
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                raise Exception('random fake failure of {}'.format(entity_id))
+            self.created.append(entity_id)
+        finally:
+            self.running -= 1
+
+    async def provision_node(self, node):
+        await self._create(node.id)
+
+    async def provision_link(self, link):
+        await self._create(link.id)
@@ -0,0 +1,180 @@
+import ipaddress
+from collections import deque
+
+from scbr.scene import RouteTable, RouteEntry
+
+
+class Segment:
+    """a L3 network shared by routers: a lan or a router to router link"""
+
+    __slots__ = ('net', 'members')
+
+    def __init__(self, net):
+        self.net = net
+        # router id -> ip of the router on this segment, None if unknown
+        self.members = dict()
+
+    def add_member(self, router_id, ip):
+        if ip is not None or router_id not in self.members:
+            self.members[router_id] = ip
+
+
+def build_segments(scene):
+    """L3 segments of scene routers, keyed by network"""
+    segments = dict()
+
+    def segment(net):
+        if net not in segments:
+            segments[net] = Segment(net)
+        return segments[net]
+
+    for router in scene.routers.values():
+        for port in router.ports:
+            if port.in_lan:
+                lan = scene.lans.get(port.in_lan.lan_id, None)
+                if lan is None or lan.net is None:
+                    continue
+                ip = ipaddress.ip_interface(port.in_lan.ip).ip if port.in_lan.ip else None
+                segment(lan.net).add_member(router.id, ip)
+            elif port.to_port:
+                to_port = port.to_port
+                if to_port.peer_node_id not in scene.routers:
+                    continue
+                if to_port.self_ip:
+                    net = to_port.self_ip.net
+                elif to_port.peer_ip:
+                    net = to_port.peer_ip.net
+                else:
+                    continue
+
+                s = segment(net)
+                s.add_member(router.id, to_port.self_ip.ip if to_port.self_ip else None)
+                s.add_member(to_port.peer_node_id, to_port.peer_ip.ip if to_port.peer_ip else None)
+    return segments
+
+
+def _adjacency(segments):
+    """router id -> [(neighbor router id, gateway ip of neighbor)], sorted for stable results"""
+    adjacency = dict()
+    for segment in segments.values():
+        for router_id in segment.members:
+            neighbors = adjacency.setdefault(router_id, [])
+            for other_id, ip in segment.members.items():
+                if other_id != router_id and ip is not None:
+                    neighbors.append((other_id, ip))
+
+    for neighbors in adjacency.values():
+        neighbors.sort(key=lambda neighbor: (neighbor[0], int(neighbor[1])))
+    return adjacency
+
+
+def _first_hops(source, adjacency):
+    """breadth first search from source, return {router id: (hops, gateway ip of first hop)}"""
+    result = {source: (0, None)}
+    queue = deque([source])
+    while queue:
+        router_id = queue.popleft()
+        hops, gateway = result[router_id]
+        for neighbor, ip in adjacency.get(router_id, ()):
+            if neighbor not in result:
+                result[neighbor] = (hops + 1, ip if gateway is None else gateway)
+                queue.append(neighbor)
+    return result
+
+
+def collapse_nets(nets, bits=32):
+    """collapse [(start, prefixlen, network or None)] of one ip version into minimal supernets
+
+    like ipaddress.collapse_addresses() but on integers, unchanged networks are kept as is.
+    bits is 32 for ipv4 and 128 for ipv6.
+    """
+    stack = []
+    for start, prefixlen, net in sorted(nets, key=lambda item: (item[0], item[1])):
+        if stack:
+            top_start, top_prefixlen, _ = stack[-1]
+            if start < top_start + (1 << (bits - top_prefixlen)):
+                # contained in previous
+                continue
+
+        stack.append((start, prefixlen, net))
+        while len(stack) >= 2:
+            a_start, a_prefixlen, _ = stack[-2]
+            b_start, b_prefixlen, _ = stack[-1]
+            size = 1 << (bits - a_prefixlen)
+            if a_prefixlen != b_prefixlen or a_prefixlen == 0 or a_start % (size * 2) or b_start != a_start + size:
+                break
+            stack[-2:] = [(a_start, a_prefixlen - 1, None)]
+    return stack
+
+
+def _to_network(version, start, prefixlen, net):
+    if net is not None:
+        return net
+    if version == 4:
+        return ipaddress.IPv4Network((start, prefixlen))
+    return ipaddress.IPv6Network((start, prefixlen))
+
+
+def compute_routes(scene, aggregate=True):
+    """shortest path (hop count) routes of every router to every lan and router link network
+
+    return {router id: [RouteEntry]}. directly connected networks get no entry. networks with the
+    same gateway are collapsed into supernets when aggregate is set.
+    """
+    segments = build_segments(scene)
+    adjacency = _adjacency(segments)
+
+    # networks reachable through a single router, and networks shared by several routers
+    owned_nets = dict()
+    shared_segments = []
+    for segment in segments.values():
+        if len(segment.members) == 1:
+            owner = next(iter(segment.members))
+            net = segment.net
+            owned_nets.setdefault(owner, []).append((net.version, int(net.network_address), net.prefixlen, net))
+        elif segment.members:
+            shared_segments.append(segment)
+
+    routes = dict()
+    for router_id in scene.routers:
+        reachable = _first_hops(router_id, adjacency)
+        by_gateway = dict()
+        for other_id, (_, gateway) in reachable.items():
+            if other_id != router_id and other_id in owned_nets:
+                by_gateway.setdefault(gateway, []).extend(owned_nets[other_id])
+
+        for segment in shared_segments:
+            if router_id in segment.members:
+                continue
+
+            best = None
+            for member_id in segment.members:
+                hop = reachable.get(member_id, None)
+                if hop is not None and (best is None or (hop[0], member_id) < best[:2]):
+                    best = (hop[0], member_id, hop[1])
+            if best is not None:
+                net = segment.net
+                by_gateway.setdefault(best[2], []).append((net.version, int(net.network_address), net.prefixlen, net))
+
+        entries = []
+        for gateway, nets in by_gateway.items():
+            for version, bits in ((4, 32), (6, 128)):
+                group = [(start, prefixlen, net) for v, start, prefixlen, net in nets if v == version]
+                if aggregate:
+                    group = collapse_nets(group, bits)
+                entries.extend((version, start, prefixlen, net, gateway) for start, prefixlen, net in group)
+
+        entries.sort(key=lambda entry: entry[:3])
+        routes[router_id] = [RouteEntry(_to_network(version, start, prefixlen, net), gateway)
+                             for version, start, prefixlen, net, gateway in entries]
+    return routes
+
+
+def synthesize_routes(scene, aggregate=True):
+    """fill synthesized_routes of every router of an adjusted scene
+
+    explicit route_table entries are kept and take precedence for the same target net, see
+    Router.fill_route_table(). calling it again replaces the previous synthesized routes.
+    """
+    for router_id, entries in compute_routes(scene, aggregate).items():
+        scene.routers[router_id].synthesized_routes = RouteTable(entries)
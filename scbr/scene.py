@@ -2,6 +2,7 @@ from enum import Enum
 import ipaddress
 import logging
 
+from scbr import instrument
 from scbr.topo import Topology, Node, NodeCategory
 from scbr.utils import auto_str
 
@@ -26,72 +27,138 @@ class Scene:
         self.templates = dict()
         self.env = Environment()
 
+        # hosts shadow routers with the same id, like query_node() always did
+        self._nodes = dict()
+        self._node_list = None
+        # nodes already resolved by adjust()
+        self._adjusted = set()
+        # ids of the templates adjust() made with NodeTemplate.default_template()
+        self._default_templates = set()
+        # node port -> (topology port, topology port of the peer or None) of the last extract_topology()
+        self._topology_ports = dict()
+
     def add_entity(self, entity):
         if isinstance(entity, Host):
+            self._replace_node(self._nodes.get(entity.id, None), entity)
             self.hosts[entity.id] = entity
+            self._nodes[entity.id] = entity
+        elif isinstance(entity, HostRange):
+            for host in entity.expand():
+                self.add_entity(host)
         elif isinstance(entity, Router):
+            self._replace_node(self.routers.get(entity.id, None), entity)
             self.routers[entity.id] = entity
+            if entity.id not in self.hosts:
+                self._nodes[entity.id] = entity
         elif isinstance(entity, Lan):
+            # members are collected again by adjust(), the lan may come from an earlier scene
+            entity.reset_members()
             self.lans[entity.id] = entity
+            self._adjusted.clear()
         elif isinstance(entity, NodeTemplate):
             self.templates[entity.id] = entity
+            self._adjusted.clear()
         else:
             raise Exception("unknown child type {}".format(type(entity)))
 
+    def _replace_node(self, old, new):
+        self._node_list = None
+        if old is not None and old is not new:
+            # other nodes may point to the replaced one
+            self._adjusted.clear()
+
+    def add_entities(self, entities):
+        for entity in entities:
+            if isinstance(entity, Environment):
+                self.env = entity
+            else:
+                self.add_entity(entity)
+
+                if isinstance(entity, Lan):
+                    for host in entity.hosts:
+                        self.add_entity(host)
+
     def adjust(self):
-        for node in self.node_list:
-            if node.template_id:
-                template = self.find_template(node.template_id)
-                if not template:
-                    template = NodeTemplate.default_template(node.template_id, node.role)
-                    self.templates[template.id] = template
-                node.template = template
-
-            # add host or router to lan
-            for port in node.ports:
-                if port.in_lan:
-                    port.lan = self.lans[port.in_lan.lan_id]
-                    if node not in port.lan.hosts:
-                        port.lan.hosts.append(node)
-                elif port.to_port:
-                    to_port = port.to_port
-                    to_port.peer_node = self.query_node(to_port.peer_node_id)
-                    if to_port.peer_port_name:
-                        to_port.peer_port = to_port.peer_node.query_port(to_port.peer_port_name)
+        """resolve templates, lans and peer ports of nodes
+
+        only nodes added since last call are resolved, unless a lan, template or existing node was
+        replaced in between.
+        """
+        with instrument.stage('adjust'):
+            adjusted = self._adjusted
+            adjusted_count = len(adjusted)
+            for node in self.node_list:
+                if node in adjusted:
+                    continue
+
+                if node.template_id:
+                    template = self.find_template(node.template_id)
+                    if not template:
+                        template = NodeTemplate.default_template(node.template_id, node.role)
+                        self.templates[template.id] = template
+                        self._default_templates.add(template.id)
+                        instrument.count('template_defaults')
+                    node.template = template
+
+                # add host or router to lan
+                for port in node.ports:
+                    if port.in_lan:
+                        port.lan = self.lans[port.in_lan.lan_id]
+                        port.lan.add_member(node)
+                    elif port.to_port:
+                        to_port = port.to_port
+                        to_port.peer_node = self.query_node(to_port.peer_node_id)
+                        if to_port.peer_port_name:
+                            to_port.peer_port = to_port.peer_node.query_port(to_port.peer_port_name)
+
+                adjusted.add(node)
+            instrument.count('nodes', len(adjusted) - adjusted_count)
 
     @property
     def node_list(self):
-        nodes = list(self.routers.values())
-        nodes.extend(self.hosts.values())
-        return nodes
+        if self._node_list is None:
+            nodes = list(self.routers.values())
+            nodes.extend(self.hosts.values())
+            self._node_list = nodes
+        return self._node_list
 
     def query_node(self, node_id):
-        if node_id in self.hosts:
-            return self.hosts[node_id]
-        elif node_id in self.routers:
-            return self.routers[node_id]
-        else:
+        node = self._nodes.get(node_id, None)
+        if node is None:
             raise Exception('host/router {} not found'.format(node_id))
+        return node
 
     def extract_topology(self):
-        topology = Topology()
-        for lan in self.lans.values():
-            node = lan.to_node(self)
-            topology.add_node(node)
-
-        for host in self.hosts.values():
-            node = host.to_node(self)
-            topology.add_node(node)
-
-        for router in self.routers.values():
-            node = router.to_node(self)
-            topology.add_node(node)
-
-        for node in self.node_list:
-            host = topology.query_node(node.id)
-            self.handle_ports(topology, node, host)
-
-        return topology
+        with instrument.stage('extract_topology'):
+            # connection state is per extraction, so the scene can be extracted again
+            for node in self.node_list:
+                for port in node.ports:
+                    port.connected = False
+            self._topology_ports = dict()
+
+            topology = Topology()
+            for lan in self.lans.values():
+                node = lan.to_node(self)
+                topology.add_node(node)
+
+            for host in self.hosts.values():
+                node = host.to_node(self)
+                topology.add_node(node)
+
+            for router in self.routers.values():
+                node = router.to_node(self)
+                topology.add_node(node)
+
+            for node in self.node_list:
+                host = topology.query_node(node.id)
+                self.handle_ports(topology, node, host)
+
+            if instrument.enabled():
+                port_count = sum(len(node.ports) for node in topology.nodes.values())
+                instrument.count('nodes', len(topology.nodes))
+                instrument.count('ports', port_count)
+                instrument.count('links', port_count // 2)
+            return topology
 
     def handle_ports(self, topology, entity, host):
         for port in entity.ports:
@@ -100,11 +167,8 @@ class Scene:
     def handle_port(self, topology, host, node_port):
         if node_port.in_lan:
             switch = topology.query_node(node_port.in_lan.lan_id)
-            lan = self.lans[node_port.in_lan.lan_id]
-            ip = node_port.in_lan.ip
             port, _ = host.link_to_node(switch)
-            if ip:
-                port.config_ip(ip, lan.net.netmask)
+            self._topology_ports[node_port] = (port, None)
         elif node_port.to_port:
             to_port = node_port.to_port
             other_host = topology.query_node(node_port.to_port.peer_node_id)
@@ -119,14 +183,127 @@ class Scene:
 
             p1 = host.add_port()
             p1.link_to_port(p2)
-            if to_port.self_ip:
-                p1.config_ip(to_port.self_ip.ip, to_port.self_ip.netmask)
-            if to_port.peer_ip:
-                p2.config_ip(to_port.peer_ip.ip, to_port.peer_ip.netmask)
-
+            self._topology_ports[node_port] = (p1, p2)
             node_port.connected = True
         else:
             LOG.info("port of %s without connection", host.name)
+            return
+        self.config_ports(node_port)
+
+    def config_ports(self, node_port):
+        """set the addresses of node_port on the topology ports extracted from it"""
+        port, peer = self._topology_ports[node_port]
+        if node_port.in_lan:
+            if node_port.in_lan.ip:
+                port.config_ip(node_port.in_lan.ip, self.lans[node_port.in_lan.lan_id].net.netmask)
+        else:
+            to_port = node_port.to_port
+            if to_port.self_ip:
+                port.config_ip(to_port.self_ip.ip, to_port.self_ip.netmask)
+            if to_port.peer_ip:
+                peer.config_ip(to_port.peer_ip.ip, to_port.peer_ip.netmask)
+
+    def replace_entities(self, entities, topology):
+        """put entities in place of the ones with the same ids, in this adjusted scene and topology extracted from it
+
+        entities must keep the graph: their hosts, routers and lans are in the scene already, with the
+        same ports, lans and peers. nodes pointing at replaced entities are resolved again, topology
+        nodes that may change are built again on their old ports and links. return the ids of those,
+        None if some entity doesn't fit, the scene is not changed then.
+        """
+        nodes = []
+        lans = []
+        for entity in entities:
+            if isinstance(entity, HostRange):
+                nodes.extend(entity.expand())
+            elif isinstance(entity, (Host, Router)):
+                nodes.append(entity)
+            elif isinstance(entity, Lan):
+                lans.append(entity)
+                nodes.extend(entity.hosts)
+
+        replaced = dict()
+        for node in nodes:
+            old = self._nodes.get(node.id, None)
+            if type(old) is not type(node) or node.id in self.lans or _connections(old) != _connections(node) or \
+                    (node.id in self.hosts and node.id in self.routers):
+                return None
+            replaced[old] = node
+        for lan in lans:
+            old = self.lans.get(lan.id, None)
+            if old is None or lan.id in self._nodes or \
+                    [host.id for host in old._declared] != [host.id for host in lan.hosts]:
+                return None
+
+        resolve = set(replaced.values())
+        extract = set()
+        template_ids = set()
+        for entity in entities:
+            if isinstance(entity, Environment):
+                self.env = entity
+                extract.update(node.id for node in self.node_list if node.role == NodeRole.ATTACKER)
+            elif isinstance(entity, NodeTemplate):
+                self.templates[entity.id] = entity
+                self._default_templates.discard(entity.id)
+                template_ids.add(entity.id)
+        # a default template is made for the first node using it, that may be a replaced one
+        for old, new in replaced.items():
+            for template_id in (old.template_id, new.template_id):
+                if template_id in self._default_templates:
+                    del self.templates[template_id]
+                    self._default_templates.discard(template_id)
+                    template_ids.add(template_id)
+
+        for lan in lans:
+            lan.reset_members()
+            self.lans[lan.id] = lan
+            extract.add(lan.id)
+        lan_ids = {lan.id for lan in lans}
+
+        kept_lans = set()
+        for old, new in replaced.items():
+            (self.hosts if isinstance(new, Host) else self.routers)[new.id] = new
+            self._nodes[new.id] = new
+            self._adjusted.discard(old)
+            for old_port, new_port in zip(old.ports, new.ports):
+                ports = self._topology_ports.pop(old_port, None)
+                if ports is not None:
+                    self._topology_ports[new_port] = ports
+                if old_port.lan is not None and old_port.lan.id not in lan_ids:
+                    kept_lans.add(old_port.lan)
+        for lan in kept_lans:
+            lan.replace_members(replaced)
+        self._node_list = None
+
+        replaced_ids = {node.id for node in replaced.values()}
+        for node in self.node_list:
+            if node.template_id in template_ids or any(
+                    port.in_lan.lan_id in lan_ids if port.in_lan else
+                    port.to_port is not None and port.to_port.peer_node_id in replaced_ids for port in node.ports):
+                resolve.add(node)
+        self._adjusted.difference_update(resolve)
+        self.adjust()
+
+        extract.update(node.id for node in resolve)
+        for node_id in extract:
+            entity = self.lans[node_id] if node_id in self.lans else self._nodes[node_id]
+            old = topology.nodes[node_id]
+            node = entity.to_node(self)
+            node.ports = old.ports
+            node.next_port_index = old.next_port_index
+            for port in node.ports:
+                port.node = node
+            topology.nodes[node_id] = node
+            if isinstance(entity, Lan):
+                continue
+            for node_port in entity.ports:
+                ports = self._topology_ports.get(node_port, None)
+                if ports is not None:
+                    for port in ports:
+                        if port is not None:
+                            port.options = dict()
+                    self.config_ports(node_port)
+        return extract
 
     def find_template(self, template_id):
         if template_id in self.templates:
@@ -135,8 +312,17 @@ class Scene:
             return None
 
 
+def _connections(node):
+    """what the ports of node connect to, addresses left out"""
+    return [(port.name, port.in_lan.lan_id if port.in_lan else None,
+             (port.to_port.peer_node_id, port.to_port.peer_port_name) if port.to_port else None)
+            for port in node.ports]
+
+
 @auto_str()
 class Environment:
+    __slots__ = ('external_net_list', 'control_net_gateway')
+
     def __init__(self):
         self.external_net_list = []
         self.control_net_gateway = None
@@ -144,6 +330,8 @@ class Environment:
 
 @auto_str()
 class NodeTemplate:
+    __slots__ = ('id', 'category', 'emulation', 'os', 'image')
+
     def __init__(self, template_id):
         self.id = template_id
         self.category = NodeCategory.Host
@@ -176,6 +364,8 @@ class NodeTemplate:
 
 
 class RouteEntry:
+    __slots__ = ('target_net', 'gateway')
+
     def __init__(self, target_net, gateway):
         self.target_net = target_net
         self.gateway = gateway
@@ -183,6 +373,8 @@ class RouteEntry:
 
 @auto_str()
 class RouteTable:
+    __slots__ = ('entries',)
+
     def __init__(self, entries=None):
         self.entries = entries if entries else []
 
@@ -194,6 +386,8 @@ class RouteTable:
 
 
 class HostBase:
+    __slots__ = ('id', 'role', 'name', 'template', 'template_id', 'ports', 'options', 'flags', '_port_index')
+
     def __init__(self, id_, role):
         self.id = id_
         self.role = role
@@ -204,8 +398,13 @@ class HostBase:
         self.options = dict()
         self.flags = []
 
+        # port name -> port, None until query_port() builds it
+        self._port_index = None
+
     def to_node(self, scene):
-        node = Node(self.id, self.name, NodeCategory.Host, self.template_id, self.options)
+        # copy options, node adds physic and route options to them
+        options = {k: list(v) if isinstance(v, list) else v for k, v in self.options.items()}
+        node = Node(self.id, self.name, NodeCategory.Host, self.template_id, options, self.role)
         if self.template_id:
             node.emulation = self.template.emulation
             node.os = self.template.os
@@ -221,27 +420,101 @@ class HostBase:
         node.use_default_physic()
         return node
 
+    def add_port(self, port):
+        self.ports.append(port)
+        if self._port_index is not None and port.name is not None:
+            self._port_index.setdefault(port.name, port)
+
+    def ports_changed(self):
+        """call after changing ports other than with add_port()"""
+        self._port_index = None
+
     def query_port(self, port_name):
-        for port in self.ports:
-            if port.name == port_name:
-                return port
+        if self._port_index is None:
+            self._port_index = dict()
+            for port in self.ports:
+                if port.name is not None:
+                    self._port_index.setdefault(port.name, port)
 
-        raise Exception('port {} on node {} not found'.format(port_name, self.name))
+        port = self._port_index.get(port_name, None)
+        if port is None:
+            raise Exception('port {} on node {} not found'.format(port_name, self.name))
+        return port
 
 
 @auto_str()
 class Host(HostBase):
+    __slots__ = ('in_lan', 'is_global_dns_server')
+
     def __init__(self, id_, role):
         super().__init__(id_, role)
         self.in_lan = None
         self.is_global_dns_server = False
 
 
+@auto_str()
+class HostRange:
+    """hosts declared at once, pc[1..500] in the scene language, expanded by Scene.add_entity()
+
+    expanded hosts share options, flags and template of prototype, they differ in id, name and
+    lan address only. the lan address of prototype, if any, is the one of the first host.
+    """
+    __slots__ = ('id', 'prototype', 'prefix', 'start', 'end', 'width')
+
+    def __init__(self, prototype, start, end, width=0):
+        if end < start:
+            raise Exception('empty host range {}[{}..{}]'.format(prototype.id, start, end))
+        if any(port.in_lan is not prototype.in_lan for port in prototype.ports):
+            raise Exception('host range {}[{}..{}] can only have a lan port'.format(prototype.id, start, end))
+
+        self.id = '{}[{}..{}]'.format(prototype.id, str(start).zfill(width), end)
+        self.prototype = prototype
+        self.prefix = prototype.id
+        self.start = start
+        self.end = end
+        self.width = width
+
+    def __len__(self):
+        return self.end - self.start + 1
+
+    def host_id(self, number):
+        return '{}{}'.format(self.prefix, str(number).zfill(self.width))
+
+    def expand(self):
+        """new Host of every number of the range"""
+        prototype = self.prototype
+        in_lan = prototype.in_lan
+        ip = suffix = None
+        if in_lan is not None and in_lan.ip:
+            address, _, mask = in_lan.ip.partition('/')
+            ip = ipaddress.ip_address(address)
+            suffix = '/' + mask if mask else ''
+
+        hosts = []
+        for offset, number in enumerate(range(self.start, self.end + 1)):
+            host = Host(self.host_id(number), prototype.role)
+            if prototype.name != prototype.id:
+                host.name = '{} {}'.format(prototype.name, number)
+            host.template_id = prototype.template_id
+            host.options = prototype.options
+            host.flags = prototype.flags
+            host.is_global_dns_server = prototype.is_global_dns_server
+            if in_lan is not None:
+                host.in_lan = HostInLan(in_lan.lan_id, str(ip + offset) + suffix if ip is not None else None)
+                host.add_port(NodePort(host.in_lan))
+            hosts.append(host)
+        return hosts
+
+
 @auto_str()
 class Router(HostBase):
+    __slots__ = ('route_table', 'synthesized_routes')
+
     def __init__(self, id_):
         super().__init__(id_, NodeRole.ROUTER)
         self.route_table = RouteTable()
+        # filled by scbr.routing.synthesize_routes()
+        self.synthesized_routes = RouteTable()
 
     def to_node(self, scene):
         node = super().to_node(scene)
@@ -249,12 +522,21 @@ class Router(HostBase):
         return node
 
     def fill_route_table(self, node):
+        """explicit entries first, then synthesized entries for other target nets"""
+        explicit_nets = set()
         for entry in self.route_table.entries:
             node.add_route_entry(entry.target_net, entry.gateway)
+            explicit_nets.add(entry.target_net)
+
+        for entry in self.synthesized_routes.entries:
+            if entry.target_net not in explicit_nets:
+                node.add_route_entry(entry.target_net, entry.gateway)
 
 
 @auto_str()
 class Lan:
+    __slots__ = ('id', 'name', 'net', 'hosts', 'role', '_members', '_declared')
+
     def __init__(self, id_):
         self.id = id_
         self.name = id_
@@ -262,12 +544,33 @@ class Lan:
         self.hosts = []
         self.role = NodeRole.SWITCH
 
+        self._members = set()
+        # hosts declared inside the lan, hosts has members added by adjust() too
+        self._declared = []
+
     def add_host(self, host):
         host.in_lan = HostInLan(self.id, None)
-        self.hosts.append(host)
+        self._declared.append(host)
+        self.add_member(host)
+
+    def add_member(self, node):
+        if node not in self._members:
+            self._members.add(node)
+            self.hosts.append(node)
+
+    def replace_members(self, replaced):
+        """put replaced[node] in place of every member node that is a key of replaced"""
+        self.hosts = [replaced.get(node, node) for node in self.hosts]
+        self._members = set(self.hosts)
+
+    def reset_members(self):
+        """forget members added by adjust(), keep declared hosts"""
+        if len(self.hosts) != len(self._declared):
+            self.hosts = list(self._declared)
+            self._members = set(self._declared)
 
     def to_node(self, scene):
-        node = Node(self.id, self.name, NodeCategory.Switch, "/switch")
+        node = Node(self.id, self.name, NodeCategory.Switch, "/switch", role=self.role)
         node.os = ''
         node.image = '/images/交换机.png'
         node.emulation = ''
@@ -276,6 +579,8 @@ class Lan:
 
 @auto_str()
 class IpWithMask:
+    __slots__ = ('ip', 'net')
+
     def __init__(self, s):
         ip, _ = s.split('/')
         self.ip = ipaddress.ip_address(ip)
@@ -292,6 +597,8 @@ class IpWithMask:
 
 @auto_str()
 class PortToPort:
+    __slots__ = ('peer_node_id', 'peer_port_name', 'self_ip', 'peer_ip', 'peer_node', 'peer_port')
+
     def __init__(self, node_id):
         self.peer_node_id = node_id
         self.peer_port_name = None
@@ -306,15 +613,22 @@ class PortToPort:
 
 @auto_str()
 class NodePort:
+    __slots__ = ('name', 'in_lan', 'to_port', 'connected', 'lan')
+
     def __init__(self, in_lan_or_to_port, name=None):
         self.name = name
         self.in_lan = in_lan_or_to_port if isinstance(in_lan_or_to_port, HostInLan) else None
         self.to_port = in_lan_or_to_port if isinstance(in_lan_or_to_port, PortToPort) else None
         self.connected = False
 
+        # fill with scene.adjust()
+        self.lan = None
+
 
 @auto_str()
 class HostInLan:
+    __slots__ = ('lan_id', 'ip')
+
     def __init__(self, lan_id, ip):
         self.lan_id = lan_id
         self.ip = ip
@@ -326,6 +640,8 @@ class FlagType(Enum):
 
 
 class Flag:
+    __slots__ = ('type', 'name', 'score', 'content')
+
     def __init__(self, type_, name, score, content):
         self.type = type_
         self.name = name
@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import collections
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from scbr.lang.parser import get_parser, parse_entities, include_order, include_path, Include, PARSER_EARLEY, \
+    PARSER_LALR, PARSER_LALR_INLINE
+from scbr.scene import Scene, NodeTemplate, Environment
+from scbr.tools import export_scene, OUTPUT_FORMATS, FORMAT_XML, FORMAT_JSON, FORMAT_JSONL
+from scbr.utils import auto_str
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_PENDING = 64
+DEFAULT_TIMEOUT = 10.0
+MAX_BODY = 16 * 1024 * 1024
+CONTENT_TYPES = {
+    FORMAT_XML: 'application/xml; charset=utf-8',
+    FORMAT_JSON: 'application/json',
+    FORMAT_JSONL: 'application/x-ndjson',
+}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           422: 'Unprocessable Entity', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+# entities of template/env only sources parsed by this worker, keyed by content digest
+_shared_sources = collections.OrderedDict()
+SHARED_SOURCES_LIMIT = 256
+
+
+def warm_up(parser=PARSER_LALR_INLINE):
+    """load the parser of a worker before its first request"""
+    get_parser(parser)
+
+
+def _source_entities(content, parser):
+    key = hashlib.sha256(content.encode('utf-8')).digest()
+    entities = _shared_sources.get(key, None)
+    if entities is not None:
+        _shared_sources.move_to_end(key)
+        return entities
+
+    entities = parse_entities(content, parser)
+    if all(isinstance(entity, (NodeTemplate, Environment, Include)) for entity in entities):
+        # not changed by adjust(), reused by later requests
+        _shared_sources[key] = entities
+        if len(_shared_sources) > SHARED_SOURCES_LIMIT:
+            _shared_sources.popitem(last=False)
+    return entities
+
+
+def compile_sources(sources, parser=PARSER_LALR_INLINE, validate=False, auto_route=False, auto_address=False,
+                    output_format=FORMAT_XML, layout=False):
+    """compile in memory sources, [(name, content)] in merge order like the files of a scenario
+
+    includes refer to other sources by name, relative to the name of the including source.
+    return (exported topology as bytes, None) or (None, error message).
+    """
+    try:
+        contents = {os.path.normpath(name): content for name, content in sources}
+        parsed = dict()
+
+        def entities_of(name):
+            if name not in parsed:
+                parsed[name] = _source_entities(contents[name], parser)
+            return parsed[name]
+
+        def includes_of(name):
+            return [include_path(name, entity.path) for entity in entities_of(name) if isinstance(entity, Include)]
+
+        scene = Scene()
+        seen = set()
+        for name, _ in sources:
+            for source in include_order(name, includes_of, seen, contents.__contains__):
+                scene.add_entities(entity for entity in entities_of(source) if not isinstance(entity, Include))
+
+        f = io.BytesIO()
+        export_scene(scene, f, validate, auto_route, auto_address, output_format, layout)
+        return f.getvalue(), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceMetrics:
+    """request counts by status, latency percentiles and throughput of the latest window compiles"""
+
+    def __init__(self, window=1024):
+        self.started = time.monotonic()
+        self.statuses = collections.Counter()
+        # (finish time, seconds) of latest compile requests
+        self.latencies = collections.deque(maxlen=window)
+
+    def record(self, status, seconds):
+        self.statuses[status] += 1
+        self.latencies.append((time.monotonic(), seconds))
+
+    def snapshot(self, pending=0):
+        now = time.monotonic()
+        uptime = now - self.started
+        seconds = sorted(latency for _, latency in self.latencies)
+
+        def percentile(p):
+            return seconds[min(len(seconds) - 1, int(p * len(seconds)))] if seconds else None
+
+        window_start = self.latencies[0][0] if self.latencies else now
+        return {
+            'uptime': uptime,
+            'requests': sum(self.statuses.values()),
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'pending': pending,
+            'latency': {
+                'count': len(seconds),
+                'mean': sum(seconds) / len(seconds) if seconds else None,
+                'p50': percentile(0.5),
+                'p90': percentile(0.9),
+                'p99': percentile(0.99),
+                'max': seconds[-1] if seconds else None,
+            },
+            'throughput': {
+                'total': sum(self.statuses.values()) / uptime if uptime else 0.0,
+                'recent': len(seconds) / (now - window_start) if now > window_start else 0.0,
+            },
+        }
+
+
+@auto_str()
+class _Request:
+    __slots__ = ('method', 'path', 'headers', 'body', 'keep_alive')
+
+    def __init__(self, method, path, headers, body, keep_alive):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.keep_alive = keep_alive
+
+
+class CompileService:
+    """compile scenes sent over http, with parsers kept warm in a process pool
+
+        POST /compile  {"sources": [{"name": "a.scene", "content": "..."}, ...], "format": "xml",
+                        "validate": false, "autoRoute": false, "autoAddress": false, "layout": false}
+                       -> exported topology, 422 with the error if the scene doesn't compile
+        GET /metrics   -> ServiceMetrics.snapshot() as json
+        GET /health    -> ok
+
+    sources are merged in order, see compile_sources(). at most max_pending compiles run or wait
+    for a worker, more are rejected with 503. a compile taking longer than timeout seconds is
+    answered with 504, it keeps its worker and counts as pending until done unless it hasn't
+    started yet.
+    """
+
+    def __init__(self, workers=None, parser=PARSER_LALR_INLINE, max_pending=DEFAULT_MAX_PENDING,
+                 timeout=DEFAULT_TIMEOUT, max_body=MAX_BODY):
+        self.parser = parser
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_body = max_body
+        self.metrics = ServiceMetrics()
+        self.workers = workers if workers else os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up, initargs=(parser,))
+        self._pending = 0
+
+    async def compile(self, request):
+        """compile request, the decoded json of POST /compile, return (content type, content)"""
+        try:
+            sources = [(source['name'], source['content']) for source in request['sources']]
+            output_format = request.get('format', FORMAT_XML)
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError('unknown format {}'.format(output_format))
+            options = (bool(request.get('validate', False)), bool(request.get('autoRoute', False)),
+                       bool(request.get('autoAddress', False)), output_format, bool(request.get('layout', False)))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ServiceError(400, 'bad compile request: {}'.format(e))
+        if not sources:
+            raise ServiceError(400, 'bad compile request: no sources')
+
+        if self._pending >= self.max_pending:
+            raise ServiceError(503, 'too many pending compiles')
+        loop = asyncio.get_running_loop()
+        job = self.executor.submit(compile_sources, sources, self.parser, *options)
+        # a timed out compile stays pending until its worker is done with it
+        self._pending += 1
+        job.add_done_callback(lambda _: self._job_done(loop))
+        try:
+            content, error = await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+        except asyncio.TimeoutError:
+            raise ServiceError(504, 'compile took longer than {}s'.format(self.timeout))
+
+        if error is not None:
+            raise ServiceError(422, error)
+        return CONTENT_TYPES[output_format], content
+
+    def _job_done(self, loop):
+        # called in an executor thread, or right away if the job is cancelled before it started
+        try:
+            loop.call_soon_threadsafe(self._finished)
+        except RuntimeError:
+            # loop closed, nothing left to limit
+            pass
+
+    def _finished(self):
+        self._pending -= 1
+
+    async def dispatch(self, request):
+        """return (status, content type, body) of request"""
+        if request.path == '/compile':
+            if request.method != 'POST':
+                return 405, 'text/plain', b'use POST\n'
+            start = time.perf_counter()
+            try:
+                content_type, content = await self.compile(json.loads(request.body.decode('utf-8')))
+                status = 200
+            except ServiceError as e:
+                status, content_type, content = e.status, 'text/plain; charset=utf-8', str(e).encode('utf-8')
+            except ValueError as e:
+                status, content_type, content = 400, 'text/plain; charset=utf-8', 'bad json: {}\n'.format(e).encode()
+            self.metrics.record(status, time.perf_counter() - start)
+            return status, content_type, content
+        elif request.path == '/metrics':
+            return 200, 'application/json', json.dumps(self.metrics.snapshot(self._pending)).encode('utf-8')
+        elif request.path == '/health':
+            return 200, 'text/plain', b'ok\n'
+        else:
+            return 404, 'text/plain', b'not found\n'
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise ServiceError(400, 'bad request line')
+
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise ServiceError(400, 'bad content-length')
+        if length > self.max_body:
+            raise ServiceError(413, 'body larger than {} bytes'.format(self.max_body))
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        return _Request(method, target.split('?', 1)[0], headers, body, keep_alive)
+
+    async def handle_connection(self, reader, writer):
+        """serve http/1.1 requests of one connection, kept alive unless the client closes it"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ServiceError as e:
+                    # the stream can't be trusted any more
+                    self._write_response(writer, e.status, 'text/plain', str(e).encode('utf-8'), False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                status, content_type, body = await self.dispatch(request)
+                self._write_response(writer, status, content_type, body, request.keep_alive)
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write_response(writer, status, content_type, body, keep_alive):
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+            status, REASONS.get(status, ''), content_type, len(body), 'keep-alive' if keep_alive else 'close')
+            .encode('latin-1'))
+        writer.write(body)
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT, unix_path=None):
+        """listen on host:port, or on unix socket unix_path, return the asyncio server"""
+        # start workers now, not with the first request
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, warm_up, self.parser)
+                               for _ in range(self.workers)))
+        if unix_path:
+            return await asyncio.start_unix_server(self.handle_connection, unix_path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+async def serve(service, host='127.0.0.1', port=DEFAULT_PORT, unix_path=None):
+    server = await service.start(host, port, unix_path)
+    LOG.warning("compile service listening on %s", unix_path or '{}:{}'.format(host, port))
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+        service.close()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m scbr.service', description='scene compile service')
+    arg_parser.add_argument('-v', '--verbose', action='store_true', help='verbose logging')
+    arg_parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    arg_parser.add_argument('--unix', default=None, help='listen on this unix socket instead')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    arg_parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                            help='compiles running or queued before requests are rejected')
+    arg_parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds per compile')
+    arg_parser.add_argument('--parser', default=PARSER_LALR_INLINE,
+                            choices=(PARSER_EARLEY, PARSER_LALR, PARSER_LALR_INLINE), help='parser mode')
+    args = arg_parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    service = CompileService(args.jobs, args.parser, args.max_pending, args.timeout)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import bisect
+import hashlib
+import hmac
+import ipaddress
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from scbr import instrument
+from scbr.layout import layout_topology, apply_layout
+from scbr.scene import FlagType
+from scbr.topo import Option, node_records, records_topology
+
+FLAG_LIST = 'flag_list'
+
+
+class AddressRewrite:
+    """move addresses of networks to the same offset in other networks of the same size
+
+        AddressRewrite([(ip_network('10.0.0.0/16'), ip_network('10.7.0.0/16'))])
+
+    addresses outside of the networks are kept.
+    """
+
+    def __init__(self, mapping):
+        ranges = []
+        for source, target in mapping:
+            if source.num_addresses != target.num_addresses:
+                raise Exception('can not rewrite {} to {} of another size'.format(source, target))
+            start = int(source.network_address)
+            ranges.append((start, start + source.num_addresses - 1,
+                           int(target.network_address) - start, source.version))
+        ranges.sort()
+        for previous, current in zip(ranges, ranges[1:]):
+            if current[0] <= previous[1]:
+                raise Exception('rewritten networks overlap at {}'.format(ipaddress.ip_address(current[0])))
+
+        self.mapping = list(mapping)
+        self._ranges = ranges
+        self._starts = [start for start, _, _, _ in ranges]
+        # option value -> rewritten Option, options are shared by many nodes
+        self._options = dict()
+
+    @classmethod
+    def shifted(cls, networks, offset):
+        """rewrite networks by offset addresses, e.g. [10.0.0.0/16] by team * 65536"""
+        return cls([(net, ipaddress.ip_network('{}/{}'.format(net.network_address + offset, net.prefixlen)))
+                    for net in networks])
+
+    def address(self, address):
+        """address rewritten, address itself if no network contains it"""
+        value = int(address)
+        i = bisect.bisect_right(self._starts, value) - 1
+        if i >= 0:
+            start, end, delta, version = self._ranges[i]
+            if value <= end and version == address.version:
+                return ipaddress.ip_address(value + delta) if version == 4 else ipaddress.IPv6Address(value + delta)
+        return address
+
+    def value(self, value):
+        """rewrite an ip option value: address, network or string of an address, with or without /prefix"""
+        if isinstance(value, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            return self.address(value)
+        elif isinstance(value, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            address = self.address(value.network_address)
+            if address == value.network_address:
+                return value
+            return ipaddress.ip_network('{}/{}'.format(address, value.prefixlen))
+        elif isinstance(value, str) and value:
+            text, slash, suffix = value.partition('/')
+            try:
+                address = ipaddress.ip_address(text)
+            except ValueError:
+                return value
+            rewritten = self.address(address)
+            return value if rewritten == address else str(rewritten) + slash + suffix
+        return value
+
+    def option(self, option):
+        """option with rewritten value, option itself if it doesn't change"""
+        if option.subtype != 'ip':
+            return option
+        key = (type(option.value), option.value, option.unit)
+        try:
+            rewritten = self._options.get(key, None)
+        except TypeError:
+            # unhashable value
+            key = rewritten = None
+        if rewritten is None:
+            value = self.value(option.value)
+            rewritten = option if value is option.value else Option(value, option.subtype, option.unit)
+            if key is not None:
+                self._options[key] = rewritten
+        return rewritten
+
+
+def team_rewrites(networks, teams, offset):
+    """AddressRewrite.shifted() of networks by team * offset for every team number of teams"""
+    return [AddressRewrite.shifted(networks, team * offset) for team in teams]
+
+
+def offset_problems(networks, teams, offset):
+    """why networks can't be moved by team * offset for every team number of teams, [] if they can
+
+    the offset has to keep each network aligned to its size, the moved networks have to stay in
+    the address space and must not overlap, neither within a team nor between teams.
+    """
+    problems = []
+    for net in networks:
+        if offset % net.num_addresses:
+            problems.append('offset {} is not a multiple of the {} addresses of {}'.format(
+                offset, net.num_addresses, net))
+    if problems:
+        return problems
+
+    ranges = []
+    for team in teams:
+        for net in networks:
+            start = int(net.network_address) + team * offset
+            end = start + net.num_addresses - 1
+            if start < 0 or end >= 2 ** net.max_prefixlen:
+                problems.append('{} of team {} is moved out of the IPv{} address space'.format(
+                    net, team, net.version))
+            else:
+                ranges.append((net.version, start, end, team, net))
+    ranges.sort(key=lambda r: r[:3])
+    widest = None
+    for version, start, end, team, net in ranges:
+        if widest is not None and widest[0] == version and start <= widest[2]:
+            problems.append('{} ({} of team {}) overlaps {} ({} of team {})'.format(
+                ipaddress.ip_network((start, net.prefixlen)), net, team,
+                ipaddress.ip_network((widest[1], widest[4].prefixlen)), widest[4], widest[3]))
+        if widest is None or widest[0] != version or end > widest[2]:
+            widest = (version, start, end, team, net)
+    return problems
+
+
+def uncovered_addresses(scene, networks):
+    """addresses and networks of an adjusted scene inside none of networks, they are the same for every team
+
+    return (errors, warnings) as descriptions. errors are lan nets, port to port addresses and
+    route gateways, which would collide between teams. warnings are the env control_net_gateway
+    and external_net and route targets, which may be shared by all teams on purpose.
+    """
+    def covered(value):
+        if isinstance(value, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            return any(value.version == net.version and value.subnet_of(net) for net in networks)
+        return any(value.version == net.version and value in net for net in networks)
+
+    errors = []
+    for lan in scene.lans.values():
+        if lan.net is not None and not covered(lan.net):
+            errors.append('lan {} ({})'.format(lan.id, lan.net))
+    for node in scene.node_list:
+        for port in node.ports:
+            to_port = port.to_port
+            if to_port is None:
+                continue
+            if to_port.self_ip is not None and not covered(to_port.self_ip.ip):
+                errors.append('port of {} to {} ({})'.format(node.id, to_port.peer_node_id, to_port.self_ip.ip))
+            if to_port.peer_ip is not None and not covered(to_port.peer_ip.ip):
+                errors.append('port of {} to {} ({})'.format(to_port.peer_node_id, node.id, to_port.peer_ip.ip))
+
+    warnings = []
+    env = scene.env
+    if env.control_net_gateway is not None and not covered(env.control_net_gateway):
+        warnings.append('env control_net_gateway {}'.format(env.control_net_gateway))
+    for net in env.external_net_list:
+        if not covered(net):
+            warnings.append('env external_net {}'.format(net))
+    for router in scene.routers.values():
+        for entry in router.route_table.entries:
+            if not covered(entry.gateway):
+                errors.append('route gateway of {} ({} via {})'.format(router.id, entry.target_net, entry.gateway))
+            elif not covered(entry.target_net):
+                warnings.append('route target of {} ({})'.format(router.id, entry.target_net))
+    # a link declared from both ends is found twice
+    return list(dict.fromkeys(errors)), list(dict.fromkeys(warnings))
+
+
+def flag_content(seed, team, node_id, flag):
+    """content of a random flag of a team, derived from seed"""
+    message = '\0'.join((str(team), node_id, flag.name)).encode('utf-8')
+    key = seed if isinstance(seed, bytes) else str(seed).encode('utf-8')
+    return 'flag{{{}}}'.format(hmac.new(key, message, hashlib.sha256).hexdigest()[:32])
+
+
+def _has_address(value):
+    if isinstance(value, Option):
+        return value.subtype == 'ip' and value.value not in ('', None)
+    elif isinstance(value, list):
+        return any(_has_address(v) for v in value)
+    elif isinstance(value, dict):
+        return any(_has_address(v) for v in value.values())
+    return False
+
+
+def _rewrite(value, rewrite):
+    if isinstance(value, Option):
+        return rewrite.option(value)
+    elif isinstance(value, list):
+        return [_rewrite(v, rewrite) for v in value]
+    elif isinstance(value, dict):
+        return {k: _rewrite(v, rewrite) for k, v in value.items()}
+    return value
+
+
+class TeamTemplate:
+    """topology of an adjusted scene, prepared to be instantiated for many teams
+
+    options without addresses, and nodes without addresses or flags, are shared by all team
+    topologies, don't modify them. the template is picklable, see export_teams(). topology is the
+    one extracted from the adjusted scene, extracted here if None. with layout all teams share the
+    positions of one layout_topology().
+    """
+
+    def __init__(self, scene, topology=None, layout=False):
+        if topology is None:
+            topology = scene.extract_topology()
+        if layout:
+            apply_layout(topology, layout_topology(topology))
+        # node id -> flags, random flags get new content per team
+        self.flags = {node.id: list(node.flags) for node in scene.node_list if node.flags}
+        self.records = []
+        for node_id, name, category, role, template_id, emulation, image, os_, options, ports in \
+                node_records(topology):
+            address_keys = [key for key, value in options.items() if _has_address(value)]
+            ports = [(index, port_options, [key for key, value in port_options.items() if _has_address(value)],
+                      peer_id, peer_name, peer_index)
+                     for index, port_options, peer_id, peer_name, peer_index in ports]
+            self.records.append((node_id, name, category, role, template_id, emulation, image, os_, options,
+                                 address_keys, ports))
+
+    def _flag_list(self, node_id, team, seed):
+        flag_list = []
+        for flag in self.flags[node_id]:
+            random = flag.type == FlagType.RANDOM
+            flag_list.append({
+                'name': Option(flag.name, 'string'),
+                'type': Option.intern(flag.type.name.lower()),
+                'score': Option.intern(flag.score),
+                'content': Option(flag_content(seed, team, node_id, flag) if random else flag.content, 'string'),
+            })
+        return flag_list
+
+    def instantiate(self, team, rewrite=None, seed=''):
+        """Topology of team with addresses changed by rewrite (an AddressRewrite) and flags seeded by seed
+
+        flags are exported as node option flag_list.
+        """
+        with instrument.stage('instantiate'):
+            records = []
+            for node_id, name, category, role, template_id, emulation, image, os_, options, address_keys, ports in \
+                    self.records:
+                if (address_keys and rewrite is not None) or node_id in self.flags:
+                    options = dict(options)
+                    if rewrite is not None:
+                        for key in address_keys:
+                            options[key] = _rewrite(options[key], rewrite)
+                    if node_id in self.flags:
+                        options[FLAG_LIST] = self._flag_list(node_id, team, seed)
+
+                team_ports = []
+                for index, port_options, port_address_keys, peer_id, peer_name, peer_index in ports:
+                    if port_address_keys and rewrite is not None:
+                        port_options = dict(port_options)
+                        for key in port_address_keys:
+                            port_options[key] = _rewrite(port_options[key], rewrite)
+                    team_ports.append((index, port_options, peer_id, peer_name, peer_index))
+                records.append((node_id, name, category, role, template_id, emulation, image, os_, options,
+                                team_ports))
+            topology = records_topology(records)
+            instrument.count('nodes', len(records))
+            return topology
+
+
+def instantiate_teams(scene, teams, rewrites, seed, topology=None, layout=False):
+    """yield (team, Topology) of every team, rewrites are the AddressRewrite of each team
+
+    the scene is extracted once, see TeamTemplate.
+    """
+    template = TeamTemplate(scene, topology, layout)
+    for team, rewrite in zip(teams, rewrites):
+        yield team, template.instantiate(team, rewrite, seed)
+
+
+# TeamTemplate of this worker process, set once by _init_worker
+_template = None
+
+
+def _init_worker(template):
+    global _template
+    _template = template
+
+
+def _export_team(team, rewrite, seed, path, exporter):
+    topology = _template.instantiate(team, rewrite, seed)
+    with open(path, 'wb') as f:
+        exporter.export(topology, f)
+    return path
+
+
+def export_teams(scene, teams, rewrites, seed, output_pattern, exporter, workers=None, topology=None, layout=False):
+    """instantiate every team and export it to output_pattern.format(team=team), return the paths
+
+    with workers > 1 teams are instantiated and exported in a process pool, the template is sent
+    to each worker once.
+    """
+    template = TeamTemplate(scene, topology, layout)
+    paths = [output_pattern.format(team=team) for team in teams]
+    for path in paths:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    if workers and workers > 1 and len(teams) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(template,)) as executor:
+            chunksize = max(1, len(teams) // (workers * 4))
+            return list(executor.map(_export_team, teams, rewrites, [seed] * len(teams), paths,
+                                     [exporter] * len(teams), chunksize=chunksize))
+    else:
+        _init_worker(template)
+        return [_export_team(team, rewrite, seed, path, exporter)
+                for team, rewrite, path in zip(teams, rewrites, paths)]
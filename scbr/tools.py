@@ -0,0 +1,686 @@
+import argparse
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import pickle
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scbr import instrument
+from scbr.allocate import allocate_addresses
+from scbr.generate import generate_scene, SHAPES, SHAPE_CHAIN
+from scbr.layout import layout_topology, apply_layout
+from scbr.lang.cache import SceneCache
+from scbr.lang.parser import parse_pieces, parse_scene, include_order, include_path, IncludeResolver, Include, \
+    PARSER_EARLEY, PARSER_LALR, PARSER_LALR_INLINE
+from scbr.scene import Scene, NodeTemplate, Host, HostRange, Router, Lan
+from scbr.partition import partition_topology, export_shards, DEFAULT_TOLERANCE
+from scbr.routing import synthesize_routes
+from scbr.teams import export_teams, team_rewrites, offset_problems, uncovered_addresses
+from scbr.topo import CadtsTopologyExporter, JsonTopologyExporter, count_exported
+from scbr.validate import check_scene
+from scbr.utils import auto_str
+
+LOG = logging.getLogger(__name__)
+
+ENV_SUFFIX = '.env'
+TEMPLATE_SUFFIX = '.st'
+SCENE_SUFFIX = '.scene'
+OUTPUT_SUFFIX = '.xml'
+
+FORMAT_XML = 'xml'
+FORMAT_JSON = 'json'
+FORMAT_JSONL = 'jsonl'
+# output format -> (exporter factory, file suffix)
+OUTPUT_FORMATS = {
+    FORMAT_XML: (CadtsTopologyExporter, OUTPUT_SUFFIX),
+    FORMAT_JSON: (lambda: JsonTopologyExporter(lines=False), '.json'),
+    FORMAT_JSONL: (JsonTopologyExporter, '.jsonl'),
+}
+
+# (parser, cache dir) -> IncludeResolver of this (worker) process
+_resolvers = dict()
+
+
+@auto_str()
+class Scenario:
+    """a scene file with the env/template files it is compiled with, in merge order"""
+
+    def __init__(self, name, files, output):
+        self.name = name
+        self.files = files
+        self.output = output
+
+
+def find_scenarios(source_dir, output_dir, output_suffix=OUTPUT_SUFFIX):
+    """find every .scene file under source_dir
+
+    X.env and X.st next to X.scene belong to scenario X only. other .env/.st files are shared by
+    all scenarios in their directory and sub directories. files are merged as shared env, own env,
+    shared templates, own templates, scene, parent directories first.
+    """
+    scenarios = []
+    shared = {ENV_SUFFIX: [], TEMPLATE_SUFFIX: []}
+    _find_scenarios(source_dir, source_dir, output_dir, output_suffix, shared, scenarios)
+    return scenarios
+
+
+def _find_scenarios(source_dir, directory, output_dir, output_suffix, inherited, scenarios):
+    names = sorted(os.listdir(directory))
+    stems = {name[:-len(SCENE_SUFFIX)] for name in names if name.endswith(SCENE_SUFFIX)}
+
+    shared = {suffix: list(files) for suffix, files in inherited.items()}
+    for name in names:
+        stem, suffix = os.path.splitext(name)
+        if suffix in shared and stem not in stems:
+            shared[suffix].append(os.path.join(directory, name))
+
+    for stem in sorted(stems):
+        files = list(shared[ENV_SUFFIX])
+        files.extend(_own_file(directory, stem, ENV_SUFFIX))
+        files.extend(shared[TEMPLATE_SUFFIX])
+        files.extend(_own_file(directory, stem, TEMPLATE_SUFFIX))
+        files.append(os.path.join(directory, stem + SCENE_SUFFIX))
+
+        name = os.path.relpath(os.path.join(directory, stem), source_dir)
+        scenarios.append(Scenario(name, files, os.path.join(output_dir, name + output_suffix)))
+
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            _find_scenarios(source_dir, path, output_dir, output_suffix, shared, scenarios)
+
+
+def _own_file(directory, stem, suffix):
+    path = os.path.join(directory, stem + suffix)
+    return [path] if os.path.exists(path) else []
+
+
+def _resolver(parser, cache_dir):
+    """IncludeResolver of this (worker) process, files shared by scenarios are parsed once per process"""
+    resolver = _resolvers.get((parser, cache_dir), None)
+    if resolver is None:
+        cache = SceneCache(cache_dir) if cache_dir else None
+        resolver = _resolvers[(parser, cache_dir)] = IncludeResolver(parser, cache)
+    return resolver
+
+
+def compile_scenario(scenario, parser=PARSER_EARLEY, cache_dir=None, validate=False, auto_route=False,
+                     auto_address=False, output_format=FORMAT_XML, layout=False):
+    """compile scenario to CADTS xml or json (see OUTPUT_FORMATS), return error message or None"""
+    try:
+        with instrument.stage('compile_scenario'):
+            resolver = _resolver(parser, cache_dir)
+            scene_file = scenario.files[-1]
+
+            scene = Scene()
+            # a file included by several files of the scenario is merged once
+            seen = set()
+            for path in scenario.files:
+                scene.add_entities(resolver.entities(path, seen, keep=path != scene_file))
+            os.makedirs(os.path.dirname(scenario.output) or '.', exist_ok=True)
+            with open(scenario.output, 'wb') as f:
+                export_scene(scene, f, validate, auto_route, auto_address, output_format, layout)
+            return None
+    except Exception:
+        return traceback.format_exc()
+
+
+def build_topology(scene, validate=False, auto_route=False, auto_address=False, layout=False):
+    """adjust scene, apply the compile options and extract its topology, laid out if layout"""
+    scene.adjust()
+    if auto_address:
+        allocate_addresses(scene)
+    if validate:
+        check_scene(scene)
+    if auto_route:
+        synthesize_routes(scene)
+    topology = scene.extract_topology()
+    if layout:
+        apply_layout(topology, layout_topology(topology))
+    return topology
+
+
+def export_scene(scene, fp, validate=False, auto_route=False, auto_address=False, output_format=FORMAT_XML,
+                 layout=False):
+    """build_topology() of scene and export it to binary file object fp"""
+    topology = build_topology(scene, validate, auto_route, auto_address, layout)
+    OUTPUT_FORMATS[output_format][0]().export(topology, fp)
+
+
+def _compile_profiled(scenario, *args):
+    """compile_scenario() returning (error, stage records), records of worker processes are sent back"""
+    summary = instrument.ProfileSummary()
+    instrument.add_listener(summary)
+    try:
+        return compile_scenario(scenario, *args), summary.records
+    finally:
+        instrument.remove_listener(summary)
+
+
+def compile_all(scenarios, parser=PARSER_EARLEY, cache_dir=None, workers=None, callback=None, validate=False,
+                auto_route=False, auto_address=False, profile=None, output_format=FORMAT_XML, layout=False):
+    """compile scenarios, in a process pool if workers > 1
+
+    errors don't stop the batch, return dict of scenario name to error message.
+    callback(scenario, error) is called as each scenario finishes.
+    stage records of all scenarios are added to profile (an instrument.ProfileSummary) if given.
+    """
+    errors = dict()
+    args = (parser, cache_dir, validate, auto_route, auto_address, output_format, layout)
+
+    def done(scenario, result):
+        if profile is not None:
+            error, records = result
+            for record in records:
+                profile.add(record)
+        else:
+            error = result
+
+        if error:
+            errors[scenario.name] = error
+        if callback:
+            callback(scenario, error)
+
+    compile_func = _compile_profiled if profile is not None else compile_scenario
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(compile_func, scenario, *args): scenario for scenario in scenarios}
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+    else:
+        for scenario in scenarios:
+            done(scenario, compile_func(scenario, *args))
+
+    return errors
+
+
+@auto_str()
+class WatchResult:
+    """outcome of recompiling a scenario: error message or None, and whether output was rewritten"""
+
+    def __init__(self, scenario, error, written):
+        self.scenario = scenario
+        self.error = error
+        self.written = written
+
+
+class _WatchedFile:
+    __slots__ = ('stat', 'pieces', 'entities', 'pickles', 'digests', 'keyed', 'error')
+
+    def __init__(self, stat, parsed, error):
+        """parsed is [(source piece, entities, pickled entities)] in file order, None if parsing failed"""
+        self.stat = stat
+        self.error = error
+        # source piece -> (entities, pickled entities), to parse only changed pieces again
+        self.pieces = None
+        # read only, scenes are built from fresh copies in pickles, adjust() and the compile options change them
+        self.entities = None
+        self.pickles = None
+        # (entity type, id) -> digest of the entity as parsed, before adjust() links it to others
+        self.digests = None
+        # (entity type, id) -> index of the last entity with it
+        self.keyed = None
+        if parsed is None:
+            return
+
+        self.pieces = {piece: (entities, pickles) for piece, entities, pickles in parsed}
+        self.entities = [entity for _, entities, _ in parsed for entity in entities]
+        self.pickles = [pickled for _, _, pickles in parsed for pickled in pickles]
+        self.digests = dict()
+        self.keyed = dict()
+        for i, (entity, pickled) in enumerate(zip(self.entities, self.pickles)):
+            key = type(entity).__name__, getattr(entity, 'id', None)
+            self.digests[key] = hashlib.sha256(pickled).digest()
+            self.keyed[key] = i
+
+    def fresh_entity(self, key):
+        """new copy of the entity of key as parsed, None if there is none"""
+        i = self.keyed.get(key, None)
+        return pickle.loads(self.pickles[i]) if i is not None else None
+
+
+class _WatchedOutput:
+    __slots__ = ('files', 'digest', 'used_templates', 'scene', 'topology', 'texts')
+
+    def __init__(self, files, digest, used_templates=None, scene=None, topology=None, texts=None):
+        # files of the scenario
+        self.files = files
+        # digest of the output written
+        self.digest = digest
+        # template ids used, None if not known
+        self.used_templates = used_templates
+        # adjusted scene, its topology and node id -> exported node text, kept to patch edits into.
+        # None if the scenario is built again on every change
+        self.scene = scene
+        self.topology = topology
+        self.texts = texts
+
+
+def _node_count(entities):
+    """topology nodes declared by entities, a node declared twice counts twice"""
+    count = 0
+    for entity in entities:
+        if isinstance(entity, HostRange):
+            count += len(entity)
+        elif isinstance(entity, Lan):
+            count += 1 + len(entity.hosts)
+        elif isinstance(entity, (Host, Router)):
+            count += 1
+    return count
+
+
+class Watcher:
+    """recompile the scenarios of source_dir when their files change
+
+    parsed entities are kept pickled per file, included files are watched too. of a changed file only the
+    pieces whose text changed are parsed again (see parse_pieces()), and only the scenarios using it are
+    compiled again. edits that change no entity (comments, formatting) change nothing.
+
+    the adjusted scene and topology of a scenario are kept with the exported text of every node. changed
+    entities that keep the graph (same nodes, lans, ports and peers) are patched into them, only nodes
+    pointing at a changed entity are resolved again and only the topology nodes that may change are
+    extracted and exported again. other edits, and scenarios compiled with auto_route, auto_address or
+    layout, which work on the whole scene, are built again from the kept entities of their files; edits
+    of templates they don't use don't rebuild those. output files are rewritten only if their content changes.
+    """
+
+    def __init__(self, source_dir, output_dir, parser=PARSER_LALR_INLINE, validate=False, auto_route=False,
+                 auto_address=False, output_format=FORMAT_XML, layout=False):
+        self.source_dir = source_dir
+        self.output_dir = output_dir
+        self.parser = parser
+        self.options = (validate, auto_route, auto_address, output_format, layout)
+
+        self._files = dict()
+        # output path -> _WatchedOutput
+        self._outputs = dict()
+
+    def poll(self):
+        """check files once, rebuild changed scenarios, return [WatchResult]"""
+        scenarios = find_scenarios(self.source_dir, self.output_dir, OUTPUT_FORMATS[self.options[3]][1])
+
+        # path -> changed entity keys, None if not known
+        changes = dict()
+        refreshed = set()
+        visited = []
+
+        def includes_of(path):
+            if path not in refreshed:
+                refreshed.add(path)
+                changed = self._refresh(path)
+                if changed is None or changed:
+                    changes[path] = changed
+            visited.append(path)
+            watched = self._files.get(path, None)
+            if watched is None or watched.entities is None:
+                return []
+            return [include_path(path, entity.path) for entity in watched.entities if isinstance(entity, Include)]
+
+        plans = []
+        for scenario in scenarios:
+            del visited[:]
+            seen = set()
+            try:
+                files = [file for path in scenario.files for file in include_order(path, includes_of, seen)]
+                error = None
+            except Exception:
+                # built again when any file looked at changes
+                files = sorted(set(visited))
+                error = traceback.format_exc()
+            plans.append((scenario, tuple(files), error))
+
+        paths = {path for _, files, _ in plans for path in files}
+        for path in list(self._files):
+            if path not in paths:
+                del self._files[path]
+
+        results = []
+        for scenario, files, error in plans:
+            previous = self._outputs.get(scenario.output, None)
+            if previous is not None and previous.files == files:
+                changed = [changes[path] for path in files if path in changes]
+                if not changed:
+                    continue
+                if previous.scene is not None and error is None:
+                    result = None if None in changed else self._patch(scenario, previous, set().union(*changed))
+                    if result is not None:
+                        results.append(result)
+                        continue
+                elif not self._affected(changed, previous.used_templates):
+                    continue
+
+            if error is None:
+                results.append(self._rebuild(scenario, files, previous))
+            else:
+                self._outputs[scenario.output] = _WatchedOutput(files, previous.digest if previous else None)
+                results.append(WatchResult(scenario, error, False))
+        return results
+
+    def run(self, interval=0.5, callback=None):
+        """poll every interval seconds until interrupted, callback(WatchResult) after each rebuild"""
+        while True:
+            for result in self.poll():
+                if callback:
+                    callback(result)
+            time.sleep(interval)
+
+    @staticmethod
+    def _affected(changed, used_templates):
+        """whether changed entity keys of files (None if not known) may change an output using used_templates"""
+        for keys in changed:
+            if keys is None or used_templates is None:
+                return True
+            for entity_type, entity_id in keys:
+                if entity_type != NodeTemplate.__name__ or entity_id in used_templates:
+                    return True
+        return False
+
+    def _refresh(self, path):
+        """parse path again if it changed on disk, return keys of changed entities, None if unknown"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # removed since the directory was listed, next poll drops it
+            return set()
+        stat = (stat.st_mtime_ns, stat.st_size)
+        watched = self._files.get(path, None)
+        if watched is not None and watched.stat == stat:
+            return set()
+
+        known = watched.pieces if watched is not None and watched.pieces is not None else dict()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            parsed = []
+            for piece, entities in parse_pieces(content, self.parser, {piece: entities for piece, (entities, _)
+                                                                       in known.items()}):
+                if piece in known and known[piece][0] is entities:
+                    pickles = known[piece][1]
+                else:
+                    pickles = [pickle.dumps(entity, pickle.HIGHEST_PROTOCOL) for entity in entities]
+                parsed.append((piece, entities, pickles))
+            error = None
+        except Exception:
+            parsed = None
+            error = traceback.format_exc()
+
+        refreshed = self._files[path] = _WatchedFile(stat, parsed, error)
+        if watched is None or watched.digests is None or refreshed.digests is None:
+            return None
+        return {key for key in watched.digests.keys() | refreshed.digests.keys()
+                if watched.digests.get(key, None) != refreshed.digests.get(key, None)}
+
+    def _patch(self, scenario, watched, keys):
+        """patch the entities of keys into the kept scene of scenario, None if it has to be built again"""
+        entities = []
+        for key in keys:
+            if key[0] == Include.__name__:
+                # same files are included, or the files of the scenario would differ
+                continue
+            for path in reversed(watched.files):
+                entity = self._files[path].fresh_entity(key)
+                if entity is not None:
+                    break
+            else:
+                # removed
+                return None
+            entities.append(entity)
+
+        scene, topology, texts = watched.scene, watched.topology, watched.texts
+        try:
+            with instrument.stage('patch_scenario'):
+                changed = scene.replace_entities(entities, topology)
+                if changed is None:
+                    return None
+                if self.options[0]:
+                    check_scene(scene)
+
+                with instrument.stage('export'):
+                    exporter = OUTPUT_FORMATS[self.options[3]][0]()
+                    # names and addresses of changed nodes are in the interfaces of their peers too
+                    exported = set(changed)
+                    for node_id in changed:
+                        exported.update(port.link.adjacent_port(port).node.id
+                                        for port in topology.nodes[node_id].ports if port.link is not None)
+                    for node_id in exported:
+                        texts[node_id] = exporter.node_text(topology.nodes[node_id])
+                    f = io.BytesIO()
+                    exporter.write_texts(f, texts.values())
+                    count_exported(topology, [topology.nodes[node_id] for node_id in exported])
+        except Exception:
+            # the scene may be half patched, building it again reports errors of the edit
+            return None
+
+        watched.used_templates = {node.template_id for node in scene.node_list if node.template_id}
+        return self._write(scenario, watched, f.getvalue())
+
+    def _rebuild(self, scenario, files, previous):
+        written_digest = previous.digest if previous else None
+        # a scenario failing now is built again when any of its files changes
+        self._outputs[scenario.output] = _WatchedOutput(files, written_digest)
+
+        errors = [self._files[path].error if path in self._files else '{} not found'.format(path) for path in files
+                  if path not in self._files or self._files[path].error]
+        if errors:
+            return WatchResult(scenario, errors[0], False)
+
+        validate, auto_route, auto_address, output_format, layout = self.options
+        try:
+            with instrument.stage('compile_scenario'):
+                scene = Scene()
+                declared = 0
+                for path in files:
+                    source = self._files[path]
+                    entities = [pickle.loads(pickled) for entity, pickled in zip(source.entities, source.pickles)
+                                if not isinstance(entity, Include)]
+                    declared += _node_count(entities)
+                    scene.add_entities(entities)
+                topology = build_topology(scene, validate, auto_route, auto_address, layout)
+
+                with instrument.stage('export'):
+                    exporter = OUTPUT_FORMATS[output_format][0]()
+                    texts = {node_id: exporter.node_text(node) for node_id, node in topology.nodes.items()}
+                    f = io.BytesIO()
+                    exporter.write_texts(f, texts.values())
+                    count_exported(topology)
+        except Exception:
+            return WatchResult(scenario, traceback.format_exc(), False)
+
+        watched = _WatchedOutput(files, written_digest, {node.template_id for node in scene.node_list
+                                                          if node.template_id})
+        # options working on the whole scene, and nodes declared twice, can't be patched
+        if not (auto_route or auto_address or layout) and declared == len(topology.nodes):
+            watched.scene, watched.topology, watched.texts = scene, topology, texts
+        return self._write(scenario, watched, f.getvalue())
+
+    def _write(self, scenario, watched, content):
+        """write content to the output of scenario unless it was written last, watched is its new state"""
+        self._outputs[scenario.output] = watched
+        digest = hashlib.sha256(content).digest()
+        if digest == watched.digest and os.path.exists(scenario.output):
+            return WatchResult(scenario, None, False)
+
+        os.makedirs(os.path.dirname(scenario.output) or '.', exist_ok=True)
+        with open(scenario.output, 'wb') as out:
+            out.write(content)
+        watched.digest = digest
+        return WatchResult(scenario, None, True)
+
+
+def watch_command(args):
+    watcher = Watcher(args.source, args.output, args.parser, args.validate, args.auto_route, args.auto_address,
+                      args.format, args.layout)
+
+    def report(result):
+        if result.error:
+            print("FAIL {}\n{}".format(result.scenario.name, result.error), file=sys.stderr)
+        else:
+            print("{} {}".format('OK  ' if result.written else 'SAME', result.scenario.name))
+
+    print("watching {}, ctrl-c to stop".format(args.source))
+    try:
+        watcher.run(args.interval, report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def compile_command(args):
+    scenarios = find_scenarios(args.source, args.output, OUTPUT_FORMATS[args.format][1])
+    if not scenarios:
+        print("no scenario found in {}".format(args.source), file=sys.stderr)
+        return 1
+
+    def progress(scenario, error):
+        print("{} {}".format('FAIL' if error else 'OK  ', scenario.name))
+
+    profile = instrument.ProfileSummary() if args.profile else None
+    start = time.perf_counter()
+    errors = compile_all(scenarios, args.parser, args.cache_dir, args.jobs, progress, args.validate, args.auto_route,
+                         args.auto_address, profile, args.format, args.layout)
+    elapsed = time.perf_counter() - start
+
+    for name in sorted(errors):
+        print("\n==== {}\n{}".format(name, errors[name]), file=sys.stderr)
+    if profile is not None:
+        print("\n{}\n".format(profile.format_table()))
+    print("compiled {}/{} scenarios in {:.2f}s".format(len(scenarios) - len(errors), len(scenarios), elapsed))
+    return 1 if errors else 0
+
+
+def shard_command(args):
+    if args.format != FORMAT_XML:
+        print("shards are only written as {}".format(FORMAT_XML), file=sys.stderr)
+        return 1
+
+    scene = parse_scene(*args.files, parser=args.parser)
+    topology = build_topology(scene, args.validate, args.auto_route, args.auto_address, args.layout)
+
+    partition = partition_topology(topology, args.shards, args.tolerance)
+    paths = export_shards(topology, partition, args.output, args.jobs)
+    for path, node_ids, weight in zip(paths, partition.shards, partition.weights):
+        print("{} {} nodes, weight {:.1f}".format(path, len(node_ids), weight))
+    print("{} links cut, cost {}".format(len(partition.cut_links), partition.cut_cost))
+    return 0
+
+
+def teams_command(args):
+    scene = parse_scene(*args.files, parser=args.parser)
+    topology = build_topology(scene, args.validate, args.auto_route, args.auto_address, args.layout)
+
+    teams = list(range(args.first, args.first + args.teams))
+    networks = args.network
+    problems = offset_problems(networks, teams, args.offset)
+    if problems:
+        print('\n'.join(problems), file=sys.stderr)
+        return 1
+    errors, warnings = uncovered_addresses(scene, networks)
+    for warning in warnings:
+        print("warning: {} is in no --network, it is the same for every team".format(warning), file=sys.stderr)
+    if errors:
+        print("{} in no --network, every team would get the same addresses:\n    {}".format(
+            'these are' if len(errors) > 1 else 'this is', '\n    '.join(errors)), file=sys.stderr)
+        return 1
+    rewrites = team_rewrites(networks, teams, args.offset)
+    start = time.perf_counter()
+    paths = export_teams(scene, teams, rewrites, args.seed, args.output, OUTPUT_FORMATS[args.format][0](), args.jobs,
+                         topology)
+    print("instantiated {} teams in {:.2f}s".format(len(paths), time.perf_counter() - start))
+    return 0
+
+
+def generate_command(args):
+    with open(args.output, 'w', encoding='utf-8') as f:
+        generate_scene(f, args.lans, args.hosts, args.routers, args.shape, args.templates, args.dns_entries)
+    return 0
+
+
+def _int_literal(text):
+    return int(text, 0)
+
+
+def _add_compile_options(parser):
+    parser.add_argument('--parser', default=PARSER_LALR_INLINE,
+                        choices=(PARSER_EARLEY, PARSER_LALR, PARSER_LALR_INLINE), help='parser mode')
+    parser.add_argument('--validate', action='store_true', help='fail scenarios with addressing problems')
+    parser.add_argument('--auto-route', action='store_true',
+                        help='add shortest path routes of routers to every network')
+    parser.add_argument('--auto-address', action='store_true', help='assign free lan addresses to ports without ip')
+    parser.add_argument('--format', default=FORMAT_XML, choices=sorted(OUTPUT_FORMATS),
+                        help='output format, CADTS xml or its compact json form')
+    parser.add_argument('--layout', action='store_true', help='write x/y positions of a force-directed layout')
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='python -m scbr.tools', description='scene builder tools')
+    arg_parser.add_argument('-v', '--verbose', action='store_true', help='verbose logging')
+    commands = arg_parser.add_subparsers(dest='command')
+    commands.required = True
+
+    compile_parser = commands.add_parser('compile', help='compile scenario directory to CADTS xml')
+    compile_parser.add_argument('source', help='directory of .scene/.st/.env files')
+    compile_parser.add_argument('-o', '--output', required=True, help='output directory of xml files')
+    compile_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    compile_parser.add_argument('--cache-dir', default=None, help='on-disk cache of parsed files')
+    compile_parser.add_argument('--profile', action='store_true', help='print time and counters of each stage')
+    _add_compile_options(compile_parser)
+    compile_parser.set_defaults(func=compile_command)
+
+    watch_parser = commands.add_parser('watch', help='compile scenario directory again whenever a file changes')
+    watch_parser.add_argument('source', help='directory of .scene/.st/.env files')
+    watch_parser.add_argument('-o', '--output', required=True, help='output directory')
+    watch_parser.add_argument('--interval', type=float, default=0.5, help='seconds between checks')
+    _add_compile_options(watch_parser)
+    watch_parser.set_defaults(func=watch_command)
+
+    shard_parser = commands.add_parser('shard', help='split a scenario into balanced CADTS xml shards')
+    shard_parser.add_argument('files', nargs='+', help='.env/.st files, then the .scene file of the scenario')
+    shard_parser.add_argument('-o', '--output', required=True, help='output xml file, shards are named x.shard-i.xml')
+    shard_parser.add_argument('-k', '--shards', type=int, required=True, help='number of shards')
+    shard_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                              help='allowed deviation of shard weight from the mean')
+    shard_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    _add_compile_options(shard_parser)
+    shard_parser.set_defaults(func=shard_command)
+
+    teams_parser = commands.add_parser('teams', help='instantiate a scenario for many teams')
+    teams_parser.add_argument('files', nargs='+', help='.env/.st files, then the .scene file of the scenario')
+    teams_parser.add_argument('-o', '--output', required=True, help='output file of each team, with {team}')
+    teams_parser.add_argument('-n', '--teams', type=int, required=True, help='number of teams')
+    teams_parser.add_argument('--first', type=int, default=1, help='number of the first team')
+    teams_parser.add_argument('--network', action='append', default=[], type=ipaddress.ip_network,
+                              help='network of the scenario moved for each team, may be repeated, '
+                                   'must contain every lan net and port to port address')
+    teams_parser.add_argument('--offset', type=_int_literal, default=65536,
+                              help='addresses the networks are moved per team number, e.g. 65536 or 0x10000')
+    teams_parser.add_argument('--seed', required=True, help='secret random flags are derived from')
+    teams_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    _add_compile_options(teams_parser)
+    teams_parser.set_defaults(func=teams_command)
+
+    generate_parser = commands.add_parser('generate', help='write a synthetic scene file')
+    generate_parser.add_argument('-o', '--output', required=True, help='output .scene file')
+    generate_parser.add_argument('--lans', type=int, default=10, help='number of lans')
+    generate_parser.add_argument('--hosts', type=int, default=20, help='hosts per lan')
+    generate_parser.add_argument('--routers', type=int, default=2, help='number of routers')
+    generate_parser.add_argument('--shape', default=SHAPE_CHAIN, choices=SHAPES, help='how routers are linked')
+    generate_parser.add_argument('--templates', type=int, default=4, help='number of templates')
+    generate_parser.add_argument('--dns-entries', type=int, default=3, help='dns_list entries of each host')
+    generate_parser.set_defaults(func=generate_command)
+
+    return arg_parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import ipaddress
+import json
 import uuid
 import io
 import abc
@@ -8,10 +9,12 @@ from enum import Enum
 import xml.etree.cElementTree as ET
 from xml.dom import minidom
 
+from scbr import instrument
 from scbr.utils import auto_str
 
 
 IP_PATTERN = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+LINK_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'scbr:link')
 
 
 class NodeCategory(Enum):
@@ -21,6 +24,8 @@ class NodeCategory(Enum):
 
 @auto_str()
 class Topology:
+    __slots__ = ('nodes',)
+
     def __init__(self):
         self.nodes = dict()
 
@@ -33,10 +38,15 @@ class Topology:
 
 @auto_str()
 class Node:
-    def __init__(self, id_, name, category, template_id, options=None):
+    __slots__ = ('id', 'name', 'category', 'role', 'template_id', 'emulation', 'image', 'os', 'options', 'ports',
+                 'next_port_index')
+
+    def __init__(self, id_, name, category, template_id, options=None, role=None):
         self.id = id_
         self.name = name
         self.category = category.name
+        # name of the NodeRole in the scene, '' if not known (imported topologies), not exported
+        self.role = role.name if role is not None else ''
         self.template_id = template_id if template_id else ''
         self.emulation = "vsphere"
         self.image = ''
@@ -47,11 +57,11 @@ class Node:
 
     def use_default_physic(self):
         if self.os == 'windows':
-            self.options['cpuCount'] = Option(2, unit='个')
-            self.options['ram'] = Option(2048, unit='MB')
+            self.options['cpuCount'] = Option.intern(2, unit='个')
+            self.options['ram'] = Option.intern(2048, unit='MB')
         else:
-            self.options['cpuCount'] = Option(1, unit='个')
-            self.options['ram'] = Option(1024, unit='MB')
+            self.options['cpuCount'] = Option.intern(1, unit='个')
+            self.options['ram'] = Option.intern(1024, unit='MB')
 
     def add_port(self):
         index = self.next_port_index
@@ -68,7 +78,7 @@ class Node:
         return port1, port2
 
     def remove_control_nic(self):
-        self.options['_noControlNic'] = Option("true")
+        self.options['_noControlNic'] = Option.intern("true")
 
     def add_route_entry(self, target_net, gateway_ip):
         ROUTE_TABLE = 'route_list'
@@ -78,24 +88,30 @@ class Node:
 
         route_table.append({
             "targetNete": Option(target_net.network_address),
-            "networkLength": Option(target_net.prefixlen),
+            "networkLength": Option.intern(target_net.prefixlen),
             "nicIp": Option(gateway_ip),
         })
 
 
 @auto_str(filter_attrs='node')
 class Port:
+    __slots__ = ('node', 'index', 'options', 'link')
+
     def __init__(self, node, index, **kwargs):
         self.node = node
         self.index = index
         self.options = kwargs if kwargs else dict()
         self.link = None
 
+    @property
+    def id(self):
+        return '{}:{}'.format(self.node.id, self.index)
+
     def config_ip(self, ip, netmask, default_gateway='', dns=''):
         self.options['ip'] = Option(ip, 'ip')
-        self.options['netmask'] = Option(netmask, 'ip')
-        self.options['defaultGateway'] = Option(default_gateway, 'ip')
-        self.options['dns'] = Option(dns, 'ip')
+        self.options['netmask'] = Option.intern(netmask, 'ip')
+        self.options['defaultGateway'] = Option.intern(default_gateway, 'ip')
+        self.options['dns'] = Option.intern(dns, 'ip')
 
     def link_to_port(self, other):
         link = Link(self, other)
@@ -104,6 +120,15 @@ class Port:
 
 @auto_str()
 class Option:
+    """option value of node, port or link
+
+    options may be shared between entities (see intern()), don't modify them in place.
+    """
+    __slots__ = ('value', 'subtype', 'unit')
+
+    INTERN_LIMIT = 4096
+    _interned = dict()
+
     def __init__(self, value, subtype=None, unit=''):
         self.value = value
         if not subtype:
@@ -112,6 +137,22 @@ class Option:
             self.subtype = subtype
         self.unit = unit
 
+    @classmethod
+    def intern(cls, value, subtype=None, unit=''):
+        """shared Option instance for common value/subtype/unit, at most INTERN_LIMIT are kept"""
+        key = (type(value), value, subtype, unit)
+        try:
+            option = cls._interned.get(key, None)
+        except TypeError:
+            # unhashable value
+            return cls(value, subtype, unit)
+
+        if option is None:
+            option = cls(value, subtype, unit)
+            if len(cls._interned) < cls.INTERN_LIMIT:
+                cls._interned[key] = option
+        return option
+
     def guess_type(self, value):
         if isinstance(value, numbers.Number):
             return "number"
@@ -127,14 +168,21 @@ class Option:
 
 @auto_str(filter_attrs={'port1', 'port2'})
 class Link:
+    __slots__ = ('id', 'port1', 'port2', 'options')
+
     def __init__(self, port1, port2, **kwargs):
-        self.id = uuid.uuid4().hex
+        self.id = self.link_id(port1, port2)
         self.port1 = port1
         self.port1.link = self
         self.port2 = port2
         self.port2.link = self
         self.options = kwargs
 
+    @staticmethod
+    def link_id(port1, port2):
+        """deterministic id from endpoint node ids and port indexes, independent of direction"""
+        return uuid.uuid5(LINK_ID_NAMESPACE, '|'.join(sorted((port1.id, port2.id)))).hex
+
     def adjacent_port(self, port):
         if port == self.port1:
             return self.port2
@@ -144,9 +192,58 @@ class Link:
             raise Exception("port {} not in link {}".format(port, self))
 
 
+def node_records(topology, node_ids=None):
+    """flat, picklable copy of the nodes of topology (all or node_ids), see records_topology()
+
+    a linked Topology is too deep to pickle. options are not copied.
+    """
+    records = []
+    for node_id in (node_ids if node_ids is not None else topology.nodes):
+        node = topology.nodes[node_id]
+        ports = []
+        for port in node.ports:
+            if port.link is None:
+                ports.append((port.index, port.options, None, None, None))
+                continue
+            peer = port.link.adjacent_port(port)
+            ports.append((port.index, port.options, peer.node.id, peer.node.name, peer.index))
+        records.append((node.id, node.name, node.category, node.role, node.template_id, node.emulation, node.image,
+                        node.os, node.options, ports))
+    return records
+
+
+def records_topology(records):
+    """Topology of node_records(), ports whose peer is not in records are linked to stand-ins of it"""
+    topology = Topology()
+    port_records = []
+    for node_id, name, category, role, template_id, emulation, image, os_, options, ports in records:
+        node = Node(node_id, name, NodeCategory[category], template_id, options)
+        node.role = role
+        node.emulation = emulation
+        node.image = image
+        node.os = os_
+        for index, port_options, peer_id, peer_name, peer_index in ports:
+            port = Port(node, index, **port_options)
+            node.ports.append(port)
+            node.next_port_index = max(node.next_port_index, index + 1)
+            port_records.append((port, peer_id, peer_name, peer_index))
+        topology.add_node(node)
+
+    ports = {(port.node.id, port.index): port for port, _, _, _ in port_records}
+    for port, peer_id, peer_name, peer_index in port_records:
+        if port.link is not None or peer_id is None:
+            continue
+        peer = ports.get((peer_id, peer_index), None)
+        if peer is None:
+            peer = Port(Node(peer_id, peer_name, NodeCategory.Host, None), peer_index)
+        Link(port, peer)
+    return topology
+
+
 class TopologyExporter(metaclass=abc.ABCMeta):
     @abc.abstractmethod
-    def export(self, topology: Topology):
+    def export(self, topology: Topology, fp=None):
+        """write topology to file object fp, or return it as string if fp is None"""
         pass
 
 
@@ -154,7 +251,36 @@ class CadtsTopologyExporter(TopologyExporter):
     def __init__(self):
         pass
 
-    def export(self, topology: Topology):
+    def export(self, topology: Topology, fp=None):
+        """stream pretty printed xml node by node, same output as pretty_xml() of build_tree()"""
+        if fp is None:
+            f = io.StringIO()
+            self.export(topology, f)
+            return f.getvalue()
+
+        with instrument.stage('export'):
+            self.write_texts(fp, (self.node_text(node) for node in topology.nodes.values()))
+            count_exported(topology)
+
+    def node_text(self, node):
+        """exported text of one node"""
+        chunks = []
+        _write_node(chunks, node)
+        return ''.join(chunks)
+
+    def write_texts(self, fp, texts):
+        """write the document of node_text() of every node, in node order, to fp"""
+        write = _chunk_writer(fp)
+        write(['<?xml version="1.0" encoding="UTF-8"?>\n'])
+        empty = True
+        for text in texts:
+            if empty:
+                write(['<topo _v="2.0">\n'])
+                empty = False
+            write([text])
+        write(['<topo _v="2.0"/>\n' if empty else '</topo>\n'])
+
+    def build_tree(self, topology: Topology):
         root = ET.Element("topo")
         root.attrib['_v'] = '2.0'
 
@@ -178,7 +304,294 @@ class CadtsTopologyExporter(TopologyExporter):
                 p.attrib['toPort'] = str(other.index)
                 fill_options(p, port.options)
 
-        return pretty_xml(root)
+        return root
+
+
+class JsonTopologyExporter(TopologyExporter):
+    """stream the CADTS topology as compact JSON, one node at a time
+
+    with lines=True (JSON Lines) the first line is the header {"_v": "2.0"} and every following
+    line is one node. with lines=False the document is {"_v": "2.0", "nodes": [node, ...]}.
+
+    node:      {"id", "name", "templateId", "category", "emulation", "os", "image": string,
+                "config": [config], "interfaces": [interface]}
+    interface: {"index": int, "toNode": node name, "toPort": int, "config": [config]}
+    config:    {"name": string, "value", "type", "unit": string}    an option
+               {"name": string, "config": [config]}                 nested options
+    configs of list options like route_list carry their position as "index": int. attributes
+    and values are the strings of the xml export, key order follows the xml attribute order.
+    """
+
+    def __init__(self, lines=True):
+        self.lines = lines
+
+    def export(self, topology: Topology, fp=None):
+        if fp is None:
+            f = io.StringIO()
+            self.export(topology, f)
+            return f.getvalue()
+
+        with instrument.stage('export'):
+            self.write_texts(fp, (self.node_text(node) for node in topology.nodes.values()))
+            count_exported(topology)
+
+    def node_text(self, node):
+        """exported text of one node"""
+        return _json_dumps(_node_json(node))
+
+    def write_texts(self, fp, texts):
+        """write the document of node_text() of every node, in node order, to fp"""
+        write = _chunk_writer(fp)
+        if self.lines:
+            write(['{"_v":"2.0"}\n'])
+            for text in texts:
+                write([text, '\n'])
+        else:
+            write(['{"_v":"2.0","nodes":['])
+            separator = ''
+            for text in texts:
+                write([separator, text])
+                separator = ','
+            write([']}\n'])
+
+
+def _json_dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _node_json(node):
+    interfaces = []
+    for port in node.ports:
+        other = port.link.adjacent_port(port)
+        interfaces.append({'index': port.index, 'toNode': other.node.name, 'toPort': other.index,
+                           'config': _config_json(port.options)})
+    return {'id': node.id, 'name': node.name, 'templateId': node.template_id, 'category': str(node.category),
+            'emulation': node.emulation, 'os': node.os, 'image': node.image,
+            'config': _config_json(node.options), 'interfaces': interfaces}
+
+
+def _config_json(options):
+    """json form of options, same elements as write_options()"""
+    configs = []
+    if isinstance(options, dict):
+        for k, v in options.items():
+            if isinstance(v, (list, tuple)):
+                for i, item in enumerate(v):
+                    configs.append(_config_entry({'name': k, 'index': i}, item))
+            else:
+                configs.append(_config_entry({'name': k}, v))
+    elif isinstance(options, (tuple, list)):
+        raise Exception("raw list is not support")
+    else:
+        raise Exception("unknown type {}".format(type(options)))
+    return configs
+
+
+def _config_entry(entry, value):
+    if isinstance(value, Option):
+        entry['value'] = str(value.value)
+        entry['type'] = value.subtype
+        entry['unit'] = value.unit
+    else:
+        entry['config'] = _config_json(value)
+    return entry
+
+
+class CadtsTopologyImporter:
+    """load a topology exported by CadtsTopologyExporter, exporting it again gives the same xml
+
+    the xml is read with iterparse and every node element is dropped once converted, so only the
+    Topology itself is kept in memory. toNode of interfaces is a node name, nodes with the same
+    name are told apart by the interface pointing back. link options are not exported, imported
+    links have none.
+    """
+
+    def load(self, source):
+        """read topology from file name or binary file object source"""
+        topology = Topology()
+        # port -> (peer node name, peer port index)
+        peers = dict()
+        root = None
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if root is None:
+                root = elem
+                if root.tag != 'topo' or root.get('_v') != '2.0' or root.get('delta'):
+                    raise Exception("not a CADTS topology: <{} {}>".format(root.tag, root.attrib))
+            elif event == 'end' and elem.tag == 'node':
+                topology.add_node(self._read_node(elem, peers))
+                root.clear()
+
+        _link_ports(topology, peers)
+        return topology
+
+    def _read_node(self, elem, peers):
+        node = Node(elem.get('id'), elem.get('name'), NodeCategory[elem.get('category')], elem.get('templateId'))
+        node.emulation = elem.get('emulation')
+        node.os = elem.get('os')
+        node.image = elem.get('image')
+        _read_options(node.options, elem)
+
+        for port_elem in elem.iterfind('interface'):
+            port = Port(node, int(port_elem.get('index')))
+            _read_options(port.options, port_elem)
+            node.ports.append(port)
+            node.next_port_index = max(node.next_port_index, port.index + 1)
+            peers[port] = (port_elem.get('toNode'), int(port_elem.get('toPort')))
+        return node
+
+
+def _read_options(options, elem):
+    """fill options from config children of elem, reverse of write_options()"""
+    for config in elem.iterfind('config'):
+        value = config.get('value')
+        if value is not None:
+            subtype = config.get('type')
+            if subtype:
+                item = Option.intern(value, subtype, config.get('unit'))
+            else:
+                # Option would guess a type for an empty one
+                item = Option(value, unit=config.get('unit'))
+                item.subtype = subtype
+        else:
+            item = dict()
+            _read_options(item, config)
+
+        name = config.get('name')
+        if config.get('index') is not None:
+            options.setdefault(name, []).append(item)
+        else:
+            options[name] = item
+
+
+def _link_ports(topology, peers):
+    # (node name, port index) -> ports, names may be shared by several nodes
+    ports_by_name = dict()
+    for port in peers:
+        ports_by_name.setdefault((port.node.name, port.index), []).append(port)
+
+    for port, peer_key in peers.items():
+        if port.link is not None:
+            continue
+
+        peer = None
+        for other in ports_by_name.get(peer_key, ()):
+            if other.link is None and other is not port and peers[other] == (port.node.name, port.index):
+                peer = other
+                break
+        if peer is None:
+            raise Exception("interface {} of node {}: no free interface {} on node {}".format(
+                port.index, port.node.id, peer_key[1], peer_key[0]))
+        port.link_to_port(peer)
+
+
+def count_exported(topology, nodes=None):
+    """count exported nodes and options for instrument, only while it is enabled"""
+    if not instrument.enabled():
+        return
+    nodes = nodes if nodes is not None else topology.nodes.values()
+    node_count = option_count = 0
+    for node in nodes:
+        node_count += 1
+        option_count += _count_options(node.options)
+        for port in node.ports:
+            option_count += _count_options(port.options)
+    instrument.count('nodes', node_count)
+    instrument.count('options', option_count)
+
+
+def _count_options(options):
+    if isinstance(options, Option):
+        return 1
+    elif isinstance(options, dict):
+        return sum(_count_options(v) for v in options.values())
+    elif isinstance(options, (list, tuple)):
+        return sum(_count_options(v) for v in options)
+    return 0
+
+
+def _chunk_writer(fp):
+    if isinstance(fp, io.TextIOBase):
+        return lambda chunks: fp.write(''.join(chunks))
+
+    # other text files (SpooledTemporaryFile(mode='w'), codecs writers) reject bytes on the first write
+    text = []
+
+    def write(chunks):
+        data = ''.join(chunks)
+        if not text:
+            try:
+                fp.write(data.encode('UTF-8'))
+                text.append(False)
+                return
+            except TypeError:
+                text.append(True)
+        fp.write(data if text[0] else data.encode('UTF-8'))
+    return write
+
+
+def _escape(value):
+    # same escaping as minidom
+    return str(value).replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _write_node(chunks, node, extra_attrs=''):
+    chunks.append('\t<node{} id="{}" name="{}" templateId="{}" category="{}" emulation="{}" os="{}" image="{}"'.format(
+        extra_attrs, _escape(node.id), _escape(node.name), _escape(node.template_id), _escape(node.category),
+        _escape(node.emulation), _escape(node.os), _escape(node.image)))
+    if not _has_options(node.options) and not node.ports:
+        chunks.append('/>\n')
+        return
+
+    chunks.append('>\n')
+    write_options(chunks, node.options, '\t\t')
+    for port in node.ports:
+        other = port.link.adjacent_port(port)
+        chunks.append('\t\t<interface name="" index="{}" toNode="{}" toPort="{}"'.format(
+            port.index, _escape(other.node.name), other.index))
+        if _has_options(port.options):
+            chunks.append('>\n')
+            write_options(chunks, port.options, '\t\t\t')
+            chunks.append('\t\t</interface>\n')
+        else:
+            chunks.append('/>\n')
+    chunks.append('\t</node>\n')
+
+
+def _has_options(options):
+    if isinstance(options, dict):
+        return any(not isinstance(v, (list, tuple)) or v for v in options.values())
+    else:
+        return False
+
+
+def write_options(chunks, options, indent):
+    """append pretty printed config elements of options to chunks, streaming version of fill_options()"""
+    if isinstance(options, dict):
+        for k, v in options.items():
+            if isinstance(v, (list, tuple)):
+                for i, item in enumerate(v):
+                    _write_config(chunks, '{}<config name="{}" index="{}"'.format(indent, _escape(k), i), item, indent)
+            else:
+                _write_config(chunks, '{}<config name="{}"'.format(indent, _escape(k)), v, indent)
+    elif isinstance(options, (tuple, list)):
+        raise Exception("raw list is not support")
+    else:
+        raise Exception("unknown type {}".format(type(options)))
+
+
+def _write_config(chunks, head, value, indent):
+    chunks.append(head)
+    if isinstance(value, Option):
+        chunks.append(' value="{}" type="{}" unit="{}"/>\n'.format(
+            _escape(value.value), _escape(value.subtype), _escape(value.unit)))
+    elif _has_options(value):
+        chunks.append('>\n')
+        write_options(chunks, value, indent + '\t')
+        chunks.append('{}</config>\n'.format(indent))
+    elif isinstance(value, dict):
+        chunks.append('/>\n')
+    else:
+        write_options(chunks, value, indent)
 
 
 def fill_options(entity, options):
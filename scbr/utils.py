@@ -1,3 +1,18 @@
+def attributes(obj):
+    """attribute name/value pairs of obj, works for both __dict__ and __slots__ classes"""
+    items = []
+    for cls in reversed(type(obj).__mro__):
+        slots = cls.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name != '__dict__' and hasattr(obj, name):
+                items.append((name, getattr(obj, name)))
+    if hasattr(obj, '__dict__'):
+        items.extend(vars(obj).items())
+    return items
+
+
 def auto_str(filter_attrs=None, auto_repr=True):
     filter_attrs = filter_attrs if filter_attrs else set()
 
@@ -5,7 +20,8 @@ def auto_str(filter_attrs=None, auto_repr=True):
         def __str__(self):
             return '%s(%s)' % (
                 type(self).__name__,
-                ', '.join('%s=%s' % item for item in vars(self).items() if item[0] not in filter_attrs)
+                ', '.join('%s=%s' % item for item in attributes(self)
+                          if item[0] not in filter_attrs and not item[0].startswith('_'))
             )
 
         cls.__str__ = __str__
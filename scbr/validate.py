@@ -0,0 +1,164 @@
+import ipaddress
+import socket
+from enum import Enum
+
+from scbr.utils import auto_str
+
+
+class ProblemType(Enum):
+    IP_OUTSIDE_LAN = 1
+    IP_RESERVED = 2
+    DUPLICATE_IP = 3
+    OVERLAPPING_LAN = 4
+    PEER_SUBNET_MISMATCH = 5
+    LAN_WITHOUT_NET = 6
+
+
+@auto_str()
+class Problem:
+    __slots__ = ('type', 'message', 'subjects')
+
+    def __init__(self, type_, message, subjects):
+        self.type = type_
+        self.message = message
+        self.subjects = subjects
+
+
+class SceneValidationError(Exception):
+    def __init__(self, problems):
+        super().__init__('\n'.join(problem.message for problem in problems))
+        self.problems = problems
+
+
+def _net_range(net):
+    start = int(net.network_address)
+    return net.version, start, start + net.num_addresses - 1
+
+
+def ip_value(ip):
+    """(version, integer) of an ip address, or of its string form which may carry a prefix length"""
+    if isinstance(ip, str):
+        s = ip.split('/', 1)[0]
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, s), 'big')
+        except OSError:
+            ip = ipaddress.ip_address(s)
+    return ip.version, int(ip)
+
+
+def _ip_str(version, value):
+    return str(ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value))
+
+
+def collect_addresses(scene):
+    """all addresses assigned in scene, as [((version, integer), node id, lan or None)]
+
+    a port to port link declared from both ends assigns the addresses of its ports twice, an
+    address of a node linked to the same peer node is collected once.
+    """
+    addresses = []
+    # (ip, node id, peer node id) of port to port addresses
+    seen = set()
+
+    def add_linked(ip, node_id, peer_id):
+        if (ip, node_id, peer_id) not in seen:
+            seen.add((ip, node_id, peer_id))
+            addresses.append((ip, node_id, None))
+
+    for node in scene.node_list:
+        for port in node.ports:
+            if port.in_lan:
+                if port.in_lan.ip:
+                    lan = scene.lans.get(port.in_lan.lan_id, None)
+                    addresses.append((ip_value(port.in_lan.ip), node.id, lan))
+            elif port.to_port:
+                to_port = port.to_port
+                if to_port.self_ip:
+                    add_linked(ip_value(to_port.self_ip.ip), node.id, to_port.peer_node_id)
+                if to_port.peer_ip:
+                    add_linked(ip_value(to_port.peer_ip.ip), to_port.peer_node_id, node.id)
+    return addresses
+
+
+def validate_scene(scene):
+    """check addressing of an adjusted scene, return all problems found
+
+    addresses and networks are compared as integers, duplicates and overlaps are found by
+    sorting, so the whole check is O(n log n).
+    """
+    problems = []
+    lan_ranges = {lan.id: _net_range(lan.net) for lan in scene.lans.values() if lan.net is not None}
+
+    addresses = collect_addresses(scene)
+    _check_in_lan(addresses, lan_ranges, problems)
+    _check_duplicates(addresses, problems)
+    _check_overlapping_lans(lan_ranges, problems)
+    _check_peer_subnets(scene, problems)
+    return problems
+
+
+def check_scene(scene):
+    problems = validate_scene(scene)
+    if problems:
+        raise SceneValidationError(problems)
+
+
+def _check_in_lan(addresses, lan_ranges, problems):
+    lans_without_net = set()
+    for (ip_version, value), node_id, lan in addresses:
+        if lan is None:
+            continue
+        if lan.id not in lan_ranges:
+            if lan.id not in lans_without_net:
+                lans_without_net.add(lan.id)
+                problems.append(Problem(ProblemType.LAN_WITHOUT_NET, 'ip {} of {} is in lan {} without net'.format(
+                    _ip_str(ip_version, value), node_id, lan.id), [node_id, lan.id]))
+            continue
+
+        version, start, end = lan_ranges[lan.id]
+        if ip_version != version or value < start or value > end:
+            problems.append(Problem(ProblemType.IP_OUTSIDE_LAN, 'ip {} of {} is outside lan {} ({})'.format(
+                _ip_str(ip_version, value), node_id, lan.id, lan.net), [node_id, lan.id]))
+        elif end - start > 1 and (value == start or value == end):
+            problems.append(Problem(ProblemType.IP_RESERVED, 'ip {} of {} is {} address of lan {} ({})'.format(
+                _ip_str(ip_version, value), node_id, 'network' if value == start else 'broadcast', lan.id, lan.net),
+                [node_id, lan.id]))
+
+
+def _check_duplicates(addresses, problems):
+    # plain sorted tuples: addresses are up to 128 bit integers and v4/v6 mixed, which fixed width arrays don't hold
+    keys = sorted((ip, i) for i, (ip, _, _) in enumerate(addresses))
+    i = 0
+    while i < len(keys):
+        j = i + 1
+        while j < len(keys) and keys[j][0] == keys[i][0]:
+            j += 1
+        if j - i > 1:
+            owners = [addresses[index][1] for _, index in keys[i:j]]
+            problems.append(Problem(ProblemType.DUPLICATE_IP, 'ip {} is assigned {} times: {}'.format(
+                _ip_str(*keys[i][0]), j - i, ', '.join(owners)), owners))
+        i = j
+
+
+def _check_overlapping_lans(lan_ranges, problems):
+    ranges = sorted((version, start, end, lan_id) for lan_id, (version, start, end) in lan_ranges.items())
+    widest = None
+    for version, start, end, lan_id in ranges:
+        if widest is not None and widest[0] == version and start <= widest[2]:
+            problems.append(Problem(ProblemType.OVERLAPPING_LAN, 'net of lan {} overlaps lan {}'.format(
+                lan_id, widest[3]), [widest[3], lan_id]))
+        if widest is None or widest[0] != version or end > widest[2]:
+            widest = (version, start, end, lan_id)
+
+
+def _check_peer_subnets(scene, problems):
+    for node in scene.node_list:
+        for port in node.ports:
+            to_port = port.to_port
+            if not to_port or not to_port.self_ip or not to_port.peer_ip:
+                continue
+            if to_port.self_ip.net != to_port.peer_ip.net:
+                problems.append(Problem(ProblemType.PEER_SUBNET_MISMATCH, 'link {} -> {}: {} and {} are not in the '
+                                        'same subnet'.format(node.id, to_port.peer_node_id, to_port.self_ip.net,
+                                                             to_port.peer_ip.net),
+                                        [node.id, to_port.peer_node_id]))